@@ -0,0 +1,98 @@
+import statistics
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import cache as cache_utils
+from .constants import NOTA_APROBATORIA, NOTA_MAXIMA
+from .models import VERSION_CALIFICACIONES, Calificacion
+
+# Ancho de cada intervalo del histograma: 0-4, 4-8, ..., 16-20
+ANCHO_INTERVALO = 4
+
+
+def calcular_estadisticas(aula_id=None, curso_id=None, grado_id=None):
+    """Estadísticas de los promedios de un aula, un curso o un grado (o de su combinación).
+
+    Carga los promedios con una sola consulta. Solo cuentan las calificaciones
+    ingresadas, no las que la libreta crea en 0.0 al abrirse. Cada estudiante
+    cuenta una vez: si el filtro incluye varios cursos se usa el promedio de
+    sus cursos. El resultado se guarda en el cache hasta que cambia alguna
+    calificación o estudiante (ver invalidar_calificaciones en models.py), o
+    como máximo ANALITICA_CACHE_TTL segundos.
+
+    Returns:
+        dict: cantidad, media, mediana, desviación estándar, histograma, tasa
+        de aprobación y ranking de estudiantes (empates con el mismo puesto).
+    """
+    clave = (f'analitica:{cache_utils.obtener_version(VERSION_CALIFICACIONES)}:'
+             f'{aula_id}:{curso_id}:{grado_id}')
+    resultado = cache.get(clave)
+    if resultado is None:
+        resultado = _calcular(aula_id, curso_id, grado_id)
+        cache.set(clave, resultado, getattr(settings, 'ANALITICA_CACHE_TTL', 300))
+    return resultado
+
+
+def _calcular(aula_id, curso_id, grado_id):
+    filtros = {'ingresada': True}
+    if aula_id is not None:
+        filtros['estudiante__aula_id'] = aula_id
+    if curso_id is not None:
+        filtros['curso_id'] = curso_id
+    if grado_id is not None:
+        filtros['estudiante__aula__grado_id'] = grado_id
+
+    promedios = defaultdict(list)
+    nombres = {}
+    for estudiante_id, nombre, apellido, promedio in Calificacion.objects.filter(
+            **filtros).values_list('estudiante_id', 'estudiante__nombres',
+                                   'estudiante__apellidos', 'promedio'):
+        promedios[estudiante_id].append(promedio)
+        nombres[estudiante_id] = (nombre, apellido)
+
+    por_estudiante = {estudiante_id: statistics.fmean(valores)
+                      for estudiante_id, valores in promedios.items()}
+    valores = list(por_estudiante.values())
+    if not valores:
+        return {'cantidad': 0, 'media': None, 'mediana': None, 'desviacion': None,
+                'histograma': histograma([]), 'tasa_aprobacion': None, 'ranking': []}
+
+    return {
+        'cantidad': len(valores),
+        'media': round(statistics.fmean(valores), 2),
+        'mediana': round(statistics.median(valores), 2),
+        'desviacion': round(statistics.pstdev(valores), 2),
+        'histograma': histograma(valores),
+        'tasa_aprobacion': round(sum(v >= NOTA_APROBATORIA for v in valores) / len(valores), 4),
+        'ranking': [{
+            'puesto': puesto,
+            'estudiante_id': estudiante_id,
+            'nombres': nombres[estudiante_id][0],
+            'apellidos': nombres[estudiante_id][1],
+            'promedio': round(promedio, 2),
+        } for puesto, estudiante_id, promedio in ranking(por_estudiante)],
+    }
+
+
+def histograma(valores):
+    """Cantidad de valores por intervalo de ANCHO_INTERVALO; el último incluye NOTA_MAXIMA."""
+    cantidades = [0] * (NOTA_MAXIMA // ANCHO_INTERVALO)
+    for valor in valores:
+        cantidades[min(int(valor // ANCHO_INTERVALO), len(cantidades) - 1)] += 1
+    return [{'desde': i * ANCHO_INTERVALO, 'hasta': (i + 1) * ANCHO_INTERVALO, 'cantidad': cantidad}
+            for i, cantidad in enumerate(cantidades)]
+
+
+def ranking(por_estudiante):
+    """Retorna (puesto, estudiante_id, promedio) de mayor a menor promedio.
+
+    Los empates comparten el puesto y el siguiente se salta (1, 2, 2, 4).
+    """
+    ordenados = sorted(por_estudiante.items(), key=lambda item: (-item[1], item[0]))
+    resultado = []
+    for posicion, (estudiante_id, promedio) in enumerate(ordenados, start=1):
+        puesto = resultado[-1][0] if resultado and resultado[-1][2] == promedio else posicion
+        resultado.append((puesto, estudiante_id, promedio))
+    return resultado
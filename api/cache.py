@@ -0,0 +1,85 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+def _clave_version(modelo):
+    nombre = modelo if isinstance(modelo, str) else modelo._meta.label_lower
+    return f'version:{nombre}'
+
+
+def obtener_version(modelo):
+    """Retorna la versión actual de los datos de un modelo (o de un nombre
+    para datos derivados de varios modelos)."""
+    clave = _clave_version(modelo)
+    version = cache.get(clave)
+    if version is None:
+        # Un valor inicial único evita reutilizar respuestas de una versión anterior
+        cache.add(clave, time.time_ns(), None)
+        version = cache.get(clave)
+    return version
+
+
+def invalidar(modelo):
+    """Incrementa la versión de un modelo, invalidando todo lo cacheado con ella."""
+    try:
+        cache.incr(_clave_version(modelo))
+    except ValueError:
+        cache.set(_clave_version(modelo), time.time_ns(), None)
+
+
+class CatalogoCacheMixin:
+    """Cache versionado con ETag para los catálogos que casi nunca cambian.
+
+    Las respuestas de `list` y `retrieve` se guardan junto con su ETag bajo
+    la versión actual del modelo, durante CATALOGO_CACHE_TTL segundos. Si el
+    cliente envía `If-None-Match` con el ETag vigente se responde 304 sin
+    consultar el catálogo (una solicitud con JWT aún consulta su usuario al
+    autenticarse). La versión se incrementa con las señales de
+    guardado/eliminación (ver models_extra.py).
+
+    La clave usa solo la acción, los argumentos de la URL y los parámetros de
+    `parametros_cache`, de modo que parámetros arbitrarios no crean entradas.
+    """
+
+    # Parámetros de consulta que cambian la respuesta
+    parametros_cache = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.respuesta_cacheada(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.respuesta_cacheada(super().retrieve, request, *args, **kwargs)
+
+    def respuesta_cacheada(self, vista, request, *args, **kwargs):
+        modelo = self.queryset.model
+        parametros = [(nombre, request.query_params.get(nombre)) for nombre in self.parametros_cache]
+        clave = (f'catalogo:{modelo._meta.label_lower}:{obtener_version(modelo)}:'
+                 f'{self.action}:{sorted(kwargs.items())}:{parametros}')
+
+        entrada = cache.get(clave)
+        if entrada is None:
+            response = vista(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            contenido = JSONRenderer().render(response.data)
+            entrada = (response.data, f'"{hashlib.sha1(contenido).hexdigest()}"')
+            cache.set(clave, entrada, getattr(settings, 'CATALOGO_CACHE_TTL', 3600))
+
+        data, etag = entrada
+        etags_cliente = self.etags_del_cliente(request)
+        if etag in etags_cliente or '*' in etags_cliente:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
+
+    @staticmethod
+    def etags_del_cliente(request):
+        etags = parse_etags(request.headers.get('If-None-Match', ''))
+        # If-None-Match usa comparación débil: W/"x" equivale a "x"
+        return {etag.removeprefix('W/') for etag in etags}
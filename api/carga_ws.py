@@ -0,0 +1,241 @@
+"""Prueba de carga en proceso de los consumers de WebSocket.
+
+Crea N apoderados repartidos en M aulas (un docente por aula y una
+conversación por apoderado) y los conecta con `WebsocketCommunicator`:
+
+- cada apoderado abre su socket de presencia (ws/chat/online/<aula>/) y el
+  de su conversación (ws/chat/<docente>-<apoderado>/);
+- cada docente abre un solo socket multiplexado (ws/usuario/).
+
+Luego cada apoderado envía mensajes por su chat y se mide cuánto tardan en
+llegar al docente y en confirmarse como guardados. Ver el comando
+`benchmark_websockets`.
+"""
+import asyncio
+import json
+import os
+import resource
+import time
+from collections import defaultdict
+from datetime import date
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.hashers import make_password
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import cache as cache_utils
+from .metricas import percentil
+
+
+def memoria_rss():
+    """Memoria residente actual del proceso en bytes."""
+    try:
+        with open('/proc/self/statm') as archivo:
+            return int(archivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # Sin /proc solo se conoce el máximo (en KB en Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def preparar_datos(usuarios, aulas, prefijo='carga'):
+    """Crea en bloque los datos de la prueba.
+
+    Returns:
+        tuple: (docentes, apoderados), listas de diccionarios con
+        'usuario_id', 'token' y 'aula_id'; los apoderados incluyen además
+        'docente_id' (id de usuario del docente de su aula).
+    """
+    from .models import (VERSION_MIEMBROS_AULA, Apoderado, Aula, AulaCurso, Conversacion,
+                         Docente, Estudiante, Usuario)
+    from .models_extra import Curso
+
+    password = make_password(None)
+    curso = Curso.objects.order_by('id').first()
+
+    usuarios_docentes = Usuario.objects.bulk_create([
+        Usuario(email=f'{prefijo}.docente{i}@colegio.pe', password=password, is_docente=True)
+        for i in range(aulas)])
+    docentes = Docente.objects.bulk_create([
+        Docente(usuario=usuario, nombres='Docente', apellidos=str(i), telefono=str(i),
+                direccion='-', fecha_nacimiento=date(1985, 1, 1), curso=curso)
+        for i, usuario in enumerate(usuarios_docentes)])
+    lista_aulas = Aula.objects.bulk_create([
+        Aula(nombre=f'{prefijo} {i}') for i in range(aulas)])
+    AulaCurso.objects.bulk_create([
+        AulaCurso(aula=aula, docente=docente) for aula, docente in zip(lista_aulas, docentes)])
+
+    usuarios_apoderados = Usuario.objects.bulk_create([
+        Usuario(email=f'{prefijo}.apoderado{i}@colegio.pe', password=password, is_apoderado=True)
+        for i in range(usuarios)])
+    apoderados = Apoderado.objects.bulk_create([
+        Apoderado(usuario=usuario, nombres='Apoderado', apellidos=str(i), telefono=str(i),
+                  direccion='-')
+        for i, usuario in enumerate(usuarios_apoderados)])
+    estudiantes = Estudiante.objects.bulk_create([
+        Estudiante(nombres='Estudiante', apellidos=str(i), fecha_nacimiento=date(2015, 1, 1),
+                   dni=f'9{i:07d}', aula=lista_aulas[i % aulas])
+        for i in range(usuarios)])
+    Apoderado.estudiantes.through.objects.bulk_create([
+        Apoderado.estudiantes.through(apoderado_id=apoderado.id, estudiante_id=estudiante.id)
+        for apoderado, estudiante in zip(apoderados, estudiantes)])
+    Conversacion.objects.bulk_create([
+        Conversacion(participante_1=usuarios_docentes[i % aulas], participante_2=usuario)
+        for i, usuario in enumerate(usuarios_apoderados)])
+    # bulk_create no envía señales: invalidar los miembros de las aulas a mano
+    cache_utils.invalidar(VERSION_MIEMBROS_AULA)
+
+    return (
+        [{'usuario_id': usuario.id, 'token': str(AccessToken.for_user(usuario)),
+          'aula_id': aula.id}
+         for usuario, aula in zip(usuarios_docentes, lista_aulas)],
+        [{'usuario_id': usuario.id, 'token': str(AccessToken.for_user(usuario)),
+          'aula_id': lista_aulas[i % aulas].id,
+          'docente_id': usuarios_docentes[i % aulas].id}
+         for i, usuario in enumerate(usuarios_apoderados)],
+    )
+
+
+class PruebaCarga:
+    """Ejecuta las fases de conexión, mensajes y desconexión y junta las métricas."""
+
+    def __init__(self, docentes, apoderados, mensajes=5, concurrencia=100, espera=30.0):
+        from .routing import websocket_urlpatterns
+
+        self.app = URLRouter(websocket_urlpatterns)
+        self.docentes = docentes
+        self.apoderados = apoderados
+        self.mensajes = mensajes
+        self.concurrencia = concurrencia
+        # Segundos máximos para recibir todos los mensajes esperados
+        self.espera = espera
+
+        self.latencias_conexion = defaultdict(list)
+        self.latencias_entrega = []
+        self.latencias_guardado = []
+        self.sockets = []
+
+    async def ejecutar(self):
+        por_docente = defaultdict(int)
+        for apoderado in self.apoderados:
+            por_docente[apoderado['docente_id']] += 1
+
+        memoria_inicial = memoria_rss()
+        inicio = time.perf_counter()
+        # Una conexión está lista cuando recibe la lista de usuarios en línea de su aula
+        sockets_docentes = await self._conectar_todos(
+            [('usuario', f"/ws/usuario/?token={d['token']}", f"online_aula_{d['aula_id']}")
+             for d in self.docentes])
+        sockets_online = await self._conectar_todos(
+            [('online', f"/ws/chat/online/{a['aula_id']}/?token={a['token']}",
+              f"online_aula_{a['aula_id']}")
+             for a in self.apoderados])
+        sockets_chat = await self._conectar_todos(
+            [('chat', f"/ws/chat/{a['docente_id']}-{a['usuario_id']}/?token={a['token']}", None)
+             for a in self.apoderados])
+        duracion_conexion = time.perf_counter() - inicio
+        memoria_por_conexion = (memoria_rss() - memoria_inicial) / max(1, len(self.sockets))
+
+        # Descartar los avisos de presencia acumulados durante las conexiones
+        for socket in self.sockets:
+            self._vaciar_salida(socket)
+
+        inicio = time.perf_counter()
+        enviados = {}
+        lectores = [asyncio.ensure_future(self._leer_docente(
+            socket, enviados, self.mensajes * por_docente[docente['usuario_id']]))
+            for socket, docente in zip(sockets_docentes, self.docentes)]
+        lectores += [asyncio.ensure_future(self._leer_apoderado(socket, enviados))
+                     for socket in sockets_chat]
+        for k in range(self.mensajes):
+            for socket, apoderado in zip(sockets_chat, self.apoderados):
+                client_id = f"{apoderado['usuario_id']}:{k}"
+                enviados[client_id] = time.perf_counter()
+                await socket.send_to(text_data=json.dumps({
+                    'type': 'chat_message', 'contenido': f'Mensaje {k}', 'client_id': client_id}))
+            # Ceder el loop para que los consumers procesen lo enviado
+            await asyncio.sleep(0)
+        await asyncio.gather(*lectores)
+        duracion_mensajes = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        for lote in range(0, len(self.sockets), self.concurrencia):
+            await asyncio.gather(*(socket.disconnect()
+                                   for socket in self.sockets[lote:lote + self.concurrencia]))
+        duracion_desconexion = time.perf_counter() - inicio
+
+        return {
+            'conexiones': len(self.sockets),
+            'sockets': {'usuario': len(sockets_docentes), 'online': len(sockets_online),
+                        'chat': len(sockets_chat)},
+            'latencias_conexion': dict(self.latencias_conexion),
+            'latencias_entrega': self.latencias_entrega,
+            'latencias_guardado': self.latencias_guardado,
+            'mensajes_esperados': self.mensajes * len(self.apoderados),
+            'memoria_por_conexion': memoria_por_conexion,
+            'duracion_conexion': duracion_conexion,
+            'duracion_mensajes': duracion_mensajes,
+            'duracion_desconexion': duracion_desconexion,
+        }
+
+    async def _conectar_todos(self, conexiones):
+        semaforo = asyncio.Semaphore(self.concurrencia)
+
+        async def conectar(tipo, ruta, frame_listo):
+            async with semaforo:
+                socket = WebsocketCommunicator(self.app, ruta)
+                inicio = time.perf_counter()
+                conectado, _ = await socket.connect()
+                if not conectado:
+                    raise RuntimeError(f'No se pudo conectar a {ruta}')
+                while frame_listo is not None:
+                    if json.loads(await socket.receive_from(self.espera)).get('type') == frame_listo:
+                        break
+                self.latencias_conexion[tipo].append(time.perf_counter() - inicio)
+                return socket
+
+        sockets = await asyncio.gather(*(conectar(*conexion) for conexion in conexiones))
+        self.sockets.extend(sockets)
+        return sockets
+
+    async def _frames(self, socket, fin):
+        """Genera los mensajes recibidos por el socket hasta el instante `fin`."""
+        while True:
+            restante = fin - time.perf_counter()
+            if restante <= 0:
+                return
+            try:
+                # Leer la cola directamente: un timeout en receive_from cancela el consumer
+                salida = await asyncio.wait_for(socket.output_queue.get(), restante)
+            except asyncio.TimeoutError:
+                return
+            if salida.get('type') == 'websocket.send':
+                yield json.loads(salida['text'])
+
+    async def _leer_docente(self, socket, enviados, esperados):
+        recibidos = 0
+        async for frame in self._frames(socket, time.perf_counter() + self.espera):
+            if frame.get('type') == 'chat_message':
+                self.latencias_entrega.append(
+                    time.perf_counter() - enviados[frame['message']['client_id']])
+                recibidos += 1
+                if recibidos >= esperados:
+                    return
+
+    async def _leer_apoderado(self, socket, enviados):
+        provisionales = {}
+        guardados = 0
+        async for frame in self._frames(socket, time.perf_counter() + self.espera):
+            if frame.get('type') == 'chat_message':
+                provisionales[frame['message']['id']] = frame['message']['client_id']
+            elif frame.get('type') == 'chat_persisted':
+                client_id = provisionales.pop(frame['provisional_id'])
+                self.latencias_guardado.append(time.perf_counter() - enviados[client_id])
+                guardados += 1
+                if guardados >= self.mensajes:
+                    return
+
+    @staticmethod
+    def _vaciar_salida(socket):
+        while not socket.output_queue.empty():
+            socket.output_queue.get_nowait()
@@ -0,0 +1,61 @@
+import json
+
+import msgpack
+
+# Subprotocolos que el cliente puede pedir en Sec-WebSocket-Protocol
+SUBPROTOCOLO_MSGPACK = 'colegio.msgpack'
+SUBPROTOCOLO_JSON = 'colegio.json'
+
+
+def codificar_json(data):
+    return json.dumps(data)
+
+
+def decodificar_json(contenido):
+    return json.loads(contenido)
+
+
+def codificar_msgpack(data):
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def decodificar_msgpack(contenido):
+    return msgpack.unpackb(contenido, raw=False)
+
+
+class CodecMixin:
+    """Formato de los mensajes de un consumer: JSON en texto o msgpack binario.
+
+    El cliente elige msgpack pidiendo el subprotocolo `colegio.msgpack` al
+    conectarse; si no lo pide se usa JSON como hasta ahora. Los consumers
+    envían con `enviar_datos` y leen con `decodificar` en lugar de usar
+    json.dumps/json.loads directamente.
+    """
+
+    usa_msgpack = False
+
+    async def accept(self, subprotocol=None, headers=None):
+        if subprotocol is None:
+            pedidos = self.scope.get('subprotocols') or []
+            if SUBPROTOCOLO_MSGPACK in pedidos:
+                subprotocol = SUBPROTOCOLO_MSGPACK
+            elif SUBPROTOCOLO_JSON in pedidos:
+                subprotocol = SUBPROTOCOLO_JSON
+        self.usa_msgpack = subprotocol == SUBPROTOCOLO_MSGPACK
+        await super().accept(subprotocol=subprotocol, headers=headers)
+
+    async def enviar_datos(self, data):
+        if self.usa_msgpack:
+            await self.send(bytes_data=codificar_msgpack(data))
+        else:
+            await self.send(text_data=codificar_json(data))
+
+    def decodificar(self, text_data=None, bytes_data=None):
+        """Retorna el mensaje recibido; lanza ValueError si no es válido."""
+        try:
+            if bytes_data is not None:
+                return decodificar_msgpack(bytes_data)
+            return decodificar_json(text_data)
+        # Los errores de msgpack también son ValueError
+        except (TypeError, ValueError) as error:
+            raise ValueError('Mensaje inválido.') from error
@@ -0,0 +1,64 @@
+import asyncio
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+
+class ColaMensajes:
+    """Agrupa los mensajes recibidos por WebSocket para guardarlos por lotes.
+
+    Cada `guardar` espera a que su mensaje se inserte. Los mensajes que llegan
+    dentro de `intervalo` segundos (o hasta juntar `maximo`) se guardan con
+    una sola transacción y un bulk_create (ver Mensaje.guardar_lote).
+    """
+
+    def __init__(self, intervalo=0.02, maximo=200):
+        self.intervalo = intervalo
+        self.maximo = maximo
+        self._pendientes = []
+        self._tarea = None
+        self._loop = None
+
+    async def guardar(self, emisor_id, receptor_id, contenido, emisor_es_docente):
+        """Encola un mensaje y retorna el Mensaje una vez guardado."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Los futuros pertenecen a un event loop: empezar de nuevo si cambió
+            self._loop, self._pendientes, self._tarea = loop, [], None
+
+        futuro = loop.create_future()
+        self._pendientes.append(((emisor_id, receptor_id, contenido, emisor_es_docente), futuro))
+        if len(self._pendientes) >= self.maximo:
+            asyncio.ensure_future(self.vaciar())
+        elif self._tarea is None:
+            self._tarea = asyncio.ensure_future(self._vaciar_despues())
+        return await futuro
+
+    async def _vaciar_despues(self):
+        await asyncio.sleep(self.intervalo)
+        self._tarea = None
+        await self.vaciar()
+
+    async def vaciar(self):
+        """Guarda de inmediato los mensajes pendientes."""
+        from .models import Mensaje
+
+        lote, self._pendientes = self._pendientes, []
+        if not lote:
+            return
+        try:
+            mensajes = await database_sync_to_async(Mensaje.guardar_lote)(
+                [fila for fila, _ in lote])
+        except Exception as error:
+            for _, futuro in lote:
+                if not futuro.done():
+                    futuro.set_exception(error)
+            return
+        for (_, futuro), mensaje in zip(lote, mensajes):
+            if not futuro.done():
+                futuro.set_result(mensaje)
+
+
+cola_mensajes = ColaMensajes(
+    intervalo=getattr(settings, 'CHAT_ESCRITURA_INTERVALO', 0.02),
+    maximo=getattr(settings, 'CHAT_ESCRITURA_LOTE', 200))
@@ -43,3 +43,8 @@ TAREA_ESTADO_TUPLE = ('Sin calificar', 'En revisión', 'Calificada')
 
 NOMBRE_APLICACION = 'api'
 TOTAL_APODERADOS_POR_ESTUDIANTE = 5
+# Escala vigesimal: se aprueba con 11 o más
+NOTA_APROBATORIA = 11
+NOTA_MAXIMA = 20
+# Estados de asistencia que cuentan como presente en la tasa de asistencia
+ESTADOS_PRESENTE = ('Asistio', 'Tarde')
@@ -1,16 +1,120 @@
-import json
+import asyncio
+import uuid
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.db.models import Q
 from django.utils import timezone
-from django.db import transaction
+from .codec import CodecMixin
+from .cola_mensajes import cola_mensajes
 from .helper_functions import BHelperFunctions as helper
-from .models import Apoderado, Docente, AulaCurso, Estudiante, AulaCurso, Usuario
+from .historial_chat import historial_chat, par_de_usuarios
+from .models import Apoderado, Aula, Conversacion, Docente, AulaCurso, Estudiante, AulaCurso, Usuario
+from .presencia import difusor, presencia
+from .sesiones_ws import parametro_desde_scope, token_desde_scope
 
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
+class EnvioChatMixin:
+    """Envío de mensajes de chat por WebSocket con guardado diferido.
+
+    El mensaje se valida y se publica de inmediato al grupo con un id
+    provisional; luego se guarda por lotes con `cola_mensajes` y se publica
+    'chat_persisted' con el id definitivo, que sirve de confirmación al emisor.
+    """
+
     TYPE_CHAT_MESSAGE = "chat_message"
     TYPE_RECENT_MESSAGE = "recent_message"
+    TYPE_CHAT_PERSISTED = "chat_persisted"
+    TIPOS_CHAT = (TYPE_CHAT_MESSAGE, TYPE_RECENT_MESSAGE)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Tareas que esperan el guardado de cada mensaje
+        self.confirmaciones = set()
+        # receptor_id -> si se le puede escribir
+        self.receptores_validos = {}
+
+    async def enviar_mensaje_chat(self, grupo, receptor_id, data):
+        """Valida y publica un mensaje nuevo ({"type": "chat_message", "contenido": ...}).
+
+        Returns:
+            str: El detalle del error de validación, o None si se publicó.
+        """
+        contenido = data.get('contenido')
+        if not isinstance(contenido, str) or not contenido.strip():
+            return 'El contenido es obligatorio.'
+        if not await self.receptor_valido(receptor_id):
+            return 'El receptor no es válido.'
+
+        provisional_id = f'tmp-{uuid.uuid4().hex}'
+        await self.channel_layer.group_send(grupo, {
+            'type': self.TYPE_CHAT_MESSAGE,
+            'grupo': grupo,
+            'message': {
+                'id': provisional_id,
+                'provisional': True,
+                'client_id': data.get('client_id'),
+                'emisor': self.user.id,
+                'receptor': receptor_id,
+                'contenido': contenido,
+                'fecha_creacion': timezone.now().isoformat(),
+            },
+        })
+
+        # Guardar sin bloquear la recepción de los siguientes mensajes del socket
+        tarea = asyncio.ensure_future(self.confirmar_mensaje(grupo, receptor_id, contenido, provisional_id))
+        self.confirmaciones.add(tarea)
+        tarea.add_done_callback(self.confirmaciones.discard)
+        return None
+
+    async def confirmar_mensaje(self, grupo, receptor_id, contenido, provisional_id):
+        try:
+            mensaje = await cola_mensajes.guardar(
+                self.user.id, receptor_id, contenido, self.user.is_docente)
+        except Exception:
+            await self.enviar_datos({
+                'type': 'error',
+                'provisional_id': provisional_id,
+                'detail': 'No se pudo guardar el mensaje.',
+            })
+            return
+        await self.channel_layer.group_send(grupo, {
+            'type': self.TYPE_CHAT_PERSISTED,
+            'grupo': grupo,
+            'provisional_id': provisional_id,
+            'id': mensaje.id,
+            'conversacion': mensaje.conversacion_id,
+            'fecha_creacion': mensaje.fecha_creacion.isoformat(),
+        })
+
+    async def repetir_historial(self, par, ultimo_id, grupo=None):
+        """Envía los mensajes posteriores a `ultimo_id`, en general sin consultar la base de datos."""
+        try:
+            ultimo_id = int(ultimo_id)
+        except (TypeError, ValueError):
+            return
+        mensajes, completo = await database_sync_to_async(historial_chat.mensajes_despues)(par, ultimo_id)
+        data = {'type': 'history', 'messages': mensajes, 'completo': completo}
+        if grupo is not None:
+            data['canal'] = grupo
+        await self.enviar_datos(data)
+
+    async def receptor_valido(self, receptor_id):
+        """El chat es entre un docente y un apoderado; se consulta una vez por receptor."""
+        if receptor_id not in self.receptores_validos:
+            self.receptores_validos[receptor_id] = await self.rol_complementario(receptor_id)
+        return self.receptores_validos[receptor_id]
+
+    @database_sync_to_async
+    def rol_complementario(self, receptor_id):
+        if self.user.is_docente:
+            return Usuario.objects.filter(id=receptor_id, is_apoderado=True).exists()
+        if self.user.is_apoderado:
+            return Usuario.objects.filter(id=receptor_id, is_docente=True).exists()
+        return False
+
+
+class ChatConsumer(EnvioChatMixin, CodecMixin, AsyncWebsocketConsumer):
     async def connect(self):
         # Obtener los IDs de los usuarios desde la URL
         # self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
@@ -20,11 +124,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.room_group_name = f'chat_{self.user1_id}_{self.user2_id}'
 
         # Obtener el token de la cabecera o URL
-        token = self.scope['query_string'].decode().split('=')[1]
+        token = token_desde_scope(self.scope)
         user = await helper.authenticate_user(token)
         # print(user)
 
-        if user:
+        if user and user.id not in {int(self.user1_id), int(self.user2_id)}:
+            # Solo los participantes pueden unirse al chat y recibir su historial
+            await self.close(code=4003)
+        elif user:
+            self.user = user
             # Agregar al grupo basado en la conversación
             await self.channel_layer.group_add(
                 self.room_group_name,
@@ -32,6 +140,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
             )
 
             await self.accept()
+
+            # Ponerse al día con los mensajes posteriores al último que vio el cliente
+            ultimo_id = parametro_desde_scope(self.scope, 'last_id')
+            if ultimo_id is not None:
+                await self.repetir_historial(
+                    par_de_usuarios(self.user1_id, self.user2_id), ultimo_id)
         else:
             print("RECHAZADO")
             await self.close(code=4001)
@@ -43,47 +157,74 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        type_data = data.get('type')
-        message_data = data.get('message')            
-
-        if message_data:
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = self.decodificar(text_data, bytes_data)
+        except ValueError as error:
+            return await self.enviar_error(str(error))
+        if not isinstance(data, dict) or data.get('type') not in self.TIPOS_CHAT:
+            return await self.enviar_error('Tipo de mensaje no soportado.')
+        type_data = data['type']
+        message_data = data.get('message')
+
+        if type_data == self.TYPE_CHAT_MESSAGE and 'contenido' in data:
+            # Mensaje nuevo: solo los participantes del chat pueden enviarlo
+            participantes = {int(self.user1_id), int(self.user2_id)}
+            if self.user.id not in participantes or len(participantes) != 2:
+                return await self.enviar_error('No participa en esta conversación.')
+            receptor_id = (participantes - {self.user.id}).pop()
+            error = await self.enviar_mensaje_chat(self.room_group_name, receptor_id, data)
+            if error:
+                await self.enviar_error(error)
+        elif message_data:
             # Transmitir el mensaje a ambos usuarios en la conversación o solo en la lista de chats recientes
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': type_data,
+                    'grupo': self.room_group_name,
                     'message': message_data
                 }
             )
 
+    async def enviar_error(self, detalle):
+        await self.enviar_datos({'type': 'error', 'detail': detalle})
+
     async def chat_message(self, event):
         message = event['message']
 
         # Enviar el mensaje al WebSocket
-        await self.send(text_data=json.dumps(
+        await self.enviar_datos(
             {
                 'type': self.TYPE_CHAT_MESSAGE,
                 'message': message
             }
-        ))
+        )
     async def recent_message(self, event):
         message = event['message']
 
         # Enviar el mensaje al WebSocket
-        await self.send(text_data=json.dumps(
+        await self.enviar_datos(
             {
                 'type': self.TYPE_RECENT_MESSAGE,
                 'message': message
             }
-        ))
+        )
 
+    async def chat_persisted(self, event):
+        await self.enviar_datos({
+            'type': self.TYPE_CHAT_PERSISTED,
+            'provisional_id': event['provisional_id'],
+            'id': event['id'],
+            'conversacion': event['conversacion'],
+            'fecha_creacion': event['fecha_creacion'],
+        })
 
-class OnlineStatusConsumer(AsyncWebsocketConsumer):
+
+class OnlineStatusConsumer(CodecMixin, AsyncWebsocketConsumer):
     async def connect(self):
         # Obtener el token del query string
-        token = self.scope['query_string'].decode().split('=')[1]
+        token = token_desde_scope(self.scope)
         user = await helper.authenticate_user(token)
 
         if user:
@@ -99,13 +240,11 @@ class OnlineStatusConsumer(AsyncWebsocketConsumer):
             # Aceptar la conexión WebSocket
             await self.accept()
 
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    'type': f'user_connected',
-                    'user_id': self.user.id,
-                }
-            )
+            # Solo se avisa al grupo con el primer socket del usuario en el aula;
+            # el aviso se agrupa con los demás cambios del intervalo
+            if presencia.conectar(self.user.id, self.channel_name, self.group_name):
+                difusor.registrar(self.group_name, self.user.id, True)
+            presencia.programar_guardado()
 
             # Enviar la lista de usuarios en línea según el rol
             await self.send_online_users()
@@ -114,18 +253,18 @@ class OnlineStatusConsumer(AsyncWebsocketConsumer):
             await self.close()
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'user'):
+            return
+
         # Quitar al usuario del grupo cuando se desconecta
         await self.remove_from_online_group()
 
-        await self.channel_layer.group_send(
-            self.group_name,
-            {
-                'type': f'user_disconnected',
-                'user_id': self.user.id,
-            }
-        )
+        # Si era su último socket, avisar a todos los grupos en los que estuvo
+        for grupo in presencia.desconectar(self.user.id, self.channel_name):
+            difusor.registrar(grupo, self.user.id, False)
+        presencia.programar_guardado()
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         pass
 
     async def user_connected(self, event):
@@ -138,43 +277,26 @@ class OnlineStatusConsumer(AsyncWebsocketConsumer):
         user_id = event['user_id']
         await self.send_user_accion(user_id, False)
 
+    async def users_changed(self, event):
+        """Manejador del mensaje 'users_changed' con los cambios agrupados del aula"""
+        await self.enviar_datos({
+            'type': 'users_changed',
+            'connected': event['connected'],
+            'disconnected': event['disconnected'],
+        })
+
     async def send_user_accion(self, user_id, accion):
-        """Envía un mensaje indicando el estado de conexión del usuario y actualiza su estado en la BD"""
-        accion_str = 'connected' if accion else 'disconnected'
-        # Añadir log para verificar que se ejecuta correctamente
+        """Envía un mensaje indicando el estado de conexión del usuario.
 
-        # Actualiza los campos is_online y last_connection en la base de datos
-        await self.update_user_status(user_id, accion)
+        El estado en la base de datos lo guarda el registro de presencia una
+        sola vez por cambio, no cada socket que recibe el evento.
+        """
+        accion_str = 'connected' if accion else 'disconnected'
 
-        await self.send(text_data=json.dumps({
+        await self.enviar_datos({
             'type': f'user_{accion_str}',
             'user_id': user_id,
-        }))
-
-    # @database_sync_to_async
-    # def authenticate_user(self, token):
-    #     from rest_framework_simplejwt.authentication import JWTAuthentication
-    #     """Autentica el usuario a través del token"""
-    #     try:
-    #         validated_token = JWTAuthentication().get_validated_token(token)
-    #         user_id = validated_token['user_id']
-    #         return Usuario.objects.get(id=user_id)
-    #     except Exception:
-    #         return None
-
-    @database_sync_to_async
-    def update_user_status(self, user_id, accion):
-        """Actualiza el estado de conexión y última conexión del usuario en la base de datos"""
-        try:
-            with transaction.atomic():
-                usuario = Usuario.objects.get(pk=user_id)
-                usuario.is_online = accion
-                if accion:  # Si se conecta
-                    usuario.last_connection = timezone.now()
-                usuario.save()
-        except Usuario.DoesNotExist:
-            # Manejar el caso si el usuario no existe
-            print(f"Usuario con ID {user_id} no encontrado")
+        })
 
     async def add_to_online_group(self):
         """Añade al usuario al grupo de usuarios en línea según su rol"""
@@ -195,32 +317,197 @@ class OnlineStatusConsumer(AsyncWebsocketConsumer):
     async def send_online_users(self):
         """Envía la lista de usuarios en línea filtrada según el rol del usuario"""
         # Obtener los usuarios en línea del aula correspondiente
-        online_users = await self.get_online_users()
-
-        filtered_users = [user.usuario.id for user in online_users]
+        filtered_users = await usuarios_en_linea_de_aula(self.user, self.aula_id)
 
         # Enviar la lista de usuarios en línea
-        await self.send(text_data=json.dumps({
+        await self.enviar_datos({
             'type': f'{self.group_name}',
             'users_online': filtered_users
-        }))
+        })
+
+
+async def usuarios_en_linea_de_aula(user, aula_id):
+    """Retorna los ids en línea que el usuario puede ver en el aula: el docente
+    ve a los apoderados y el apoderado a los docentes."""
+    rol = 'docente' if user.is_docente else 'apoderado' if user.is_apoderado else None
 
     @database_sync_to_async
-    def get_online_users(self):
-        """Obtiene los usuarios en línea para el aula especificada"""
-        return self.filter_users_by_aula_and_online_status()
-
-    def filter_users_by_aula_and_online_status(self):
-        """Filtra usuarios por aula y estado de conexión"""
-        # Obtener el ID del aula del group_name
-        aula_id = self.group_name.split("_")[-1]
-
-        # Obtener usuarios en línea que pertenezcan al aula, según el rol
-        users_en_linea = Apoderado.objects.filter(
-            usuario__is_online=True,
-            estudiantes__aula__id=aula_id
-        ).select_related('usuario') if self.user.is_docente else Docente.objects.filter(
-            usuario__is_online=True,
-            aulacurso__aula__id=aula_id
-        ).select_related('usuario') if self.user.is_apoderado else []
-        return list(users_en_linea)
+    def consultar():
+        miembros = Aula.obtener_miembros(int(aula_id))
+        if rol == 'docente':
+            usuarios = miembros['apoderados']
+        elif rol == 'apoderado':
+            usuarios = miembros['docentes']
+        else:
+            usuarios = ()
+        return sorted(presencia.conectados(usuarios))
+
+    return await difusor.usuarios_en_linea(f'online_aula_{aula_id}', rol, consultar)
+
+
+class UsuarioConsumer(EnvioChatMixin, CodecMixin, AsyncWebsocketConsumer):
+    """Un solo WebSocket por usuario para todas sus conversaciones y aulas.
+
+    Al conectarse se suscribe a los grupos chat_* de las conversaciones del
+    usuario y a los online_aula_* de sus aulas. Cada mensaje enviado al
+    cliente lleva en 'canal' el grupo del que proviene; el resto del mensaje
+    es igual al de ChatConsumer y OnlineStatusConsumer. El cliente puede enviar:
+
+        {"action": "subscribe", "canal": "chat_1_2", "last_id": 120}
+        {"action": "unsubscribe", "canal": "online_aula_3"}
+        {"action": "send", "canal": "chat_1_2", "type": "chat_message", "contenido": ...}
+        {"action": "send", "canal": "chat_1_2", "type": "recent_message", "message": ...}
+    """
+
+    async def connect(self):
+        self.user = await helper.authenticate_user(token_desde_scope(self.scope))
+        if not self.user:
+            await self.close(code=4001)
+            return
+
+        self.suscritos = set()
+        self.permitidos = await self.obtener_grupos_permitidos()
+        await self.accept()
+        for grupo in sorted(self.permitidos['inicial']):
+            await self.suscribir(grupo)
+
+    async def disconnect(self, close_code):
+        if not hasattr(self, 'suscritos'):
+            return
+        for grupo in self.suscritos:
+            await self.channel_layer.group_discard(grupo, self.channel_name)
+        for grupo in presencia.desconectar(self.user.id, self.channel_name):
+            difusor.registrar(grupo, self.user.id, False)
+        presencia.programar_guardado()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = self.decodificar(text_data, bytes_data)
+        except ValueError as error:
+            return await self.enviar_error(None, str(error))
+        if not isinstance(data, dict):
+            return await self.enviar_error(None, 'Se esperaba un objeto.')
+
+        accion = data.get('action')
+        grupo = data.get('canal')
+        if accion == 'subscribe':
+            if not await self.puede_suscribirse(grupo):
+                return await self.enviar_error(grupo, 'Canal no permitido.')
+            await self.suscribir(grupo)
+            if grupo.startswith('chat_') and data.get('last_id') is not None:
+                await self.repetir_historial(
+                    par_de_usuarios(*grupo.removeprefix('chat_').split('_')), data['last_id'], grupo)
+        elif accion == 'unsubscribe':
+            if grupo in self.suscritos:
+                self.suscritos.discard(grupo)
+                await self.channel_layer.group_discard(grupo, self.channel_name)
+                if grupo.startswith('online_aula_'):
+                    # Deja de figurar en línea en el aula, igual que al desconectarse
+                    for notificado in presencia.salir(self.user.id, self.channel_name, grupo):
+                        difusor.registrar(notificado, self.user.id, False)
+                    presencia.programar_guardado()
+            await self.enviar(grupo, {'type': 'unsubscribed'})
+        elif accion == 'send':
+            if grupo not in self.suscritos or not grupo.startswith('chat_'):
+                return await self.enviar_error(grupo, 'Canal no permitido.')
+            if data.get('type') not in self.TIPOS_CHAT:
+                return await self.enviar_error(grupo, 'Mensaje inválido.')
+            if data['type'] == self.TYPE_CHAT_MESSAGE and 'contenido' in data:
+                participantes = {int(i) for i in grupo.removeprefix('chat_').split('_')}
+                receptor_id = (participantes - {self.user.id}).pop()
+                error = await self.enviar_mensaje_chat(grupo, receptor_id, data)
+                if error:
+                    await self.enviar_error(grupo, error)
+            elif data.get('message'):
+                await self.channel_layer.group_send(grupo, {
+                    'type': data['type'],
+                    'grupo': grupo,
+                    'message': data['message'],
+                })
+            else:
+                await self.enviar_error(grupo, 'Mensaje inválido.')
+        else:
+            await self.enviar_error(grupo, 'Acción no soportada.')
+
+    async def suscribir(self, grupo):
+        nuevo = grupo not in self.suscritos
+        if nuevo:
+            self.suscritos.add(grupo)
+            await self.channel_layer.group_add(grupo, self.channel_name)
+        await self.enviar(grupo, {'type': 'subscribed'})
+
+        if grupo.startswith('online_aula_'):
+            if nuevo and presencia.conectar(self.user.id, self.channel_name, grupo):
+                difusor.registrar(grupo, self.user.id, True)
+            presencia.programar_guardado()
+            await self.enviar(grupo, {
+                'type': grupo,
+                'users_online': await usuarios_en_linea_de_aula(
+                    self.user, grupo.removeprefix('online_aula_')),
+            })
+
+    async def puede_suscribirse(self, grupo):
+        if not isinstance(grupo, str):
+            return False
+        if grupo not in self.permitidos['todos']:
+            # Puede haber una conversación o un aula nueva desde que se conectó
+            self.permitidos = await self.obtener_grupos_permitidos()
+        return grupo in self.permitidos['todos']
+
+    @database_sync_to_async
+    def obtener_grupos_permitidos(self):
+        """Retorna los grupos a los que se suscribe al conectarse ('inicial') y
+        todos los que puede usar ('todos'), según sus conversaciones y aulas."""
+        usuario_id = self.user.id
+        conversaciones = Conversacion.objects.filter(
+            Q(participante_1_id=usuario_id) | Q(participante_2_id=usuario_id)
+        ).values_list('participante_1_id', 'participante_2_id')
+        if self.user.is_docente:
+            aulas = Aula.objects.filter(aulacurso__docente__usuario_id=usuario_id)
+        elif self.user.is_apoderado:
+            aulas = Aula.objects.filter(estudiante__apoderados__usuario_id=usuario_id)
+        else:
+            aulas = Aula.objects.none()
+
+        inicial = {f'chat_{p1}_{p2}' for p1, p2 in conversaciones}
+        inicial |= {f'online_aula_{aula_id}'
+                    for aula_id in aulas.values_list('id', flat=True).distinct()}
+        # ChatConsumer arma el grupo con el orden de la URL: aceptar ambos
+        todos = inicial | {f'chat_{p2}_{p1}' for p1, p2 in conversaciones}
+        return {'inicial': inicial, 'todos': todos}
+
+    async def enviar(self, grupo, data):
+        await self.enviar_datos({'canal': grupo, **data})
+
+    async def enviar_error(self, grupo, detalle):
+        await self.enviar(grupo, {'type': 'error', 'detail': detalle})
+
+    async def chat_message(self, event):
+        await self.enviar(event.get('grupo'), {
+            'type': self.TYPE_CHAT_MESSAGE, 'message': event['message']})
+
+    async def recent_message(self, event):
+        await self.enviar(event.get('grupo'), {
+            'type': self.TYPE_RECENT_MESSAGE, 'message': event['message']})
+
+    async def chat_persisted(self, event):
+        await self.enviar(event.get('grupo'), {
+            'type': self.TYPE_CHAT_PERSISTED,
+            'provisional_id': event['provisional_id'],
+            'id': event['id'],
+            'conversacion': event['conversacion'],
+            'fecha_creacion': event['fecha_creacion'],
+        })
+
+    async def users_changed(self, event):
+        await self.enviar(event.get('grupo'), {
+            'type': 'users_changed',
+            'connected': event['connected'],
+            'disconnected': event['disconnected'],
+        })
+
+    async def user_connected(self, event):
+        await self.enviar(event.get('grupo'), {'type': 'user_connected', 'user_id': event['user_id']})
+
+    async def user_disconnected(self, event):
+        await self.enviar(event.get('grupo'), {'type': 'user_disconnected', 'user_id': event['user_id']})
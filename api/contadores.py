@@ -0,0 +1,82 @@
+import atexit
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+
+
+class BufferVistas:
+    """Acumula en memoria las vistas de cada noticia y las guarda por lotes.
+
+    Cada incremento solo suma en un contador protegido por un lock; los
+    contadores se escriben periódicamente con `F('vistas') + n`, que es
+    atómico en la base de datos, de modo que no se pierden incrementos
+    aunque varias solicitudes lleguen al mismo tiempo.
+    """
+
+    def __init__(self, intervalo=None):
+        # Segundos entre cada guardado; None desactiva el guardado automático
+        self.intervalo = intervalo
+        self._pendientes = Counter()
+        self._lock = threading.Lock()
+        self._temporizador = None
+
+    def incrementar(self, noticia_id, cantidad=1):
+        with self._lock:
+            self._pendientes[noticia_id] += cantidad
+            self._programar_guardado()
+
+    def pendientes(self, noticia_id):
+        """Retorna las vistas de una noticia que aún no se guardaron."""
+        with self._lock:
+            return self._pendientes.get(noticia_id, 0)
+
+    def guardar(self):
+        """Escribe los incrementos acumulados, una UPDATE por cada cantidad distinta."""
+        from .models import Noticia
+
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, Counter()
+
+        por_cantidad = defaultdict(list)
+        for noticia_id, cantidad in pendientes.items():
+            por_cantidad[cantidad].append(noticia_id)
+
+        try:
+            while por_cantidad:
+                cantidad, noticias_ids = next(iter(por_cantidad.items()))
+                Noticia.objects.filter(id__in=noticias_ids).update(
+                    vistas=F('vistas') + cantidad)
+                del por_cantidad[cantidad]
+        except Exception:
+            # Devolver al buffer todo lo que no se llegó a guardar para reintentarlo
+            with self._lock:
+                for cantidad, noticias_ids in por_cantidad.items():
+                    for noticia_id in noticias_ids:
+                        self._pendientes[noticia_id] += cantidad
+            raise
+
+    def _programar_guardado(self):
+        if self.intervalo and self._temporizador is None:
+            self._temporizador = threading.Timer(
+                self.intervalo, self._guardado_programado)
+            self._temporizador.daemon = True
+            self._temporizador.start()
+
+    def _guardado_programado(self):
+        with self._lock:
+            self._temporizador = None
+        try:
+            self.guardar()
+        finally:
+            # El hilo del temporizador no vuelve a usar su conexión
+            connection.close()
+
+
+buffer_vistas = BufferVistas(
+    intervalo=getattr(settings, 'NOTICIA_VISTAS_INTERVALO', 10))
+
+# Guardar las vistas pendientes al detener el proceso
+atexit.register(buffer_vistas.guardar)
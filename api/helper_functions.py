@@ -3,6 +3,7 @@ import string
 
 from channels.db import database_sync_to_async
 from .models import Usuario
+from .sesiones_ws import UsuarioWS, usuarios_ws
 
 
 class BHelperFunctions:
@@ -24,19 +25,42 @@ class BHelperFunctions:
         
         return password
     
+    @staticmethod
+    async def authenticate_user(token):
+        """Autentica el usuario a través del token.
+
+        Returns:
+            UsuarioWS: Los datos del usuario, o None si el token no es válido o
+            el usuario no existe o está inactivo. Las reconexiones con el mismo
+            token se responden desde `usuarios_ws` sin consultar la base de datos.
+        """
+        if not token:
+            return None
+        usuario = usuarios_ws.obtener(token)
+        if usuario is None:
+            usuario = await BHelperFunctions._autenticar_token(token)
+        return usuario
+
+    @staticmethod
     @database_sync_to_async
-    def authenticate_user(self, token):
+    def _autenticar_token(token):
         from rest_framework_simplejwt.authentication import JWTAuthentication
         from rest_framework_simplejwt.exceptions import InvalidToken
-        """Autentica el usuario a través del token"""
         try:
             validated_token = JWTAuthentication().get_validated_token(token)
             user_id = validated_token['user_id']
-            return Usuario.objects.get(id=user_id)
+            usuario = Usuario.objects.get(id=user_id)
         except InvalidToken:
             return None  # Token no es válido
         except Usuario.DoesNotExist:
             return None  # Usuario no existe
         except Exception as e:
             # Manejar cualquier otro error inesperado
-            return None
\ No newline at end of file
+            return None
+        if not usuario.is_active:
+            return None
+
+        usuario_ws = UsuarioWS(usuario.id, usuario.is_docente, usuario.is_apoderado,
+                               usuario.is_staff, usuario.is_active)
+        usuarios_ws.guardar(token, usuario_ws, validated_token['exp'])
+        return usuario_ws
@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, prefetch_related_objects
+
+# Mensajes que se envían como máximo al reconectar cuando hay que ir a la base de datos
+LIMITE_REPETICION = 200
+
+
+def par_de_usuarios(usuario_1_id, usuario_2_id):
+    """Identifica una conversación por sus dos participantes, sin importar el orden."""
+    return tuple(sorted((int(usuario_1_id), int(usuario_2_id))))
+
+
+def _clave_version(par):
+    return f'historial_chat:{par[0]}_{par[1]}'
+
+
+class _Conversacion:
+    def __init__(self, version, mensajes, completo, capacidad):
+        self.version = version
+        self.mensajes = deque(mensajes, maxlen=capacidad)
+        # True si la conversación no tiene mensajes anteriores a los guardados
+        self.completo = completo
+
+
+class HistorialChat:
+    """Últimos mensajes de cada conversación, para repetirlos al reconectar.
+
+    Guarda hasta `capacidad` mensajes serializados por conversación y hasta
+    `max_conversaciones` conversaciones (se descarta la usada hace más tiempo).
+    Cada conversación tiene una versión en el cache compartido que aumenta con
+    cada mensaje guardado o eliminado en cualquier proceso: si no coincide con
+    la de la copia en memoria, esta se vuelve a cargar de la base de datos.
+    """
+
+    def __init__(self, capacidad=50, max_conversaciones=1000):
+        self.capacidad = capacidad
+        self.max_conversaciones = max_conversaciones
+        self._conversaciones = OrderedDict()
+        self._lock = threading.Lock()
+
+    def registrar(self, mensajes):
+        """Agrega mensajes recién guardados (llamar después del commit)."""
+        from .serializer import MensajeSerializer
+
+        mensajes = [mensaje for mensaje in mensajes if mensaje.conversacion_id]
+        if not mensajes:
+            return
+        sin_imagenes = [mensaje for mensaje in mensajes
+                        if 'imagenes' not in getattr(mensaje, '_prefetched_objects_cache', {})]
+        prefetch_related_objects(sin_imagenes, 'imagenes')
+
+        por_par = {}
+        for mensaje in mensajes:
+            por_par.setdefault(par_de_usuarios(mensaje.emisor_id, mensaje.receptor_id), []).append(mensaje)
+        for par, nuevos in por_par.items():
+            version = self._incrementar_version(par, len(nuevos))
+            with self._lock:
+                conversacion = self._conversaciones.get(par)
+                if conversacion is None:
+                    continue
+                if conversacion.version != version - len(nuevos):
+                    # Otro proceso guardó mensajes entre medio: recargar al usarla
+                    del self._conversaciones[par]
+                    continue
+                if len(conversacion.mensajes) + len(nuevos) > self.capacidad:
+                    conversacion.completo = False
+                conversacion.mensajes.extend(MensajeSerializer(nuevos, many=True).data)
+                conversacion.version = version
+
+    def invalidar(self, par):
+        """Marca la conversación como modificada, por ejemplo al eliminar un mensaje."""
+        self._incrementar_version(par, 1)
+        with self._lock:
+            self._conversaciones.pop(par, None)
+
+    def mensajes_despues(self, par, ultimo_id):
+        """Retorna los mensajes de la conversación con id mayor a `ultimo_id`.
+
+        Returns:
+            tuple: (mensajes serializados en orden, completo). `completo` es
+            False si hay más mensajes de los que se pueden repetir y el cliente
+            debe pedir el resto al endpoint de mensajes.
+        """
+        conversacion = self._obtener(par)
+        mensajes = list(conversacion.mensajes)
+        if conversacion.completo or (mensajes and mensajes[0]['id'] <= ultimo_id):
+            return [mensaje for mensaje in mensajes if mensaje['id'] > ultimo_id], True
+
+        # El cliente está más atrás de lo que se guarda en memoria
+        from .models import Mensaje
+        from .serializer import MensajeSerializer
+
+        faltantes = list(Mensaje.objects.filter(
+            conversacion__in=self._conversacion(par), id__gt=ultimo_id
+        ).order_by('id').prefetch_related('imagenes')[:LIMITE_REPETICION + 1])
+        return (MensajeSerializer(faltantes[:LIMITE_REPETICION], many=True).data,
+                len(faltantes) <= LIMITE_REPETICION)
+
+    def _obtener(self, par):
+        version = self._version(par)
+        with self._lock:
+            conversacion = self._conversaciones.get(par)
+            if conversacion is not None and conversacion.version == version:
+                self._conversaciones.move_to_end(par)
+                return conversacion
+
+        conversacion = self._cargar(par, version)
+        with self._lock:
+            self._conversaciones[par] = conversacion
+            self._conversaciones.move_to_end(par)
+            while len(self._conversaciones) > self.max_conversaciones:
+                self._conversaciones.popitem(last=False)
+        return conversacion
+
+    def _cargar(self, par, version):
+        from .models import Mensaje
+        from .serializer import MensajeSerializer
+
+        recientes = list(Mensaje.objects.filter(
+            conversacion__in=self._conversacion(par)
+        ).order_by('-id').prefetch_related('imagenes')[:self.capacidad + 1])
+        completo = len(recientes) <= self.capacidad
+        mensajes = MensajeSerializer(reversed(recientes[:self.capacidad]), many=True).data
+        return _Conversacion(version, mensajes, completo, self.capacidad)
+
+    @staticmethod
+    def _conversacion(par):
+        from .models import Conversacion
+
+        return Conversacion.objects.filter(
+            Q(participante_1_id=par[0], participante_2_id=par[1]) |
+            Q(participante_1_id=par[1], participante_2_id=par[0])).values('id')
+
+    @staticmethod
+    def _version(par):
+        clave = _clave_version(par)
+        # Un valor inicial único evita confundir una versión anterior a una eliminación del cache
+        cache.add(clave, time.time_ns(), None)
+        return cache.get(clave)
+
+    @staticmethod
+    def _incrementar_version(par, cantidad):
+        clave = _clave_version(par)
+        cache.add(clave, time.time_ns(), None)
+        try:
+            return cache.incr(clave, cantidad)
+        except ValueError:
+            # La clave se borró del cache entre ambas llamadas
+            version = time.time_ns()
+            cache.set(clave, version, None)
+            return version
+
+
+historial_chat = HistorialChat(
+    capacidad=getattr(settings, 'CHAT_HISTORIAL_MENSAJES', 50),
+    max_conversaciones=getattr(settings, 'CHAT_HISTORIAL_CONVERSACIONES', 1000))
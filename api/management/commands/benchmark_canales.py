@@ -0,0 +1,209 @@
+import asyncio
+import multiprocessing
+import queue
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.metricas import percentil
+from api.resp_server import iniciar_en_hilo
+
+TIPOS_GRUPO = ('chat', 'online_aula')
+# Segundos que se dan a los workers para arrancar, además de --espera-maxima
+ARRANQUE_MAXIMO = 60
+
+
+def nombres_de_grupos(opciones):
+    """Retorna los grupos chat_* y online_aula_* usados en el benchmark."""
+    chats = [f'chat_{i}_{i + 1}' for i in range(opciones['grupos_chat'])]
+    aulas = [f'online_aula_{i}' for i in range(opciones['aulas'])]
+    return chats, aulas
+
+
+def _tipo_de_grupo(grupo):
+    return 'chat' if grupo.startswith('chat_') else 'online_aula'
+
+
+def _ejecutar_worker(indice, url, opciones, barrera, resultados):
+    asyncio.run(_worker(indice, url, opciones, barrera, resultados))
+
+
+async def _worker(indice, url, opciones, barrera, resultados):
+    # Importado aquí para que el proceso hijo no dependa de la configuración de Django
+    from channels_redis.pubsub import RedisPubSubChannelLayer
+
+    loop = asyncio.get_running_loop()
+    layer = RedisPubSubChannelLayer(hosts=[url])
+    chats, aulas = nombres_de_grupos(opciones)
+    grupos = chats + aulas
+
+    # Cada conexión simulada entra a un chat y a un aula
+    canales = []
+    for c in range(opciones['conexiones']):
+        n = indice * opciones['conexiones'] + c
+        canal = await layer.new_channel()
+        await layer.group_add(chats[n % len(chats)], canal)
+        await layer.group_add(aulas[n % len(aulas)], canal)
+        canales.append(canal)
+    # Dar tiempo a que el servidor procese las suscripciones
+    await asyncio.sleep(0.2)
+    await loop.run_in_executor(None, barrera.wait)
+
+    latencias = defaultdict(list)
+    ultima_recepcion = defaultdict(float)
+
+    async def recibir(canal):
+        while True:
+            mensaje = await layer.receive(canal)
+            ahora = time.time()
+            tipo = _tipo_de_grupo(mensaje['grupo'])
+            latencias[tipo].append(ahora - mensaje['enviado'])
+            ultima_recepcion[tipo] = ahora
+
+    tareas = [asyncio.create_task(recibir(canal)) for canal in canales]
+
+    inicio = time.time()
+    relleno = 'x' * opciones['tamano']
+    for k in range(opciones['mensajes']):
+        grupo = grupos[(indice * opciones['mensajes'] + k) % len(grupos)]
+        await layer.group_send(grupo, {
+            'type': 'chat_message' if grupo.startswith('chat_') else 'user_connected',
+            'grupo': grupo,
+            'enviado': time.time(),
+            'message': relleno,
+        })
+    await loop.run_in_executor(None, barrera.wait)
+
+    # Esperar hasta que no lleguen más mensajes
+    limite = time.time() + opciones['espera_maxima']
+    while time.time() < limite:
+        ultima = max(ultima_recepcion.values(), default=inicio)
+        if time.time() - ultima > opciones['espera']:
+            break
+        await asyncio.sleep(0.05)
+
+    for tarea in tareas:
+        tarea.cancel()
+    await asyncio.gather(*tareas, return_exceptions=True)
+    await layer.flush()
+
+    resultados.put({
+        'inicio': inicio,
+        'latencias': dict(latencias),
+        'ultima_recepcion': dict(ultima_recepcion),
+    })
+
+
+def entregas_esperadas(opciones):
+    """Calcula cuántas entregas debe recibir cada tipo de grupo."""
+    chats, aulas = nombres_de_grupos(opciones)
+    grupos = chats + aulas
+    miembros = defaultdict(int)
+    for n in range(opciones['workers'] * opciones['conexiones']):
+        miembros[chats[n % len(chats)]] += 1
+        miembros[aulas[n % len(aulas)]] += 1
+
+    esperadas = defaultdict(int)
+    for n in range(opciones['workers'] * opciones['mensajes']):
+        grupo = grupos[n % len(grupos)]
+        esperadas[_tipo_de_grupo(grupo)] += miembros[grupo]
+    return esperadas
+
+
+class Command(BaseCommand):
+    help = ('Mide la latencia y el throughput de entrega de los grupos chat_* y '
+            'online_aula_* con varios procesos usando la capa de canales Redis pub/sub.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Procesos que simulan workers de daphne.')
+        parser.add_argument('--conexiones', type=int, default=50,
+                            help='Conexiones simuladas por worker.')
+        parser.add_argument('--grupos-chat', type=int, default=50)
+        parser.add_argument('--aulas', type=int, default=10)
+        parser.add_argument('--mensajes', type=int, default=200,
+                            help='Mensajes enviados por cada worker.')
+        parser.add_argument('--tamano', type=int, default=200,
+                            help='Tamaño en bytes del contenido de cada mensaje.')
+        parser.add_argument('--redis-url', default=None,
+                            help='Usar un Redis existente en lugar del servidor local.')
+        parser.add_argument('--espera', type=float, default=1.0,
+                            help='Segundos sin recibir mensajes para terminar.')
+        parser.add_argument('--espera-maxima', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        opciones = {llave: options[llave] for llave in (
+            'workers', 'conexiones', 'grupos_chat', 'aulas', 'mensajes',
+            'tamano', 'espera', 'espera_maxima')}
+
+        detener = None
+        url = options['redis_url']
+        if url is None:
+            url, detener = iniciar_en_hilo()
+            self.stdout.write(f'Servidor RESP local en {url}')
+
+        contexto = multiprocessing.get_context('spawn')
+        barrera = contexto.Barrier(opciones['workers'])
+        resultados = contexto.Queue()
+        procesos = [contexto.Process(target=_ejecutar_worker,
+                                     args=(i, url, opciones, barrera, resultados))
+                    for i in range(opciones['workers'])]
+        try:
+            for proceso in procesos:
+                proceso.start()
+            reportes = self.esperar_reportes(procesos, resultados,
+                                             opciones['espera_maxima'] + ARRANQUE_MAXIMO)
+            for proceso in procesos:
+                proceso.join()
+        finally:
+            # Si un worker falló los demás quedan bloqueados en la barrera
+            for proceso in procesos:
+                if proceso.is_alive():
+                    proceso.terminate()
+            if detener is not None:
+                detener()
+
+        self.mostrar_reporte(opciones, reportes)
+
+    @staticmethod
+    def esperar_reportes(procesos, resultados, tiempo_maximo):
+        """Recibe el reporte de cada worker; falla si alguno termina con error o
+        si no terminan dentro de `tiempo_maximo` segundos."""
+        limite = time.time() + tiempo_maximo
+        reportes = []
+        while len(reportes) < len(procesos):
+            try:
+                reportes.append(resultados.get(timeout=1))
+            except queue.Empty:
+                fallidos = [proceso for proceso in procesos if proceso.exitcode not in (None, 0)]
+                if fallidos:
+                    raise CommandError(
+                        f'{len(fallidos)} workers terminaron con error '
+                        f'(código {fallidos[0].exitcode}).')
+                if time.time() > limite:
+                    raise CommandError(f'Los workers no terminaron en {tiempo_maximo:.0f} s.')
+        return reportes
+
+    def mostrar_reporte(self, opciones, reportes):
+        esperadas = entregas_esperadas(opciones)
+        inicio = min(reporte['inicio'] for reporte in reportes)
+        total_mensajes = opciones['workers'] * opciones['mensajes']
+
+        self.stdout.write(
+            f"{opciones['workers']} workers x {opciones['conexiones']} conexiones, "
+            f"{total_mensajes} mensajes publicados")
+        self.stdout.write(
+            f"{'grupo':<12}{'entregas':>18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'entregas/s':>14}")
+        for tipo in TIPOS_GRUPO:
+            latencias = [latencia for reporte in reportes
+                         for latencia in reporte['latencias'].get(tipo, [])]
+            fin = max((reporte['ultima_recepcion'].get(tipo, inicio) for reporte in reportes),
+                      default=inicio)
+            duracion = max(fin - inicio, 1e-9)
+            self.stdout.write(
+                f"{tipo:<12}{f'{len(latencias)}/{esperadas[tipo]}':>18}"
+                f"{percentil(latencias, 50) * 1000:>10.2f}"
+                f"{percentil(latencias, 95) * 1000:>10.2f}"
+                f"{percentil(latencias, 99) * 1000:>10.2f}"
+                f"{len(latencias) / duracion:>14.0f}")
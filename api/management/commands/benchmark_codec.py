@@ -0,0 +1,70 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+
+from api.codec import codificar_json, codificar_msgpack, decodificar_json, decodificar_msgpack
+
+CODECS = (
+    ('json', codificar_json, decodificar_json),
+    ('msgpack', codificar_msgpack, decodificar_msgpack),
+)
+
+
+def _mensaje(i, inicio):
+    return {
+        'id': 1000 + i,
+        'conversacion': 12,
+        'emisor': 3,
+        'receptor': 48,
+        'contenido': 'Buenos días, le recuerdo que mañana hay reunión de padres a las 8:00.',
+        'fecha_creacion': (inicio + timedelta(minutes=i)).isoformat(),
+        'imagenes': [],
+    }
+
+
+def cargas_tipicas():
+    """Mensajes representativos de lo que envían los consumers."""
+    inicio = datetime(2024, 10, 1, 8, 0, tzinfo=timezone.utc)
+    return {
+        'online_lista': {'type': 'online_aula_7', 'users_online': list(range(100, 135))},
+        'users_changed': {'type': 'users_changed', 'connected': [101, 102, 107],
+                          'disconnected': [110]},
+        'chat_message': {'type': 'chat_message', 'message': {
+            'id': 'tmp-9f1c2b7e4d8a4f0e9b3c6d5a2e1f0a7b', 'provisional': True,
+            'client_id': 'a1', **_mensaje(0, inicio)}},
+        'chat_persisted': {'type': 'chat_persisted', 'provisional_id': 'tmp-9f1c2b7e4d8a4f0e9b3c6d5a2e1f0a7b',
+                           'id': 1000, 'conversacion': 12, 'fecha_creacion': inicio.isoformat()},
+        'history_50': {'type': 'history', 'completo': True,
+                       'messages': [_mensaje(i, inicio) for i in range(50)]},
+    }
+
+
+def medir(funcion, argumento, repeticiones):
+    """Retorna el tiempo promedio en microsegundos de `funcion(argumento)`."""
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion(argumento)
+    return (time.perf_counter() - inicio) / repeticiones * 1e6
+
+
+class Command(BaseCommand):
+    help = ('Compara tamaño y tiempo de codificación/decodificación de JSON y msgpack '
+            'para los mensajes típicos de los WebSockets de chat y presencia.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        repeticiones = options['repeticiones']
+        self.stdout.write(
+            f"{'mensaje':<16}{'codec':<10}{'bytes':>8}{'codificar µs':>15}{'decodificar µs':>17}")
+        for nombre, carga in cargas_tipicas().items():
+            for codec, codificar, decodificar in CODECS:
+                contenido = codificar(carga)
+                # Ajustar las repeticiones para que los mensajes grandes no tarden demasiado
+                veces = max(1, repeticiones // max(1, len(contenido) // 256))
+                self.stdout.write(
+                    f"{nombre:<16}{codec:<10}{len(contenido):>8}"
+                    f"{medir(codificar, carga, veces):>15.2f}"
+                    f"{medir(decodificar, contenido, veces):>17.2f}")
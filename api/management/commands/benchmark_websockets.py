@@ -0,0 +1,68 @@
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+
+from api.carga_ws import PruebaCarga, preparar_datos
+from api.metricas import percentil
+from api.presencia import presencia
+
+
+class Command(BaseCommand):
+    help = ('Prueba de carga de los WebSockets de chat y presencia: conecta N apoderados '
+            'en M aulas, envía mensajes y reporta latencias y memoria por conexión. '
+            'Usa una base de datos de prueba temporal.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=2000,
+                            help='Cantidad de apoderados conectados.')
+        parser.add_argument('--aulas', type=int, default=20)
+        parser.add_argument('--mensajes', type=int, default=5,
+                            help='Mensajes que envía cada apoderado.')
+        parser.add_argument('--concurrencia', type=int, default=100,
+                            help='Conexiones que se abren o cierran a la vez.')
+        parser.add_argument('--espera', type=float, default=30.0,
+                            help='Segundos máximos para recibir los mensajes.')
+
+    def handle(self, *args, **options):
+        # Nunca tocar los datos reales: crear y destruir una base de datos de prueba
+        configuracion = setup_databases(verbosity=0, interactive=False)
+        try:
+            cache.clear()
+            capa = get_channel_layer()
+            if isinstance(capa, InMemoryChannelLayer):
+                # La capa en memoria descarta sin avisar lo que excede su capacidad por
+                # canal; el canal de cada docente recibe los mensajes de toda su aula
+                capa.capacity = max(capa.capacity, 4 * options['usuarios'] * options['mensajes'])
+            docentes, apoderados = preparar_datos(options['usuarios'], options['aulas'])
+            prueba = PruebaCarga(docentes, apoderados, mensajes=options['mensajes'],
+                                 concurrencia=options['concurrencia'], espera=options['espera'])
+            reporte = async_to_sync(prueba.ejecutar)()
+            presencia.guardar_sync()
+        finally:
+            teardown_databases(configuracion, verbosity=0)
+
+        self.mostrar_reporte(reporte)
+
+    def mostrar_reporte(self, reporte):
+        sockets = reporte['sockets']
+        self.stdout.write(
+            f"{reporte['conexiones']} conexiones ({sockets['usuario']} usuario, "
+            f"{sockets['online']} online, {sockets['chat']} chat), "
+            f"{reporte['memoria_por_conexion'] / 1024:.1f} KB por conexión")
+        self.stdout.write(f"{'medida':<20}{'cantidad':>14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        filas = [(f'conexión {tipo}', latencias, len(latencias))
+                 for tipo, latencias in reporte['latencias_conexion'].items()]
+        filas += [('entrega', reporte['latencias_entrega'], reporte['mensajes_esperados']),
+                  ('guardado', reporte['latencias_guardado'], reporte['mensajes_esperados'])]
+        for nombre, latencias, esperadas in filas:
+            self.stdout.write(
+                f"{nombre:<20}{f'{len(latencias)}/{esperadas}':>14}"
+                f"{percentil(latencias, 50) * 1000:>10.2f}"
+                f"{percentil(latencias, 95) * 1000:>10.2f}"
+                f"{percentil(latencias, 99) * 1000:>10.2f}")
+        self.stdout.write(
+            f"Duración: conexión {reporte['duracion_conexion']:.2f} s, "
+            f"mensajes {reporte['duracion_mensajes']:.2f} s, "
+            f"desconexión {reporte['duracion_desconexion']:.2f} s")
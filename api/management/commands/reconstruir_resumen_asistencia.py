@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.models import ResumenAsistencia
+
+
+class Command(BaseCommand):
+    help = ('Reconstruye desde cero los resúmenes de asistencia por aula y día y por '
+            'estudiante y mes a partir de las asistencias registradas.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Filas por cada INSERT.')
+
+    def handle(self, *args, **options):
+        por_aula, por_estudiante = ResumenAsistencia.reconstruir(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Resúmenes reconstruidos: {por_aula} por aula y día, '
+            f'{por_estudiante} por estudiante y mes.'))
@@ -0,0 +1,13 @@
+"""Utilidades de medición de los benchmarks.
+
+No importa nada de Django: los procesos que crea `benchmark_canales` con
+`spawn` importan este módulo sin configurar las apps.
+"""
+
+
+def percentil(valores, porcentaje):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicion = min(len(ordenados) - 1, int(round(porcentaje / 100 * (len(ordenados) - 1))))
+    return ordenados[posicion]
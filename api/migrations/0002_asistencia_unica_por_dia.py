@@ -0,0 +1,30 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:25
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def eliminar_asistencias_duplicadas(apps, schema_editor):
+    """Conserva la asistencia más antigua de cada (estudiante, fecha) antes de agregar la restricción."""
+    Asistencia = apps.get_model('api', 'Asistencia')
+    duplicados = Asistencia.objects.values('estudiante_id', 'fecha').annotate(
+        primera=Min('id'), total=Count('id')).filter(total__gt=1)
+    for fila in duplicados:
+        Asistencia.objects.filter(
+            estudiante_id=fila['estudiante_id'], fecha=fila['fecha']
+        ).exclude(id=fila['primera']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_asistencias_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='asistencia',
+            constraint=models.UniqueConstraint(fields=('estudiante', 'fecha'), name='unique_estudiante_fecha'),
+        ),
+    ]
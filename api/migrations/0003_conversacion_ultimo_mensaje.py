@@ -0,0 +1,44 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def completar_ultimo_mensaje(apps, schema_editor):
+    """Calcula el mensaje más reciente de las conversaciones existentes."""
+    Conversacion = apps.get_model('api', 'Conversacion')
+    Mensaje = apps.get_model('api', 'Mensaje')
+    for conversacion in Conversacion.objects.all():
+        ultimo = Mensaje.objects.filter(
+            conversacion=conversacion).order_by('-fecha_creacion', '-id').first()
+        conversacion.ultimo_mensaje = ultimo
+        conversacion.ultima_actividad = ultimo.fecha_creacion if ultimo else conversacion.fecha_creacion
+        conversacion.save(update_fields=['ultimo_mensaje', 'ultima_actividad'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_asistencia_unica_por_dia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversacion',
+            name='ultima_actividad',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversacion',
+            name='ultimo_mensaje',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.mensaje'),
+        ),
+        migrations.RunPython(completar_ultimo_mensaje, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='conversacion',
+            index=models.Index(fields=['participante_1', '-ultima_actividad'], name='conversacion_p1_actividad_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversacion',
+            index=models.Index(fields=['participante_2', '-ultima_actividad'], name='conversacion_p2_actividad_idx'),
+        ),
+    ]
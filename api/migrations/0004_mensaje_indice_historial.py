@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_conversacion_ultimo_mensaje'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mensaje',
+            index=models.Index(fields=['conversacion', 'fecha_creacion', 'id'], name='mensaje_conv_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_mensaje_indice_historial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkerPresencia',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('ultimo_latido', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='usuario',
+            name='is_online',
+        ),
+        migrations.CreateModel(
+            name='SesionPresencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sesiones_presencia', to=settings.AUTH_USER_MODEL)),
+                ('worker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sesiones', to='api.workerpresencia')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'worker'), name='sesion_presencia_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+
+def completar_resumenes(apps, schema_editor):
+    """Calcula los resúmenes de las asistencias existentes."""
+    Asistencia = apps.get_model('api', 'Asistencia')
+    ResumenAsistenciaAula = apps.get_model('api', 'ResumenAsistenciaAula')
+    ResumenAsistenciaEstudiante = apps.get_model('api', 'ResumenAsistenciaEstudiante')
+    asistencias = Asistencia.objects.filter(estado__isnull=False)
+    ResumenAsistenciaAula.objects.bulk_create(
+        [ResumenAsistenciaAula(aula_id=aula_id, fecha=fecha, estado_id=estado_id, cantidad=cantidad)
+         for aula_id, fecha, estado_id, cantidad in asistencias.values(
+             'estudiante__aula_id', 'fecha', 'estado_id').annotate(cantidad=Count('id')).values_list(
+                 'estudiante__aula_id', 'fecha', 'estado_id', 'cantidad')],
+        batch_size=1000)
+    ResumenAsistenciaEstudiante.objects.bulk_create(
+        [ResumenAsistenciaEstudiante(estudiante_id=estudiante_id, mes=mes, estado_id=estado_id, cantidad=cantidad)
+         for estudiante_id, mes, estado_id, cantidad in asistencias.annotate(mes=TruncMonth('fecha')).values(
+             'estudiante_id', 'mes', 'estado_id').annotate(cantidad=Count('id')).values_list(
+                 'estudiante_id', 'mes', 'estado_id', 'cantidad')],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_presencia_por_worker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenAsistenciaAula',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField(default=0)),
+                ('fecha', models.DateField()),
+                ('aula', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_asistencia', to='api.aula')),
+                ('estado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.estadoasistencia')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('aula', 'fecha', 'estado'), name='resumen_aula_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenAsistenciaEstudiante',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField(default=0)),
+                ('mes', models.DateField()),
+                ('estado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.estadoasistencia')),
+                ('estudiante', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_asistencia', to='api.estudiante')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('estudiante', 'mes', 'estado'), name='resumen_estudiante_unico')],
+            },
+        ),
+        migrations.RunPython(completar_resumenes, migrations.RunPython.noop),
+    ]
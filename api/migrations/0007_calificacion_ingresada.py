@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:11
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def marcar_ingresadas(apps, schema_editor):
+    """Las calificaciones existentes con alguna nota distinta de 0 fueron ingresadas."""
+    Calificacion = apps.get_model('api', 'Calificacion')
+    Calificacion.objects.filter(
+        Q(calificacion_1__gt=0) | Q(calificacion_2__gt=0)
+        | Q(calificacion_3__gt=0) | Q(calificacion_4__gt=0)).update(ingresada=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_resumen_asistencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calificacion',
+            name='ingresada',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(marcar_ingresadas, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,32 @@
-from django.db import models
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, Exists, F, OuterRef, prefetch_related_objects
+from django.db.models.functions import TruncMonth
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, PermissionsMixin
 from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, Group, Permission
 from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
 
 
+from . import cache as cache_utils
+from .contadores import buffer_vistas
+from .historial_chat import historial_chat, par_de_usuarios
+from .registro import registro
 from .models_extra import (
-    CategoriaNoticia, Curso, Grado, EstadoAsistencia, EstadoTarea, Genero, Seccion)
+    CategoriaNoticia, Curso, Grado, EstadoAsistencia, EstadoTarea, Genero, NivelEducativo, Seccion)
+
+# Versión del cache de miembros por aula (ver Aula.obtener_miembros)
+VERSION_MIEMBROS_AULA = 'miembros_aula'
+# Versión del cache de estadísticas de calificaciones (ver analitica.py)
+VERSION_CALIFICACIONES = 'calificaciones'
 
 
 class CustomUserManager(BaseUserManager):
@@ -38,6 +57,13 @@ class CustomUserManager(BaseUserManager):
         user = self.create_user(email, password, **extra_fields)
         return user
 
+    def con_presencia(self):
+        """Usuarios anotados con `en_linea`, para leer `is_online` en una
+        lista sin hacer una consulta por usuario."""
+        return self.annotate(en_linea=Exists(SesionPresencia.objects.filter(
+            usuario=OuterRef('pk'),
+            worker__ultimo_latido__gte=WorkerPresencia.limite_vigencia())))
+
     def create_apoderado(self, email, password=None, **extra_fields):
         """Crea un usuario con el rol de Apoderado."""
         extra_fields.setdefault('is_apoderado', True)
@@ -51,8 +77,6 @@ class CustomUserManager(BaseUserManager):
 class Usuario(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField('Correo electrónico', unique=True)
     # Nuevos campos solicitados
-    # Indica si el usuario está en línea
-    is_online = models.BooleanField(default=False)
     is_apoderado = models.BooleanField(
         default=False)  # Si el usuario es un apoderado
     is_docente = models.BooleanField(
@@ -98,6 +122,63 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
         self.last_connection = timezone.now()
         self.save()
 
+    @property
+    def is_online(self):
+        """Indica si el usuario tiene algún socket abierto en un worker vigente.
+
+        Hace una consulta, salvo que el usuario venga de
+        `Usuario.objects.con_presencia()`: usar esa para listas y serializers.
+        """
+        if 'en_linea' in self.__dict__:
+            return self.en_linea
+        return self.id in SesionPresencia.usuarios_en_linea([self.id])
+
+
+class WorkerPresencia(models.Model):
+    """Proceso con sockets abiertos. Renueva `ultimo_latido` periódicamente y sus
+    sesiones dejan de contar cuando deja de hacerlo (por ejemplo si se cae)."""
+    id = models.CharField(max_length=32, primary_key=True)
+    ultimo_latido = models.DateTimeField(db_index=True)
+
+    @staticmethod
+    def limite_vigencia():
+        """Fecha a partir de la cual un latido se considera vigente."""
+        segundos = getattr(settings, 'PRESENCIA_VIGENCIA', 45)
+        return timezone.now() - timedelta(seconds=segundos)
+
+    @staticmethod
+    def renovar(worker_id, fecha):
+        """Registra el latido del worker con una sola consulta."""
+        WorkerPresencia.objects.bulk_create(
+            [WorkerPresencia(id=worker_id, ultimo_latido=fecha)],
+            update_conflicts=True, unique_fields=['id'], update_fields=['ultimo_latido'])
+
+    @staticmethod
+    def eliminar_vencidos():
+        """Elimina los workers sin latido vigente junto con sus sesiones."""
+        vencidos = WorkerPresencia.objects.filter(ultimo_latido__lt=WorkerPresencia.limite_vigencia())
+        SesionPresencia.objects.filter(worker__in=vencidos).delete()
+        vencidos.delete()
+
+
+class SesionPresencia(models.Model):
+    """Un usuario con al menos un socket abierto en un worker."""
+    worker = models.ForeignKey(WorkerPresencia, on_delete=models.CASCADE, related_name='sesiones')
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='sesiones_presencia')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'worker'], name='sesion_presencia_unica'),
+        ]
+
+    @staticmethod
+    def usuarios_en_linea(usuarios_ids):
+        """Retorna los ids dados que tienen una sesión en un worker vigente."""
+        return set(SesionPresencia.objects.filter(
+            usuario_id__in=usuarios_ids,
+            worker__ultimo_latido__gte=WorkerPresencia.limite_vigencia(),
+        ).values_list('usuario_id', flat=True))
+
 
 class Apoderado(models.Model):
     usuario = models.OneToOneField(
@@ -134,7 +215,7 @@ class Docente(models.Model):
         Curso, on_delete=models.CASCADE, related_name='docentes')
 
     def __str__(self):
-        return f"{self.nombres} {self.apellidos} - {self.curso}"
+        return f"{self.nombres} {self.apellidos} - {registro.obtener(Curso, self.curso_id)}"
 
 
 class Administrador(models.Model):
@@ -187,6 +268,27 @@ class Aula(models.Model):
     def __str__(self):
         return f"{self.nombre} - {self.grado} - '{self.seccion}'"
 
+    @staticmethod
+    def obtener_miembros(aula_id):
+        """
+        Retorna los ids de usuario de los docentes y apoderados del aula:
+        {'docentes': frozenset, 'apoderados': frozenset}.
+        Se guarda en el cache hasta que cambian estudiantes, apoderados o
+        asignaciones de docentes (ver invalidar_miembros_de_aulas), o como
+        máximo MIEMBROS_AULA_CACHE_TTL segundos.
+        """
+        clave = f'miembros_aula:{cache_utils.obtener_version(VERSION_MIEMBROS_AULA)}:{aula_id}'
+        miembros = cache.get(clave)
+        if miembros is None:
+            miembros = {
+                'docentes': frozenset(Docente.objects.filter(
+                    aulacurso__aula_id=aula_id).values_list('usuario_id', flat=True)),
+                'apoderados': frozenset(Apoderado.objects.filter(
+                    estudiantes__aula_id=aula_id).values_list('usuario_id', flat=True)),
+            }
+            cache.set(clave, miembros, getattr(settings, 'MIEMBROS_AULA_CACHE_TTL', 300))
+        return miembros
+
 
 class AulaCurso(models.Model):
     aula = models.ForeignKey(Aula, on_delete=models.CASCADE)
@@ -200,11 +302,43 @@ class AulaCurso(models.Model):
 
     def clean(self):
         # Verifica que el nivel del curso coincida con el nivel del grado del aula
-        if self.docente.curso.nivel != self.aula.grado.nivel:
-            raise ValidationError(
-                f"El curso {self.docente.curso} no coincide con el nivel educativo del grado '{
-                    self.aula.grado.nivel}' del aula."
-            )
+        error = AulaCurso.validar_niveles([(self.aula_id, self.docente_id)])
+        if error:
+            raise ValidationError(error[(self.aula_id, self.docente_id)])
+
+    @staticmethod
+    def validar_niveles(pares):
+        """
+        Verifica en lote que el curso de cada docente sea del nivel educativo
+        del grado del aula, con una consulta por modelo sin importar la
+        cantidad de pares.
+
+        Args:
+            pares (iterable): Pares (aula_id, docente_id).
+
+        Returns:
+            dict: {(aula_id, docente_id): mensaje de error} de los pares inválidos.
+        """
+        pares = set(pares)
+        grados = dict(Aula.objects.filter(
+            id__in={aula_id for aula_id, _ in pares}).values_list('id', 'grado_id'))
+        cursos = dict(Docente.objects.filter(
+            id__in={docente_id for _, docente_id in pares}).values_list('id', 'curso_id'))
+
+        errores = {}
+        for aula_id, docente_id in pares:
+            if aula_id not in grados:
+                errores[(aula_id, docente_id)] = "Aula no encontrada."
+            elif docente_id not in cursos:
+                errores[(aula_id, docente_id)] = "Docente no encontrado."
+            elif (_nivel_educativo(Curso, cursos[docente_id]) is None
+                  or _nivel_educativo(Curso, cursos[docente_id]) != _nivel_educativo(Grado, grados[aula_id])):
+                curso = registro.obtener(Curso, cursos[docente_id])
+                grado = registro.obtener(Grado, grados[aula_id])
+                nivel = registro.obtener(NivelEducativo, grado.nivel_id) if grado else None
+                errores[(aula_id, docente_id)] = (
+                    f"El curso {curso} no coincide con el nivel educativo del grado '{nivel}' del aula.")
+        return errores
 
     @staticmethod
     def obtener_aulas_por_docente(docente_id):
@@ -230,8 +364,22 @@ class Tarea(models.Model):
     def __str__(self):
         return f"{self.descripcion[:50]}..." if len(self.descripcion) > 50 else self.descripcion
 
+def _nivel_educativo(modelo, pk):
+    """Id del nivel educativo de un Grado o Curso, desde el registro en memoria."""
+    objeto = registro.obtener(modelo, pk)
+    return objeto.nivel_id if objeto is not None else None
+
+
+def _a_entero(valor):
+    """Convierte un id recibido en la solicitud a entero, o None si no es válido."""
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
 def obtener_estado_falta():
-    return EstadoAsistencia.objects.filter(nombre="Falto").first()
+    return registro.id_por_nombre(EstadoAsistencia, "Falto")
 
 class Asistencia(models.Model):
     estudiante = models.ForeignKey(Estudiante, on_delete=models.CASCADE)
@@ -239,9 +387,250 @@ class Asistencia(models.Model):
     estado = models.ForeignKey(
         EstadoAsistencia, on_delete=models.CASCADE, null=True, blank=True, related_name='asistencias', default=obtener_estado_falta)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['estudiante', 'fecha'], name='unique_estudiante_fecha')
+        ]
+
     def __str__(self):
         return f"{self.estudiante} - {self.fecha} - {self.estado}"
 
+    @staticmethod
+    def obtener_hoja_del_dia(aula_id, fecha):
+        """
+        Retorna la hoja de asistencia de un aula como una lista de pares
+        (estudiante, asistencia), creando en bloque las asistencias que falten.
+        Lanza IntegrityError si tras varios intentos aún faltan asistencias.
+        """
+        estudiantes = list(Estudiante.objects.filter(
+            aula_id=aula_id).order_by('id'))
+        asistencias = Asistencia._asistencias_por_estudiante(aula_id, fecha)
+
+        faltantes = [e for e in estudiantes if e.id not in asistencias]
+        for _ in range(3):
+            if not faltantes:
+                break
+            estado_falta_id = obtener_estado_falta()
+            try:
+                # Los resúmenes se actualizan en la misma transacción
+                with transaction.atomic():
+                    creadas = Asistencia.objects.bulk_create(
+                        [Asistencia(estudiante=estudiante, fecha=fecha, estado_id=estado_falta_id)
+                         for estudiante in faltantes])
+                    ResumenAsistencia.acumular(
+                        [(aula_id, asistencia.estudiante_id, fecha, estado_falta_id, 1)
+                         for asistencia in creadas])
+            except IntegrityError:
+                # Otro docente abrió la hoja al mismo tiempo: completar lo que falte
+                pass
+            asistencias = Asistencia._asistencias_por_estudiante(aula_id, fecha)
+            faltantes = [e for e in estudiantes if e.id not in asistencias]
+        if faltantes:
+            raise IntegrityError(
+                "No se pudo completar la hoja de asistencia del día; vuelva a intentarlo.")
+
+        return [(estudiante, asistencias[estudiante.id]) for estudiante in estudiantes]
+
+    @staticmethod
+    def _asistencias_por_estudiante(aula_id, fecha):
+        return {asistencia.estudiante_id: asistencia for asistencia in Asistencia.objects.filter(
+            estudiante__aula_id=aula_id, fecha=fecha)}
+
+    @staticmethod
+    def actualizar_estados(aula_id, filas):
+        """
+        Actualiza en bloque el estado de las asistencias de un aula.
+
+        Dentro de una transacción lee las asistencias bloqueándolas, valida
+        todas las filas y, solo si todas son válidas, aplica los cambios con un
+        único bulk_update. Si alguna falla, las filas válidas se reportan como
+        'no aplicado'.
+
+        Args:
+            aula_id (int): El aula a la que deben pertenecer las asistencias.
+            filas (list): Diccionarios con las llaves 'id' y 'estado'.
+
+        Returns:
+            tuple: (resultados por fila, True si todas las filas fueron válidas).
+        """
+        filas = [(_a_entero(fila.get('id')), _a_entero(fila.get('estado')))
+                 for fila in filas]
+
+        with transaction.atomic():
+            # Leer bloqueando las filas: su estado actual se descuenta de los resúmenes
+            asistencias = Asistencia.objects.select_for_update(of=('self',)).filter(
+                estudiante__aula_id=aula_id).in_bulk(
+                    {asistencia_id for asistencia_id, _ in filas if asistencia_id})
+
+            resultados = []
+            cambios = {}
+            movimientos = []
+            for asistencia_id, estado_id in filas:
+                asistencia = cambios.get(asistencia_id) or asistencias.get(asistencia_id)
+                if asistencia is None:
+                    resultados.append({'id': asistencia_id, 'status': 'error',
+                                       'details': "Asistencia no encontrada."})
+                elif estado_id and registro.obtener(EstadoAsistencia, estado_id) is None:
+                    resultados.append({'id': asistencia_id, 'status': 'error',
+                                       'details': f"No existe el estado con id '{estado_id}'."})
+                elif not estado_id or asistencia.estado_id == estado_id:
+                    resultados.append({'id': asistencia_id, 'estado': asistencia.estado_id,
+                                       'status': 'sin cambios'})
+                else:
+                    movimientos += [
+                        (aula_id, asistencia.estudiante_id, asistencia.fecha, asistencia.estado_id, -1),
+                        (aula_id, asistencia.estudiante_id, asistencia.fecha, estado_id, 1)]
+                    asistencia.estado_id = estado_id
+                    cambios[asistencia_id] = asistencia
+                    resultados.append({'id': asistencia_id, 'estado': estado_id,
+                                       'status': 'actualizado'})
+
+            valido = all(resultado['status'] != 'error' for resultado in resultados)
+            if valido and cambios:
+                Asistencia.objects.bulk_update(cambios.values(), ['estado'])
+                ResumenAsistencia.acumular(movimientos)
+
+        if not valido:
+            # No se guardó ninguna fila: las válidas no deben figurar como actualizadas
+            for resultado in resultados:
+                if resultado['status'] == 'actualizado':
+                    resultado.update(status='no aplicado',
+                                     details="No se guardó porque otras filas tienen errores.")
+        return resultados, valido
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            anterior = None
+            if self.pk is not None:
+                anterior = Asistencia.objects.filter(pk=self.pk).values_list(
+                    'estudiante__aula_id', 'estudiante_id', 'fecha', 'estado_id').first()
+            super().save(*args, **kwargs)
+            aula_id = Estudiante.objects.filter(
+                id=self.estudiante_id).values_list('aula_id', flat=True).first()
+            movimientos = [(aula_id, self.estudiante_id, self.fecha, self.estado_id, 1)]
+            if anterior is not None:
+                movimientos.append((*anterior, -1))
+            ResumenAsistencia.acumular(movimientos)
+
+
+class ResumenAsistencia(models.Model):
+    """Cantidad de asistencias con un estado, para no recorrer Asistencia en los reportes.
+
+    Se mantiene al crear, modificar o eliminar asistencias (ver `acumular`) y al
+    cambiar de aula a un estudiante (ver `mover_asistencias_de_aula`); se puede
+    reconstruir con el comando `reconstruir_resumen_asistencia`. Las
+    asistencias sin estado no se cuentan.
+    """
+    estado = models.ForeignKey(EstadoAsistencia, on_delete=models.CASCADE, related_name='+')
+    cantidad = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @staticmethod
+    def acumular(movimientos):
+        """Suma los movimientos a los resúmenes por aula y por estudiante.
+
+        Args:
+            movimientos (iterable): Tuplas (aula_id, estudiante_id, fecha,
+                estado_id, cambio), con cambio 1 o -1.
+        """
+        por_aula = defaultdict(int)
+        por_estudiante = defaultdict(int)
+        for aula_id, estudiante_id, fecha, estado_id, cambio in movimientos:
+            if estado_id is None:
+                continue
+            if aula_id is not None:
+                por_aula[(aula_id, fecha, estado_id)] += cambio
+            por_estudiante[(estudiante_id, fecha.replace(day=1), estado_id)] += cambio
+        ResumenAsistenciaAula._sumar(por_aula)
+        ResumenAsistenciaEstudiante._sumar(por_estudiante)
+
+    @classmethod
+    def _sumar(cls, cambios):
+        """Suma `cambios` ({(grupo_id, fecha, estado_id): cambio}) con un INSERT
+        de las filas que falten y un UPDATE por cada (fecha, estado, cambio)."""
+        grupo, fecha = cls.CAMPOS
+        cambios = {clave: cambio for clave, cambio in cambios.items() if cambio}
+        if not cambios:
+            return
+        # Crear primero en 0 evita perder sumas si otro proceso crea la misma fila
+        cls.objects.bulk_create(
+            [cls(**{f'{grupo}_id': grupo_id, fecha: dia, 'estado_id': estado_id})
+             for grupo_id, dia, estado_id in cambios],
+            ignore_conflicts=True)
+        por_valor = defaultdict(list)
+        for (grupo_id, dia, estado_id), cambio in cambios.items():
+            por_valor[(dia, estado_id, cambio)].append(grupo_id)
+        for (dia, estado_id, cambio), ids in por_valor.items():
+            cls.objects.filter(**{f'{grupo}_id__in': ids, fecha: dia, 'estado_id': estado_id}).update(
+                cantidad=F('cantidad') + cambio)
+
+    @staticmethod
+    def reconstruir(lote=1000):
+        """Vuelve a calcular todos los resúmenes a partir de Asistencia.
+
+        Returns:
+            tuple: (filas por aula, filas por estudiante) creadas.
+        """
+        asistencias = Asistencia.objects.filter(estado__isnull=False)
+        with transaction.atomic():
+            ResumenAsistenciaAula.objects.all().delete()
+            ResumenAsistenciaEstudiante.objects.all().delete()
+            por_aula = ResumenAsistenciaAula.objects.bulk_create(
+                [ResumenAsistenciaAula(aula_id=aula_id, fecha=fecha, estado_id=estado_id, cantidad=cantidad)
+                 for aula_id, fecha, estado_id, cantidad in asistencias.values(
+                     'estudiante__aula_id', 'fecha', 'estado_id').annotate(
+                         cantidad=Count('id')).values_list(
+                             'estudiante__aula_id', 'fecha', 'estado_id', 'cantidad')],
+                batch_size=lote)
+            por_estudiante = ResumenAsistenciaEstudiante.objects.bulk_create(
+                [ResumenAsistenciaEstudiante(estudiante_id=estudiante_id, mes=mes, estado_id=estado_id,
+                                             cantidad=cantidad)
+                 for estudiante_id, mes, estado_id, cantidad in asistencias.annotate(
+                     mes=TruncMonth('fecha')).values('estudiante_id', 'mes', 'estado_id').annotate(
+                         cantidad=Count('id')).values_list('estudiante_id', 'mes', 'estado_id', 'cantidad')],
+                batch_size=lote)
+        return len(por_aula), len(por_estudiante)
+
+    @classmethod
+    def totales(cls, **filtros):
+        """Retorna {fecha: {estado_id: cantidad}} de los resúmenes filtrados."""
+        fecha = cls.CAMPOS[1]
+        resultado = defaultdict(dict)
+        for dia, estado_id, cantidad in cls.objects.filter(
+                cantidad__gt=0, **filtros).order_by(fecha, 'estado_id').values_list(
+                    fecha, 'estado_id', 'cantidad'):
+            resultado[dia][estado_id] = cantidad
+        return dict(resultado)
+
+
+class ResumenAsistenciaAula(ResumenAsistencia):
+    """Asistencias de un aula en un día por estado."""
+    CAMPOS = ('aula', 'fecha')
+
+    aula = models.ForeignKey(Aula, on_delete=models.CASCADE, related_name='resumenes_asistencia')
+    fecha = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['aula', 'fecha', 'estado'], name='resumen_aula_unico'),
+        ]
+
+
+class ResumenAsistenciaEstudiante(ResumenAsistencia):
+    """Asistencias de un estudiante en un mes (primer día del mes) por estado."""
+    CAMPOS = ('estudiante', 'mes')
+
+    estudiante = models.ForeignKey(Estudiante, on_delete=models.CASCADE, related_name='resumenes_asistencia')
+    mes = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['estudiante', 'mes', 'estado'], name='resumen_estudiante_unico'),
+        ]
+
 
 class Calificacion(models.Model):
     estudiante = models.ForeignKey(Estudiante, on_delete=models.CASCADE)
@@ -251,6 +640,9 @@ class Calificacion(models.Model):
     calificacion_3 = models.FloatField(default=0.0, validators=[MinValueValidator(0), MaxValueValidator(20)])
     calificacion_4 = models.FloatField(default=0.0, validators=[MinValueValidator(0), MaxValueValidator(20)])
     promedio = models.FloatField(editable=False, default=0.0)
+    # False mientras la calificación solo existe porque se abrió la libreta
+    # (notas en 0.0 que nadie ingresó); las estadísticas la excluyen
+    ingresada = models.BooleanField(editable=False, default=False)
 
     class Meta:
         verbose_name_plural = "Calificaciones"
@@ -263,27 +655,198 @@ class Calificacion(models.Model):
         return (self.calificacion_1 + self.calificacion_2 + self.calificacion_3 + self.calificacion_4) / 4
 
     def clean(self):
-        # Obtener el nivel del curso
-        nivel_curso = self.curso.nivel
-        
-        # Obtener el nivel del aula a través del estudiante
-        aula = self.estudiante.aula  # Asumiendo que estudiante tiene un campo aula relacionado
-        nivel_aula = aula.grado.nivel  # Asumiendo que aula tiene un campo nivel relacionado con NivelEducativo
-        
-        # Verificar que ambos niveles coincidan
-        if nivel_curso != nivel_aula:
-            raise ValidationError("El nivel educativo del curso no coincide con el nivel del aula del estudiante.")
-    
+        # Verificar que el nivel del curso coincida con el del aula del estudiante
+        error = Calificacion.validar_niveles([(self.estudiante_id, self.curso_id)])
+        if error:
+            raise ValidationError(next(iter(error.values())))
 
     def save(self, *args, **kwargs):
         # Validar antes de guardar
-        self.clean() 
+        self.clean()
         # Calcular el promedio antes de guardar
         self.promedio = self.calcular_promedio()
+        self.ingresada = True
         super().save(*args, **kwargs)
-        
+
     def __str__(self):
-        return f"{self.estudiante} - Promedio: {self.promedio} ({self.curso.nombre})"
+        return f"{self.estudiante} - Promedio: {self.promedio} ({registro.obtener(Curso, self.curso_id).nombre})"
+
+    CAMPOS_NOTAS = ('calificacion_1', 'calificacion_2', 'calificacion_3', 'calificacion_4')
+
+    @staticmethod
+    def validar_niveles(pares, aula_id=None):
+        """
+        Verifica en lote que cada curso sea del nivel educativo del aula del
+        estudiante, con una sola consulta sin importar la cantidad de pares.
+
+        Args:
+            pares (iterable): Pares (estudiante_id, curso_id); los ids pueden
+                venir como texto y se convierten a entero.
+            aula_id (int, opcional): Si se indica, los estudiantes deben
+                pertenecer a esa aula.
+
+        Returns:
+            dict: {(estudiante_id, curso_id): mensaje de error} de los pares
+            inválidos, con los ids ya convertidos.
+        """
+        pares = {(_a_entero(estudiante_id), _a_entero(curso_id)) for estudiante_id, curso_id in pares}
+        aulas = {estudiante_id: (estudiante_aula_id, grado_id)
+                 for estudiante_id, estudiante_aula_id, grado_id in Estudiante.objects.filter(
+                     id__in={estudiante_id for estudiante_id, _ in pares}
+                 ).values_list('id', 'aula_id', 'aula__grado_id')}
+
+        errores = {}
+        for estudiante_id, curso_id in pares:
+            if estudiante_id not in aulas or (aula_id is not None and aulas[estudiante_id][0] != aula_id):
+                errores[(estudiante_id, curso_id)] = (
+                    "Estudiante no encontrado en el aula." if aula_id is not None
+                    else "Estudiante no encontrado.")
+            elif registro.obtener(Curso, curso_id) is None:
+                errores[(estudiante_id, curso_id)] = "Curso no encontrado."
+            elif _nivel_educativo(Curso, curso_id) != _nivel_educativo(Grado, aulas[estudiante_id][1]):
+                errores[(estudiante_id, curso_id)] = (
+                    "El nivel educativo del curso no coincide con el nivel del aula del estudiante.")
+        return errores
+
+    @staticmethod
+    def validar_curso_de_aula(aula_id, curso_id):
+        """
+        Verifica que el curso pueda calificarse en el aula, es decir, que sean
+        del mismo nivel educativo. Lanza ValidationError si no es así.
+        """
+        if registro.obtener(Curso, curso_id) is None:
+            raise ValidationError("Curso no encontrado.")
+        grado_id = Aula.objects.filter(id=aula_id).values_list('grado_id', flat=True).first()
+        if _nivel_educativo(Grado, grado_id) != _nivel_educativo(Curso, curso_id):
+            raise ValidationError("El nivel educativo del curso no coincide con el nivel del aula del estudiante.")
+
+    @staticmethod
+    def obtener_libreta(aula_id, curso_id):
+        """
+        Retorna las calificaciones de un curso para todos los estudiantes del
+        aula como una lista de pares (estudiante, calificacion), creando en
+        bloque las calificaciones que falten (con `ingresada=False`).
+        """
+        estudiantes = list(Estudiante.objects.filter(aula_id=aula_id).order_by('id'))
+        calificaciones = Calificacion._calificaciones_por_estudiante(aula_id, curso_id)
+
+        faltantes = [e for e in estudiantes if e.id not in calificaciones]
+        if faltantes:
+            # ignore_conflicts: si otro docente abrió la libreta al mismo tiempo,
+            # la restricción única evita duplicados
+            Calificacion.objects.bulk_create(
+                [Calificacion(estudiante=estudiante, curso_id=curso_id) for estudiante in faltantes],
+                ignore_conflicts=True)
+            # bulk_create no envía señales
+            invalidar_calificaciones()
+            calificaciones = Calificacion._calificaciones_por_estudiante(aula_id, curso_id)
+
+        return [(estudiante, calificaciones[estudiante.id]) for estudiante in estudiantes]
+
+    @staticmethod
+    def crear_sin_ingresar(estudiante, curso_id):
+        """
+        Crea la calificación en 0.0 de un estudiante en un curso con
+        `ingresada=False`, igual que obtener_libreta, para que no cuente en las
+        estadísticas. Lanza ValidationError si el curso no es del nivel del aula.
+        """
+        calificacion = Calificacion(estudiante=estudiante, curso_id=curso_id)
+        calificacion.clean()
+        # bulk_create no pasa por save(), que marca la calificación como ingresada;
+        # ignore_conflicts: otra solicitud pudo crearla al mismo tiempo
+        Calificacion.objects.bulk_create([calificacion], ignore_conflicts=True)
+        return Calificacion.objects.get(estudiante=estudiante, curso_id=curso_id)
+
+    @staticmethod
+    def _calificaciones_por_estudiante(aula_id, curso_id):
+        return {calificacion.estudiante_id: calificacion for calificacion in Calificacion.objects.filter(
+            estudiante__aula_id=aula_id, curso_id=curso_id)}
+
+    @staticmethod
+    def actualizar_notas(aula_id, curso_id, filas):
+        """
+        Crea o actualiza en bloque las calificaciones de un curso en un aula.
+
+        Valida todas las filas y, solo si todas son válidas, guarda las que
+        cambiaron dentro de una transacción con un upsert (uno para las
+        existentes y otro para las nuevas), calculando el promedio de cada una.
+
+        Args:
+            aula_id (int): El aula a la que deben pertenecer los estudiantes.
+            curso_id (int): El curso de las calificaciones.
+            filas (list): Diccionarios con la llave 'estudiante' y las notas
+                a cambiar (calificacion_1 a calificacion_4).
+
+        Returns:
+            tuple: (resultados por fila, True si todas las filas fueron válidas).
+        """
+        filas = [(_a_entero(fila.get('estudiante')), fila) for fila in filas]
+        errores = Calificacion.validar_niveles(
+            [(estudiante_id, curso_id) for estudiante_id, _ in filas], aula_id=aula_id)
+        calificaciones = Calificacion._calificaciones_por_estudiante(aula_id, curso_id)
+
+        resultados = []
+        cambios = {}
+        for estudiante_id, fila in filas:
+            error = errores.get((estudiante_id, curso_id))
+            if error:
+                resultados.append({'estudiante': estudiante_id, 'status': 'error', 'details': error})
+                continue
+            notas, error = Calificacion._leer_notas(fila)
+            if error:
+                resultados.append({'estudiante': estudiante_id, 'status': 'error', 'details': error})
+                continue
+
+            calificacion = cambios.get(estudiante_id) or calificaciones.get(estudiante_id)
+            nueva = calificacion is None
+            if nueva:
+                calificacion = Calificacion(estudiante_id=estudiante_id, curso_id=curso_id)
+            modificados = [campo for campo, nota in notas.items()
+                           if getattr(calificacion, campo) != nota]
+            # Guardar también las notas de la libreta que se confirman sin cambiar su valor
+            if not nueva and not modificados and calificacion.ingresada:
+                resultados.append({'estudiante': estudiante_id, 'id': calificacion.id,
+                                   'status': 'sin cambios'})
+                continue
+            for campo in modificados:
+                setattr(calificacion, campo, notas[campo])
+            calificacion.promedio = calificacion.calcular_promedio()
+            calificacion.ingresada = True
+            cambios[estudiante_id] = calificacion
+            resultados.append({'estudiante': estudiante_id, 'id': calificacion.id,
+                               'promedio': calificacion.promedio,
+                               'status': 'creado' if nueva else 'actualizado'})
+
+        valido = all(resultado['status'] != 'error' for resultado in resultados)
+        if valido and cambios:
+            with transaction.atomic():
+                guardadas = Calificacion.objects.bulk_create(
+                    cambios.values(), update_conflicts=True,
+                    unique_fields=['estudiante', 'curso'],
+                    update_fields=[*Calificacion.CAMPOS_NOTAS, 'promedio', 'ingresada'])
+                invalidar_calificaciones()
+            # Completar el id de las calificaciones creadas
+            ids = {calificacion.estudiante_id: calificacion.id for calificacion in guardadas}
+            for resultado in resultados:
+                if resultado.get('id') is None and resultado['status'] == 'creado':
+                    resultado['id'] = ids.get(resultado['estudiante'])
+        return resultados, valido
+
+    @staticmethod
+    def _leer_notas(fila):
+        """Retorna ({campo: nota} de la fila, mensaje de error o None)."""
+        notas = {}
+        for campo in Calificacion.CAMPOS_NOTAS:
+            if campo not in fila:
+                continue
+            try:
+                nota = float(fila[campo])
+            except (TypeError, ValueError):
+                return {}, f"'{campo}' debe ser un número."
+            if not 0 <= nota <= 20:
+                return {}, f"'{campo}' debe estar entre 0 y 20."
+            notas[campo] = nota
+        return notas, None
 
 
 class Conversacion(models.Model):
@@ -292,10 +855,20 @@ class Conversacion(models.Model):
     participante_2 = models.ForeignKey(
         Usuario, on_delete=models.CASCADE, related_name='conversaciones_como_participante_2')
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Referencia al mensaje más reciente, mantenida al crear cada Mensaje
+    ultimo_mensaje = models.ForeignKey(
+        'Mensaje', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    ultima_actividad = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         verbose_name_plural = "Conversaciones"
         unique_together = ('participante_1', 'participante_2')
+        indexes = [
+            models.Index(fields=['participante_1', '-ultima_actividad'],
+                         name='conversacion_p1_actividad_idx'),
+            models.Index(fields=['participante_2', '-ultima_actividad'],
+                         name='conversacion_p2_actividad_idx'),
+        ]
 
     def __str__(self):
         return f"Conversación entre {self.participante_1} y {self.participante_2}"
@@ -309,14 +882,80 @@ class Conversacion(models.Model):
     def save(self, *args, **kwargs):
         # Llamar a clean antes de guardar para asegurarse de que las validaciones se realicen
         self.clean()
+        if self.ultima_actividad is None:
+            self.ultima_actividad = timezone.now()
         super().save(*args, **kwargs)
 
     def obtener_mensaje_reciente(self):
-        return self.mensajes.order_by('-fecha_creacion').first()
+        return self.ultimo_mensaje
+
+    @staticmethod
+    def registrar_mensaje(mensaje):
+        """Apunta la conversación del mensaje a este como su mensaje más reciente."""
+        Conversacion.objects.filter(
+            models.Q(ultima_actividad__isnull=True) |
+            models.Q(ultima_actividad__lte=mensaje.fecha_creacion),
+            pk=mensaje.conversacion_id,
+        ).update(ultimo_mensaje=mensaje, ultima_actividad=mensaje.fecha_creacion)
+
+    @staticmethod
+    def obtener_o_crear_para(emisor, receptores):
+        """
+        Retorna un diccionario receptor_id -> conversación entre el emisor y
+        cada receptor, creando en bloque las que no existan.
+
+        Se asume que los roles ya fueron validados (un docente y un apoderado).
+        """
+        def par(receptor):
+            return (emisor.id, receptor.id) if emisor.is_docente else (receptor.id, emisor.id)
+
+        conversaciones = Conversacion.obtener_o_crear_por_pares(
+            {par(receptor) for receptor in receptores})
+        return {receptor.id: conversaciones[par(receptor)] for receptor in receptores}
+
+    @staticmethod
+    def obtener_o_crear_por_pares(pares):
+        """
+        Retorna un diccionario (docente_usuario_id, apoderado_usuario_id) ->
+        conversación para los pares dados, creando en bloque las que no existan.
+        """
+        por_docente = {}
+        for docente_id, apoderado_id in pares:
+            por_docente.setdefault(docente_id, []).append(apoderado_id)
+
+        def buscar():
+            filtro = models.Q()
+            for docente_id, apoderados in por_docente.items():
+                filtro |= models.Q(participante_1_id=docente_id, participante_2_id__in=apoderados)
+            return {(c.participante_1_id, c.participante_2_id): c
+                    for c in Conversacion.objects.filter(filtro)}
+
+        conversaciones = buscar() if pares else {}
+        faltantes = [par for par in pares if par not in conversaciones]
+        if faltantes:
+            ahora = timezone.now()
+            Conversacion.objects.bulk_create([
+                Conversacion(participante_1_id=docente_id, participante_2_id=apoderado_id,
+                             ultima_actividad=ahora)
+                for docente_id, apoderado_id in faltantes], ignore_conflicts=True)
+            conversaciones = buscar()
+        return conversaciones
+
+    @staticmethod
+    def recalcular_ultimo_mensaje(conversacion_id):
+        """Vuelve a calcular el mensaje más reciente, por ejemplo tras eliminar uno."""
+        ultimo = Mensaje.objects.filter(
+            conversacion_id=conversacion_id).order_by('-fecha_creacion', '-id').first()
+        if ultimo:
+            Conversacion.objects.filter(pk=conversacion_id).update(
+                ultimo_mensaje=ultimo, ultima_actividad=ultimo.fecha_creacion)
+        else:
+            Conversacion.objects.filter(pk=conversacion_id).update(
+                ultimo_mensaje=None)
 
     def obtener_mensajes(self):
         """Obtener todos los mensajes relacionados con esta conversación."""
-        return self.mensajes.all()
+        return self.mensajes.order_by('fecha_creacion', 'id')
 
 
 class Mensaje(models.Model):
@@ -329,15 +968,202 @@ class Mensaje(models.Model):
     contenido = models.TextField()
     fecha_creacion = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Paginación por llave del historial de una conversación
+            models.Index(fields=['conversacion', 'fecha_creacion', 'id'],
+                         name='mensaje_conv_fecha_idx'),
+        ]
+
     def __str__(self):
         return f'Mensaje de {self.emisor} a {self.receptor} en Conversacion con id {self.conversacion.id}'
 
+    def save(self, *args, **kwargs):
+        creado = self._state.adding
+        super().save(*args, **kwargs)
+        # Mantener actualizado el mensaje más reciente de la conversación
+        if creado and self.conversacion_id:
+            Conversacion.registrar_mensaje(self)
+            transaction.on_commit(lambda: historial_chat.registrar([self]))
+
     def clean(self):
         # Verificamos que el participante 1 sea docente y el participante 2 sea apoderado
         if not (self.emisor.is_docente and self.receptor.is_apoderado):
             raise ValidationError(
                 "El participante 1 debe ser un Docente y el participante 2 debe ser un Apoderado.")
 
+    @staticmethod
+    def enviar_a_varios(emisor, receptores, contenido, imagen=None):
+        """
+        Envía el mismo mensaje a varios receptores en una sola transacción.
+
+        Las conversaciones se resuelven en bloque, los mensajes se insertan con
+        bulk_create y la imagen adjunta se guarda una sola vez y se comparte
+        entre todos los mensajes. Si la transacción falla, la imagen guardada
+        se borra del almacenamiento.
+
+        Returns:
+            list: Los mensajes creados, con sus imágenes precargadas.
+        """
+        nombre = None
+        try:
+            with transaction.atomic():
+                conversaciones = Conversacion.obtener_o_crear_para(emisor, receptores)
+                mensajes = Mensaje.objects.bulk_create([
+                    Mensaje(emisor=emisor, receptor=receptor,
+                            conversacion=conversaciones[receptor.id], contenido=contenido)
+                    for receptor in receptores])
+
+                if imagen is not None:
+                    nombre = default_storage.save(
+                        f'imagenes/mensajes/compartidas/{imagen.name}', imagen)
+                    Imagen.objects.bulk_create(
+                        [Imagen(mensaje=mensaje, imagen=nombre) for mensaje in mensajes])
+
+                # bulk_create no llama a save(): actualizar el mensaje más reciente aquí
+                for mensaje in mensajes:
+                    mensaje.conversacion.ultimo_mensaje = mensaje
+                    mensaje.conversacion.ultima_actividad = mensaje.fecha_creacion
+                Conversacion.objects.bulk_update(
+                    [mensaje.conversacion for mensaje in mensajes],
+                    ['ultimo_mensaje', 'ultima_actividad'])
+
+                prefetch_related_objects(mensajes, 'imagenes')
+                transaction.on_commit(lambda: historial_chat.registrar(mensajes))
+        except Exception:
+            # El archivo no forma parte de la transacción: borrarlo si se revierte
+            if nombre is not None:
+                default_storage.delete(nombre)
+            raise
+        return mensajes
+
+    @staticmethod
+    def guardar_lote(filas):
+        """
+        Guarda en una sola transacción mensajes de distintas conversaciones.
+
+        Args:
+            filas (list): Tuplas (emisor_id, receptor_id, contenido, emisor_es_docente);
+                los roles ya deben estar validados.
+
+        Returns:
+            list: Los mensajes creados, en el mismo orden que las filas.
+        """
+        def par(emisor_id, receptor_id, emisor_es_docente):
+            return (emisor_id, receptor_id) if emisor_es_docente else (receptor_id, emisor_id)
+
+        with transaction.atomic():
+            conversaciones = Conversacion.obtener_o_crear_por_pares(
+                {par(emisor_id, receptor_id, docente) for emisor_id, receptor_id, _, docente in filas})
+            mensajes = Mensaje.objects.bulk_create([
+                Mensaje(emisor_id=emisor_id, receptor_id=receptor_id, contenido=contenido,
+                        conversacion=conversaciones[par(emisor_id, receptor_id, docente)])
+                for emisor_id, receptor_id, contenido, docente in filas])
+
+            # bulk_create no llama a save(): el último de cada conversación queda como reciente
+            actualizadas = {}
+            for mensaje in mensajes:
+                mensaje.conversacion.ultimo_mensaje = mensaje
+                mensaje.conversacion.ultima_actividad = mensaje.fecha_creacion
+                actualizadas[mensaje.conversacion_id] = mensaje.conversacion
+            Conversacion.objects.bulk_update(
+                actualizadas.values(), ['ultimo_mensaje', 'ultima_actividad'])
+            transaction.on_commit(lambda: historial_chat.registrar(mensajes))
+        return mensajes
+
+
+@receiver(post_delete, sender=Mensaje)
+def actualizar_conversacion_al_eliminar(sender, instance, origin=None, **kwargs):
+    # Solo al eliminar mensajes directamente; si se elimina la conversación o
+    # un usuario completo, no hay nada que recalcular
+    if not (isinstance(origin, Mensaje) or getattr(origin, 'model', None) is Mensaje):
+        return
+    if instance.conversacion_id:
+        Conversacion.recalcular_ultimo_mensaje(instance.conversacion_id)
+        par = par_de_usuarios(instance.emisor_id, instance.receptor_id)
+        transaction.on_commit(lambda: historial_chat.invalidar(par))
+
+
+@receiver(post_save, sender=Estudiante)
+@receiver(post_delete, sender=Estudiante)
+@receiver(post_save, sender=AulaCurso)
+@receiver(post_delete, sender=AulaCurso)
+@receiver(post_delete, sender=Apoderado)
+@receiver(post_delete, sender=Docente)
+@receiver(m2m_changed, sender=Apoderado.estudiantes.through)
+def invalidar_miembros_de_aulas(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        # Después del commit, para que una conexión concurrente no guarde los
+        # miembros anteriores bajo la versión nueva
+        transaction.on_commit(lambda: cache_utils.invalidar(VERSION_MIEMBROS_AULA))
+
+
+def _origen_es(origin, modelo):
+    """Indica si una eliminación empezó en una instancia o queryset de `modelo`."""
+    return isinstance(origin, modelo) or (
+        isinstance(origin, models.QuerySet) and origin.model is modelo)
+
+
+@receiver(post_delete, sender=Asistencia)
+def descontar_asistencia(sender, instance, origin=None, **kwargs):
+    # Si se elimina el estudiante, el aula o el estado, sus resúmenes se eliminan en cascada
+    if not _origen_es(origin, Asistencia):
+        return
+    aula_id = Estudiante.objects.filter(
+        id=instance.estudiante_id).values_list('aula_id', flat=True).first()
+    ResumenAsistencia.acumular([(aula_id, instance.estudiante_id, instance.fecha, instance.estado_id, -1)])
+
+
+def _asistencias_por_dia_y_estado(estudiante):
+    """Retorna (fecha, estado_id, cantidad) de las asistencias con estado del estudiante."""
+    return Asistencia.objects.filter(
+        estudiante=estudiante, estado__isnull=False
+    ).values('fecha', 'estado_id').annotate(cantidad=Count('id')).values_list(
+        'fecha', 'estado_id', 'cantidad')
+
+
+@receiver(pre_delete, sender=Estudiante)
+def descontar_asistencias_del_estudiante(sender, instance, origin=None, **kwargs):
+    # Sus resúmenes se eliminan en cascada; los de su aula se descuentan en bloque
+    if not _origen_es(origin, Estudiante) or instance.aula_id is None:
+        return
+    ResumenAsistenciaAula._sumar({
+        (instance.aula_id, fecha, estado_id): -cantidad
+        for fecha, estado_id, cantidad in _asistencias_por_dia_y_estado(instance)})
+
+
+@receiver(pre_save, sender=Estudiante)
+def recordar_aula_anterior(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._aula_anterior_id = Estudiante.objects.filter(
+        id=instance.pk).values_list('aula_id', flat=True).first()
+
+
+@receiver(post_save, sender=Estudiante)
+def mover_asistencias_de_aula(sender, instance, created, raw=False, **kwargs):
+    # Los resúmenes por aula usan el aula actual del estudiante (como reconstruir):
+    # al cambiarlo de aula sus asistencias pasan del aula anterior a la nueva.
+    # Un QuerySet.update() del aula no envía señales; usar reconstruir en ese caso
+    aula_anterior_id = instance.__dict__.pop('_aula_anterior_id', None)
+    if created or raw or aula_anterior_id in (None, instance.aula_id):
+        return
+    cambios = {}
+    for fecha, estado_id, cantidad in _asistencias_por_dia_y_estado(instance):
+        cambios[(aula_anterior_id, fecha, estado_id)] = -cantidad
+        cambios[(instance.aula_id, fecha, estado_id)] = cantidad
+    with transaction.atomic():
+        ResumenAsistenciaAula._sumar(cambios)
+
+
+@receiver(post_save, sender=Calificacion)
+@receiver(post_delete, sender=Calificacion)
+@receiver(post_save, sender=Estudiante)
+@receiver(post_delete, sender=Estudiante)
+def invalidar_calificaciones(sender=None, **kwargs):
+    # Después del commit, para no guardar en el cache datos aún no confirmados con la versión nueva
+    transaction.on_commit(lambda: cache_utils.invalidar(VERSION_CALIFICACIONES))
+
 
 def get_upload_to(instance, filename):
     return f'imagenes/mensajes/conversacion_{instance.mensaje.conversacion.id}/{filename}'
@@ -356,6 +1182,17 @@ class Imagen(models.Model):
         return f'Imagen para el mensaje ID: {self.mensaje.id}, ubicado en la conversación ID: {self.mensaje.conversacion.id}'
 
 
+@receiver(post_save, sender=Imagen)
+@receiver(post_delete, sender=Imagen)
+def invalidar_historial_por_imagen(sender, instance, **kwargs):
+    # Las imágenes se agregan después de crear el mensaje: el historial en memoria queda desactualizado
+    if instance.mensaje_id:
+        mensaje = Mensaje.objects.filter(id=instance.mensaje_id).values('emisor_id', 'receptor_id').first()
+        if mensaje:
+            par = par_de_usuarios(mensaje['emisor_id'], mensaje['receptor_id'])
+            transaction.on_commit(lambda: historial_chat.invalidar(par))
+
+
 class Noticia(models.Model):
     titulo = models.CharField(max_length=200)
     descripcion = models.TextField()
@@ -371,10 +1208,14 @@ class Noticia(models.Model):
     administrador = models.ForeignKey(Administrador, on_delete=models.CASCADE)
 
     def incrementar_vistas(self, usuario):
-        # Incrementar las vistas solo si el usuario no es un administrador
+        # Incrementar las vistas solo si el usuario no es un administrador.
+        # Se acumulan en memoria y se guardan por lotes (ver contadores.py)
         if not (usuario.is_authenticated and usuario.is_staff):
-            self.vistas += 1
-            self.save()
+            buffer_vistas.incrementar(self.id)
+
+    def obtener_vistas(self):
+        """Vistas guardadas más las que aún están pendientes de guardar."""
+        return self.vistas + buffer_vistas.pendientes(self.id)
             
     def __str__(self):
         categoria = f' - {self.categoria}' if self.categoria else ''
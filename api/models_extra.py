@@ -1,10 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
 
+from . import cache as cache_utils
 from . import constants as const
+from .registro import registro
 
 
 class CategoriaNoticia(models.Model):
@@ -33,15 +35,16 @@ class Grado(models.Model):
         NivelEducativo, on_delete=models.CASCADE, related_name='grados')
 
     def clean(self):
-        if self.nivel.nombre == 'Primaria' and not (1 <= self.numero <= 6):
+        nivel = registro.obtener(NivelEducativo, self.nivel_id)
+        if nivel.nombre == 'Primaria' and not (1 <= self.numero <= 6):
             raise ValidationError(
                 "El grado de primaria debe estar entre 1 y 6.")
-        elif self.nivel.nombre == 'Secundaria' and not (1 <= self.numero <= 5):
+        elif nivel.nombre == 'Secundaria' and not (1 <= self.numero <= 5):
             raise ValidationError(
                 "El grado de secundaria debe estar entre 1 y 5.")
 
     def __str__(self):
-        return f"{self.numero}° {self.nivel}"
+        return f"{self.numero}° {registro.obtener(NivelEducativo, self.nivel_id)}"
 
 
 class Seccion(models.Model):
@@ -67,7 +70,7 @@ class Curso(models.Model):
         NivelEducativo, on_delete=models.CASCADE, related_name='cursos')
 
     def __str__(self):
-        return f"{self.nombre} ({self.nivel.nombre})"
+        return f"{self.nombre} ({registro.obtener(NivelEducativo, self.nivel_id).nombre})"
 
 
 class EstadoAsistencia(models.Model):
@@ -95,6 +98,24 @@ class EstadoTarea(models.Model):
         return self.nombre
 
 
+# Modelos cuyas respuestas se cachean con ETag (ver cache.py) y que se
+# mantienen en memoria en el registro de referencia (ver registro.py)
+MODELOS_CATALOGO = (CategoriaNoticia, NivelEducativo, Grado, Seccion,
+                    Genero, Curso, EstadoAsistencia, EstadoTarea)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidar_catalogo(sender, **kwargs):
+    if sender in MODELOS_CATALOGO:
+        # Después del commit, para que un lector concurrente no guarde las filas
+        # anteriores bajo la versión nueva
+        def invalidar():
+            cache_utils.invalidar(sender)
+            registro.invalidar(sender)
+        transaction.on_commit(invalidar)
+
+
 @receiver(post_migrate)
 def create_models(sender, **kwargs):
     if sender.name == const.NOMBRE_APLICACION:
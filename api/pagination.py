@@ -0,0 +1,84 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(BasePagination):
+    """Paginación por llave sobre (fecha_creacion, id).
+
+    A diferencia de la paginación por offset, cada página cuesta lo mismo sin
+    importar cuántos mensajes tenga la conversación. El cliente avanza con los
+    parámetros `before` (mensajes más antiguos) y `after` (más recientes)
+    usando los cursores devueltos en la respuesta.
+    """
+    campo_fecha = 'fecha_creacion'
+    limite_por_defecto = 50
+    limite_maximo = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Retorna la página en orden cronológico, o None si no se pidió paginar."""
+        params = request.query_params
+        if not any(llave in params for llave in ('before', 'after', 'limit')):
+            return None
+
+        limite = self.obtener_limite(params.get('limit'))
+        despues = params.get('after')
+        if despues:
+            fecha, pk = self.decodificar_cursor(despues)
+            filtro = Q(**{f'{self.campo_fecha}__gt': fecha}) | Q(
+                **{self.campo_fecha: fecha, 'id__gt': pk})
+            items = list(queryset.filter(filtro).order_by(
+                self.campo_fecha, 'id')[:limite + 1])
+            self.hay_anteriores = True
+            self.hay_siguientes = len(items) > limite
+            items = items[:limite]
+        else:
+            antes = params.get('before')
+            if antes:
+                fecha, pk = self.decodificar_cursor(antes)
+                queryset = queryset.filter(Q(**{f'{self.campo_fecha}__lt': fecha}) | Q(
+                    **{self.campo_fecha: fecha, 'id__lt': pk}))
+            items = list(queryset.order_by(
+                f'-{self.campo_fecha}', '-id')[:limite + 1])
+            self.hay_anteriores = len(items) > limite
+            self.hay_siguientes = bool(antes)
+            items = items[:limite][::-1]
+
+        self.cursor_solicitado = despues
+        self.items = items
+        return items
+
+    def get_paginated_response(self, data):
+        primero = self.items[0] if self.items else None
+        ultimo = self.items[-1] if self.items else None
+        return Response({
+            'results': data,
+            # Cursor para cargar mensajes más antiguos (None si no hay más)
+            'before': self.codificar_cursor(primero) if primero and self.hay_anteriores else None,
+            # Cursor para consultar mensajes más recientes que la página
+            'after': self.codificar_cursor(ultimo) if ultimo else self.cursor_solicitado,
+            'has_newer': self.hay_siguientes,
+        })
+
+    def obtener_limite(self, valor):
+        try:
+            limite = int(valor)
+        except (TypeError, ValueError):
+            return self.limite_por_defecto
+        return max(1, min(limite, self.limite_maximo))
+
+    def codificar_cursor(self, instancia):
+        valor = f'{getattr(instancia, self.campo_fecha).isoformat()}|{instancia.pk}'
+        return base64.urlsafe_b64encode(valor.encode()).decode()
+
+    def decodificar_cursor(self, cursor):
+        try:
+            fecha, pk = base64.urlsafe_b64decode(
+                cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(fecha), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({"details": "Cursor inválido."})
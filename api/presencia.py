@@ -0,0 +1,261 @@
+import asyncio
+import atexit
+import uuid
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+
+class RegistroPresencia:
+    """Estado de conexión de los usuarios con sockets abiertos en este proceso.
+
+    Cuenta los sockets de cada usuario (pestañas, aulas y dispositivos) y solo
+    considera un cambio de estado real cuando se abre el primero o se cierra el
+    último. Esos cambios se acumulan y se guardan por lotes como sesiones
+    (`SesionPresencia`) de este worker, junto con `last_connection` del usuario.
+
+    Mientras tenga sockets abiertos el worker renueva su latido cada `latido`
+    segundos (`WorkerPresencia`). Un usuario está en línea solo si tiene una
+    sesión en un worker con latido vigente: si un worker se cae sus sesiones
+    vencen solas, sin que los demás tengan que reiniciar la presencia al
+    arrancar.
+    """
+
+    def __init__(self, intervalo=1.0, latido=15.0):
+        # Segundos que se acumulan los cambios antes de escribirlos
+        self.intervalo = intervalo
+        self.latido = latido
+        self.worker_id = uuid.uuid4().hex
+        # usuario_id -> {channel_name: grupos de presencia del socket}
+        self._sockets = defaultdict(dict)
+        # usuario_id -> grupos en los que estuvo desde que se conectó
+        self._grupos = defaultdict(set)
+        # usuario_id -> (conectado, fecha) pendiente de guardar
+        self._pendientes = {}
+        self._tarea = None
+        self._tarea_latido = None
+        # True si el worker está guardado en la base de datos
+        self._registrado = False
+
+    def conectar(self, usuario_id, canal, grupo):
+        """Registra un socket.
+
+        Returns:
+            bool: True si es el primer socket del usuario en el grupo, es decir,
+            si hay que avisar al grupo que el usuario está en línea.
+        """
+        if not self._sockets[usuario_id]:
+            self._pendientes[usuario_id] = (True, timezone.now())
+        self._sockets[usuario_id].setdefault(canal, set()).add(grupo)
+        nuevo = grupo not in self._grupos[usuario_id]
+        self._grupos[usuario_id].add(grupo)
+        return nuevo
+
+    def desconectar(self, usuario_id, canal):
+        """Quita un socket.
+
+        Returns:
+            set: Los grupos a notificar si el usuario quedó desconectado, o un
+            conjunto vacío si todavía tiene otros sockets abiertos.
+        """
+        sockets = self._sockets.get(usuario_id)
+        if not sockets or canal not in sockets:
+            return set()
+        del sockets[canal]
+        if sockets:
+            return set()
+        del self._sockets[usuario_id]
+        self._pendientes[usuario_id] = (False, timezone.now())
+        return self._grupos.pop(usuario_id, set())
+
+    def salir(self, usuario_id, canal, grupo):
+        """Quita un grupo de un socket que sigue abierto (al desuscribirse).
+
+        Returns:
+            set: Los grupos a notificar que el usuario quedó desconectado: todos
+            si era su último grupo de presencia, solo `grupo` si ningún otro
+            socket del usuario está en él, o un conjunto vacío.
+        """
+        sockets = self._sockets.get(usuario_id)
+        if not sockets or grupo not in sockets.get(canal, ()):
+            return set()
+        sockets[canal].discard(grupo)
+        if not sockets[canal] and len(sockets) == 1:
+            return self.desconectar(usuario_id, canal)
+        if not sockets[canal]:
+            del sockets[canal]
+        if any(grupo in grupos for grupos in sockets.values()):
+            return set()
+        self._grupos[usuario_id].discard(grupo)
+        return {grupo}
+
+    def en_linea(self, usuario_id):
+        return bool(self._sockets.get(usuario_id))
+
+    def usuarios_en_linea(self):
+        return set(self._sockets)
+
+    def conectados(self, usuarios_ids):
+        """Retorna los ids dados que tienen algún socket abierto en cualquier proceso.
+
+        Los de este proceso se conocen al instante; los de otros procesos desde
+        que estos guardan sus cambios (a lo sumo `intervalo` segundos después).
+        """
+        from .models import SesionPresencia
+
+        locales = {usuario_id for usuario_id in usuarios_ids if usuario_id in self._sockets}
+        restantes = [usuario_id for usuario_id in usuarios_ids if usuario_id not in locales]
+        if not restantes:
+            return locales
+        return locales | SesionPresencia.usuarios_en_linea(restantes)
+
+    def pendientes(self):
+        """Retorna (ids conectados, ids desconectados) que aún no se guardaron."""
+        conectados = {u for u, (estado, _) in self._pendientes.items() if estado}
+        return conectados, set(self._pendientes) - conectados
+
+    def programar_guardado(self):
+        """Programa el guardado de los cambios pendientes y, mientras haya
+        sockets abiertos, el latido del worker en el event loop actual."""
+        if self._pendientes and (self._tarea is None or self._tarea.done()):
+            self._tarea = asyncio.ensure_future(self._guardar_despues())
+        if self._sockets and (self._tarea_latido is None or self._tarea_latido.done()):
+            self._tarea_latido = asyncio.ensure_future(self._latir())
+
+    async def _guardar_despues(self):
+        await asyncio.sleep(self.intervalo)
+        await self.guardar()
+
+    async def _latir(self):
+        while self._sockets:
+            await asyncio.sleep(self.latido)
+            await database_sync_to_async(self.guardar_sync)(latido=True)
+
+    async def guardar(self):
+        await database_sync_to_async(self.guardar_sync)()
+
+    def guardar_sync(self, latido=False):
+        """Guarda los cambios pendientes; con `latido` además renueva el del
+        worker y elimina los workers vencidos."""
+        from .models import SesionPresencia, Usuario, WorkerPresencia
+
+        pendientes, self._pendientes = self._pendientes, {}
+        conectados = {u: fecha for u, (estado, fecha) in pendientes.items() if estado}
+        desconectados = [u for u, (estado, _) in pendientes.items() if not estado]
+
+        if self._sockets and (latido or conectados or not self._registrado):
+            WorkerPresencia.renovar(self.worker_id, timezone.now())
+            self._registrado = True
+        if conectados:
+            SesionPresencia.objects.bulk_create(
+                [SesionPresencia(worker_id=self.worker_id, usuario_id=usuario_id)
+                 for usuario_id in conectados],
+                ignore_conflicts=True)
+            # Cada usuario con su propia hora de conexión, en una sola consulta
+            Usuario.objects.bulk_update(
+                [Usuario(id=usuario_id, last_connection=fecha)
+                 for usuario_id, fecha in conectados.items()],
+                ['last_connection'])
+        if not self._sockets and self._registrado:
+            # Sin sockets abiertos el worker deja de figurar con todas sus sesiones
+            self.cerrar_sync()
+        elif desconectados:
+            SesionPresencia.objects.filter(
+                worker_id=self.worker_id, usuario_id__in=desconectados).delete()
+        if latido:
+            WorkerPresencia.eliminar_vencidos()
+
+    def cerrar_sync(self):
+        """Elimina las sesiones de este worker, por ejemplo al detener el proceso."""
+        from .models import SesionPresencia, WorkerPresencia
+
+        if not self._registrado:
+            return
+        SesionPresencia.objects.filter(worker_id=self.worker_id).delete()
+        WorkerPresencia.objects.filter(id=self.worker_id).delete()
+        self._registrado = False
+
+
+class DifusorPresencia:
+    """Agrupa los cambios de conexión de cada grupo en un solo mensaje.
+
+    Durante una ráfaga de conexiones (por ejemplo al empezar una clase) los
+    cambios de cada grupo se acumulan por `intervalo` segundos y se envían en
+    un único evento `users_changed`. Un usuario que termina en el mismo estado
+    en el que empezó (se desconecta y vuelve a conectar) no se envía. La lista
+    de usuarios en línea de cada grupo se consulta a lo sumo una vez por
+    intervalo y se comparte entre los sockets que se conectan en ese tiempo.
+    """
+
+    def __init__(self, intervalo=0.5):
+        self.intervalo = intervalo
+        # grupo -> {usuario_id: (estado inicial, estado final)}
+        self._cambios = defaultdict(dict)
+        self._tareas = {}
+        # (grupo, rol) -> (expira, ids en línea)
+        self._listas = {}
+
+    def registrar(self, grupo, usuario_id, en_linea):
+        """Acumula un cambio de estado y programa el envío del grupo."""
+        cambios = self._cambios[grupo]
+        inicial = cambios[usuario_id][0] if usuario_id in cambios else not en_linea
+        cambios[usuario_id] = (inicial, en_linea)
+        if grupo not in self._tareas:
+            self._tareas[grupo] = asyncio.ensure_future(self._difundir_despues(grupo))
+
+    async def usuarios_en_linea(self, grupo, rol, consultar):
+        """Retorna los ids en línea del grupo, reutilizando la última consulta
+        mientras no haya pasado el intervalo."""
+        ahora = asyncio.get_running_loop().time()
+        lista = self._listas.get((grupo, rol))
+        if lista is None or lista[0] <= ahora:
+            lista = (ahora + self.intervalo, await consultar())
+            self._listas[(grupo, rol)] = lista
+        return lista[1]
+
+    def cambios_a_enviar(self, grupo):
+        """Retira los cambios acumulados de un grupo.
+
+        Returns:
+            tuple: (ids conectados, ids desconectados), sin los usuarios que
+            terminaron en su estado inicial, salvo que alguna lista enviada en
+            este intervalo los muestre en un estado distinto al final.
+        """
+        cambios = self._cambios.pop(grupo, {})
+        listas = [ids for (g, _), (_, ids) in self._listas.items() if g == grupo]
+        for clave in [clave for clave in self._listas if clave[0] == grupo]:
+            del self._listas[clave]
+
+        conectados, desconectados = [], []
+        for usuario_id, (inicial, final) in sorted(cambios.items()):
+            if inicial == final and all((usuario_id in ids) == final for ids in listas):
+                continue
+            (conectados if final else desconectados).append(usuario_id)
+        return conectados, desconectados
+
+    async def _difundir_despues(self, grupo):
+        try:
+            await asyncio.sleep(self.intervalo)
+        finally:
+            self._tareas.pop(grupo, None)
+        conectados, desconectados = self.cambios_a_enviar(grupo)
+        if conectados or desconectados:
+            await get_channel_layer().group_send(grupo, {
+                'type': 'users_changed',
+                'grupo': grupo,
+                'connected': conectados,
+                'disconnected': desconectados,
+            })
+
+
+presencia = RegistroPresencia(
+    intervalo=getattr(settings, 'PRESENCIA_INTERVALO', 1.0),
+    latido=getattr(settings, 'PRESENCIA_LATIDO', 15.0))
+difusor = DifusorPresencia(
+    intervalo=getattr(settings, 'PRESENCIA_DIFUSION_INTERVALO', 0.5))
+
+# Al detener el proceso sus usuarios dejan de figurar en línea sin esperar a que venza el latido
+atexit.register(presencia.cerrar_sync)
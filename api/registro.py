@@ -0,0 +1,87 @@
+import time
+
+from django.conf import settings
+
+from . import cache as cache_utils
+
+
+class RegistroReferencia:
+    """Datos de referencia de models_extra cargados en memoria una vez por proceso.
+
+    Cada modelo se carga completo con una sola consulta la primera vez que se
+    usa y se vuelve a cargar cuando cambia su versión (las señales de
+    guardado/eliminación la incrementan, ver models_extra.py). La versión
+    vive en el cache compartido, así que se consulta como máximo una vez cada
+    `intervalo` segundos por modelo: un cambio hecho en otro proceso se ve
+    tras ese intervalo (en este proceso, de inmediato). Los objetos devueltos
+    son compartidos y no deben modificarse.
+    """
+
+    def __init__(self, intervalo=0):
+        self.intervalo = intervalo
+        # modelo -> (versión, objetos por id, ids por llave natural, ya se recargó)
+        self._datos = {}
+        # modelo -> momento (time.monotonic) en que se verificó su versión
+        self._verificado = {}
+
+    def obtener(self, modelo, pk):
+        """Retorna el objeto con el id dado, o None si no existe."""
+        if pk is None:
+            return None
+        datos = self._cargar(modelo)
+        objeto = datos[1].get(pk)
+        if objeto is None and not datos[3]:
+            # Puede haberse creado en otro proceso: recargar una sola vez por
+            # versión, para que los ids inexistentes no consulten cada vez
+            objeto = self._cargar(modelo, forzar=True)[1].get(pk)
+        return objeto
+
+    def id_por_nombre(self, modelo, *llave):
+        """Retorna el id a partir del nombre (o de la llave natural para Grado y Curso)."""
+        llave = llave[0] if len(llave) == 1 else llave
+        return self._cargar(modelo)[2].get(llave)
+
+    def todos(self, modelo):
+        """Retorna todos los objetos del modelo ordenados por id."""
+        return list(self._cargar(modelo)[1].values())
+
+    def precargar(self, *modelos):
+        """Carga por adelantado los modelos dados, verificando ya su versión."""
+        for modelo in modelos:
+            self._verificado.pop(modelo, None)
+            self._cargar(modelo)
+
+    def invalidar(self, modelo=None):
+        if modelo is None:
+            self._datos.clear()
+        else:
+            self._datos.pop(modelo, None)
+
+    def _cargar(self, modelo, forzar=False):
+        datos = self._datos.get(modelo)
+        ahora = time.monotonic()
+        if (not forzar and datos is not None
+                and ahora - self._verificado.get(modelo, float('-inf')) < self.intervalo):
+            return datos
+        version = cache_utils.obtener_version(modelo)
+        self._verificado[modelo] = ahora
+        if forzar or datos is None or datos[0] != version:
+            objetos = modelo.objects.order_by('id')
+            por_id = {objeto.id: objeto for objeto in objetos}
+            por_llave = {self._llave_natural(objeto): objeto.id
+                         for objeto in por_id.values()}
+            self._datos[modelo] = datos = (version, por_id, por_llave, forzar)
+        return datos
+
+    @staticmethod
+    def _llave_natural(objeto):
+        # Grado y Curso se repiten por nivel: su llave incluye el nivel
+        if hasattr(objeto, 'numero'):
+            return (objeto.numero, objeto.nivel_id)
+        if hasattr(objeto, 'nivel_id'):
+            return (objeto.nombre, objeto.nivel_id)
+        return objeto.nombre
+
+
+registro = RegistroReferencia(
+    intervalo=getattr(settings, 'REGISTRO_VERIFICACION_INTERVALO', 1.0))
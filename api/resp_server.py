@@ -0,0 +1,138 @@
+import asyncio
+import threading
+
+
+class ServidorRESP:
+    """Servidor mínimo compatible con Redis para pruebas y benchmarks locales.
+
+    Implementa solo lo que usa `channels_redis.pubsub.RedisPubSubChannelLayer`:
+    PUBLISH, SUBSCRIBE, UNSUBSCRIBE y PING, además de responder OK a los
+    comandos de conexión de redis-py (CLIENT, SELECT). No reemplaza a Redis en
+    producción: no tiene persistencia ni el resto de comandos.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        # canal -> conjunto de writers suscritos
+        self._suscriptores = {}
+        self._conexiones = set()
+        self._servidor = None
+
+    @property
+    def url(self):
+        return f'redis://{self.host}:{self.port}/0'
+
+    async def iniciar(self):
+        self._servidor = await asyncio.start_server(
+            self._atender, self.host, self.port)
+        self.port = self._servidor.sockets[0].getsockname()[1]
+        return self.url
+
+    async def detener(self):
+        if self._servidor is not None:
+            self._servidor.close()
+            for writer in list(self._conexiones):
+                writer.close()
+            await self._servidor.wait_closed()
+
+    async def _atender(self, reader, writer):
+        canales = set()
+        self._conexiones.add(writer)
+        try:
+            while True:
+                comando = await self._leer_comando(reader)
+                if comando is None:
+                    break
+                self._ejecutar(comando, canales, writer)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for canal in canales:
+                self._suscriptores.get(canal, set()).discard(writer)
+            self._conexiones.discard(writer)
+            writer.close()
+
+    def _ejecutar(self, comando, canales, writer):
+        nombre = comando[0].upper()
+        argumentos = comando[1:]
+
+        if nombre == b'PUBLISH':
+            canal, mensaje = argumentos
+            suscriptores = self._suscriptores.get(canal, ())
+            for suscriptor in suscriptores:
+                suscriptor.write(_arreglo([b'message', canal, mensaje]))
+            writer.write(b':%d\r\n' % len(suscriptores))
+        elif nombre == b'SUBSCRIBE':
+            for canal in argumentos:
+                canales.add(canal)
+                self._suscriptores.setdefault(canal, set()).add(writer)
+                writer.write(_arreglo([b'subscribe', canal, len(canales)]))
+        elif nombre == b'UNSUBSCRIBE':
+            for canal in argumentos or list(canales):
+                canales.discard(canal)
+                self._suscriptores.get(canal, set()).discard(writer)
+                writer.write(_arreglo([b'unsubscribe', canal, len(canales)]))
+        elif nombre == b'PING':
+            if canales:
+                writer.write(_arreglo([b'pong', argumentos[0] if argumentos else b'']))
+            else:
+                writer.write(b'+PONG\r\n')
+        elif nombre in (b'CLIENT', b'SELECT', b'FLUSHALL', b'FLUSHDB', b'QUIT'):
+            writer.write(b'+OK\r\n')
+        else:
+            writer.write(b"-ERR unknown command '%s'\r\n" % nombre)
+
+    @staticmethod
+    async def _leer_comando(reader):
+        linea = await reader.readline()
+        if not linea:
+            return None
+        if not linea.startswith(b'*'):
+            # Comando en línea, por ejemplo desde redis-cli o telnet
+            return linea.split()
+        partes = []
+        for _ in range(int(linea[1:])):
+            longitud = int((await reader.readline())[1:])
+            partes.append((await reader.readexactly(longitud + 2))[:-2])
+        return partes
+
+
+def _arreglo(elementos):
+    """Codifica una lista de bytes/enteros como un arreglo RESP."""
+    salida = [b'*%d\r\n' % len(elementos)]
+    for elemento in elementos:
+        if isinstance(elemento, int):
+            salida.append(b':%d\r\n' % elemento)
+        else:
+            salida.append(b'$%d\r\n%s\r\n' % (len(elemento), elemento))
+    return b''.join(salida)
+
+
+def iniciar_en_hilo(host='127.0.0.1', port=0):
+    """Inicia un ServidorRESP en un hilo con su propio event loop.
+
+    Returns:
+        tuple: (url del servidor, función para detenerlo).
+    """
+    servidor = ServidorRESP(host, port)
+    loop = asyncio.new_event_loop()
+    listo = threading.Event()
+
+    def ejecutar():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(servidor.iniciar())
+        listo.set()
+        loop.run_forever()
+
+    hilo = threading.Thread(target=ejecutar, daemon=True)
+    hilo.start()
+    listo.wait()
+
+    def detener():
+        asyncio.run_coroutine_threadsafe(servidor.detener(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        hilo.join()
+
+    return servidor.url, detener
@@ -0,0 +1,104 @@
+from django.db.models import Prefetch
+
+from .models import Apoderado, Aula, AulaCurso, Estudiante
+from .models_extra import Grado, Seccion
+from .registro import registro
+from .serializer import AulaSerializer
+
+
+def construir_roster_docente(docente_id):
+    """Construye la lista de aulas de un docente con sus estudiantes y apoderados.
+
+    Carga aulas, estudiantes, apoderados y usuarios en un número fijo de
+    consultas (3), sin importar la cantidad de aulas o estudiantes.
+
+    Returns:
+        list: Aulas serializadas, o una lista vacía si el docente no tiene aulas.
+    """
+    apoderados = Apoderado.objects.select_related('usuario').order_by('id')
+    estudiantes = Estudiante.objects.order_by('id').prefetch_related(
+        Prefetch('apoderados', queryset=apoderados))
+    aulas = Aula.objects.filter(
+        id__in=AulaCurso.objects.filter(
+            docente_id=docente_id).values('aula_id')
+    ).prefetch_related(
+        Prefetch('estudiante_set', queryset=estudiantes)).order_by('id')
+
+    resultado = []
+    for aula in aulas:
+        estudiantes_data = []
+        apoderados_id = set()
+
+        for estudiante in aula.estudiante_set.all():
+            apoderados_data = []
+            for apoderado in estudiante.apoderados.all():
+                apoderados_id.add(apoderado.usuario_id)
+                apoderados_data.append({
+                    'usuario_id': apoderado.usuario_id,
+                    'nombres': apoderado.nombres,
+                    'apellidos': apoderado.apellidos,
+                    'email': apoderado.usuario.email,
+                })
+
+            estudiantes_data.append({
+                'id': estudiante.id,
+                'nombres': estudiante.nombres,
+                'apellidos': estudiante.apellidos,
+                'genero': estudiante.genero_id,
+                'apoderados': apoderados_data,
+            })
+
+        resultado.append({
+            'id': aula.id,
+            'nombre': aula.nombre,
+            'grado': str(registro.obtener(Grado, aula.grado_id)),
+            'seccion': registro.obtener(Seccion, aula.seccion_id).nombre if aula.seccion_id else None,
+            'estudiantes': estudiantes_data,
+            'apoderados': len(apoderados_id),
+        })
+    return resultado
+
+
+def construir_familia_apoderado(apoderado_id):
+    """Construye la lista de estudiantes de un apoderado con su aula y docentes.
+
+    Las aulas y sus docentes se cargan una sola vez y se comparten entre
+    hermanos que estudian en la misma aula (2 consultas en total).
+
+    Returns:
+        list: Estudiantes serializados, o una lista vacía si el apoderado no tiene estudiantes.
+    """
+    estudiantes = list(Estudiante.obtener_estudiantes_por_apoderado(
+        apoderado_id=apoderado_id).select_related('aula').order_by('id'))
+    if not estudiantes:
+        return []
+
+    # Serializar cada aula una sola vez
+    aulas_info = {}
+    docentes_por_aula = {}
+    for estudiante in estudiantes:
+        if estudiante.aula_id not in aulas_info:
+            aulas_info[estudiante.aula_id] = AulaSerializer(estudiante.aula).data
+            docentes_por_aula[estudiante.aula_id] = []
+
+    # Docentes de todas las aulas en una sola consulta
+    aula_cursos = AulaCurso.objects.filter(
+        aula_id__in=aulas_info.keys()).select_related('docente__usuario').order_by('id')
+    for aula_curso in aula_cursos:
+        docente = aula_curso.docente
+        docentes_por_aula[aula_curso.aula_id].append({
+            'usuario_id': docente.usuario_id,
+            'nombres': docente.nombres,
+            'apellidos': docente.apellidos,
+            'email': docente.usuario.email,
+            'curso': docente.curso_id,
+        })
+
+    return [{
+        'id': estudiante.id,
+        'nombres': estudiante.nombres,
+        'apellidos': estudiante.apellidos,
+        'genero': estudiante.genero_id,
+        'aula': aulas_info[estudiante.aula_id],
+        'docentes': docentes_por_aula[estudiante.aula_id],
+    } for estudiante in estudiantes]
@@ -1,8 +1,11 @@
 from django.urls import re_path
-from .consumers import ChatConsumer,OnlineStatusConsumer
+from .consumers import ChatConsumer,OnlineStatusConsumer,UsuarioConsumer
 
 websocket_urlpatterns = [
     re_path(r'ws/chat/(?P<user1_id>\d+)-(?P<user2_id>\d+)/$', ChatConsumer.as_asgi()),
                          
     re_path(r'ws/chat/online/(?P<aula_id>\w+)/$', OnlineStatusConsumer.as_asgi()),
+
+    # Un solo socket por usuario para todos sus chats y aulas
+    re_path(r'ws/usuario/$', UsuarioConsumer.as_asgi()),
 ]
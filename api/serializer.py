@@ -3,7 +3,8 @@ from .models import (Apoderado, Estudiante, Docente, Aula, Docente, Tarea,
                      Asistencia, Calificacion, Mensaje, Conversacion, Imagen, Noticia)
 
 from .models_extra import (
-    CategoriaNoticia, NivelEducativo, Genero, Curso, EstadoAsistencia, EstadoTarea)
+    CategoriaNoticia, NivelEducativo, Genero, Curso, EstadoAsistencia, EstadoTarea, Grado, Seccion)
+from .registro import registro
 
 
 class ApoderadoSerializer(serializers.ModelSerializer):
@@ -50,10 +51,10 @@ class AulaSerializer(serializers.ModelSerializer):
         fields = ['id', 'nombre', 'grado', 'seccion']
 
     def get_grado(self, obj):
-        return str(obj.grado)
+        return str(registro.obtener(Grado, obj.grado_id))
 
     def get_seccion(self, obj):
-        return str(obj.seccion)
+        return str(registro.obtener(Seccion, obj.seccion_id))
 
 
 class TareaSerializer(serializers.ModelSerializer):
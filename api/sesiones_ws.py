@@ -0,0 +1,106 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Usuario
+
+# Datos del usuario que necesitan los consumers; inmutable para poder compartirlo
+UsuarioWS = namedtuple(
+    'UsuarioWS', ['id', 'is_docente', 'is_apoderado', 'is_staff', 'is_active'])
+
+
+def parametro_desde_scope(scope, nombre):
+    """Retorna un parámetro del query string del WebSocket, o None."""
+    parametros = parse_qs(scope.get('query_string', b'').decode())
+    return parametros.get(nombre, [None])[0]
+
+
+def token_desde_scope(scope):
+    """Retorna el parámetro `token` del query string del WebSocket, o None."""
+    return parametro_desde_scope(scope, 'token')
+
+
+class CacheUsuariosWS:
+    """Usuarios ya autenticados por token, para las reconexiones de WebSocket.
+
+    Guarda por `ttl` segundos (nunca más allá del vencimiento del token) un
+    `UsuarioWS` por cada token válido, de modo que al reconectarse con el
+    mismo token no se valida de nuevo ni se consulta la base de datos. Guarda
+    como máximo `limite` tokens y descarta el usado hace más tiempo (LRU). Se
+    descarta lo guardado de un usuario cuando este se modifica o elimina en
+    este proceso; en otros procesos el cambio se ve al vencer el `ttl`.
+    """
+
+    # Cantidad máxima de tokens; al superarla se descarta el usado hace más tiempo
+    LIMITE = 10000
+
+    def __init__(self, ttl=60, limite=None):
+        self.ttl = ttl
+        self.limite = limite or self.LIMITE
+        # hash del token -> (expira, UsuarioWS), del usado hace más tiempo al más reciente
+        self._tokens = OrderedDict()
+        # id de usuario -> hashes de sus tokens, para invalidar sin recorrer todo
+        self._por_usuario = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def obtener(self, token):
+        clave = _clave_token(token)
+        with self._lock:
+            entrada = self._tokens.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] <= time.time():
+                self._descartar(clave)
+                return None
+            self._tokens.move_to_end(clave)
+        return entrada[1]
+
+    def guardar(self, token, usuario, vencimiento_token):
+        clave = _clave_token(token)
+        expira = min(time.time() + self.ttl, vencimiento_token)
+        with self._lock:
+            self._descartar(clave)
+            self._tokens[clave] = (expira, usuario)
+            self._por_usuario[usuario.id].add(clave)
+            while len(self._tokens) > self.limite:
+                self._descartar(next(iter(self._tokens)))
+
+    def invalidar(self, usuario_id=None):
+        with self._lock:
+            if usuario_id is None:
+                self._tokens.clear()
+                self._por_usuario.clear()
+            else:
+                for clave in self._por_usuario.pop(usuario_id, ()):
+                    self._tokens.pop(clave, None)
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def _descartar(self, clave):
+        entrada = self._tokens.pop(clave, None)
+        if entrada is not None:
+            claves = self._por_usuario.get(entrada[1].id)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del self._por_usuario[entrada[1].id]
+
+
+def _clave_token(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+usuarios_ws = CacheUsuariosWS(ttl=getattr(settings, 'WS_USUARIO_CACHE_TTL', 60))
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_usuario_ws(sender, instance, **kwargs):
+    usuarios_ws.invalidar(instance.id)
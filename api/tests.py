@@ -1,3 +1,1419 @@
-from django.test import TestCase
+import asyncio
+import io
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from channels_redis.pubsub import RedisPubSubChannelLayer
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import cache as cache_utils
+from .carga_ws import PruebaCarga, preparar_datos
+from .cola_mensajes import ColaMensajes
+from .contadores import BufferVistas
+from .helper_functions import BHelperFunctions
+from .historial_chat import HistorialChat, par_de_usuarios
+from .metricas import percentil
+from .models import (Administrador, Apoderado, Asistencia, Aula, AulaCurso, Calificacion, Conversacion, Docente, Estudiante,
+                     Imagen, Mensaje, Noticia, ResumenAsistencia, ResumenAsistenciaAula,
+                     ResumenAsistenciaEstudiante, SesionPresencia, Usuario, WorkerPresencia)
+from .models_extra import (MODELOS_CATALOGO, Curso, EstadoAsistencia, Genero, Grado,
+                           NivelEducativo, Seccion)
+from .presencia import DifusorPresencia, RegistroPresencia, presencia
+from .registro import RegistroReferencia, registro
+from .resp_server import iniciar_en_hilo
+from .routing import websocket_urlpatterns
+from .sesiones_ws import CacheUsuariosWS, UsuarioWS, token_desde_scope, usuarios_ws
+from .roster import construir_familia_apoderado, construir_roster_docente
+from .views import (AsistenciaViewSet, AulasPorDocenteView, CalificacionView, ConversacionView, GeneroView,
+                    MensajeView)
+
+
+class ColegioTestMixin:
+    """Utilidades para crear los datos mínimos de un colegio en las pruebas."""
+
+    def setUp(self):
+        self.primaria = NivelEducativo.objects.get(nombre='Primaria')
+        # El registro se carga antes de medir consultas y no vuelve a verificar
+        # la versión durante la prueba, para que las cantidades no dependan del tiempo
+        patcher = mock.patch.object(registro, 'intervalo', 3600)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        registro.precargar(*MODELOS_CATALOGO)
+
+    def crear_docente(self, email='docente@colegio.pe', curso=None):
+        usuario = Usuario.objects.create_docente(email=email)
+        curso = curso or Curso.objects.filter(nivel=self.primaria).first()
+        return Docente.objects.create(
+            usuario=usuario, nombres='Ana', apellidos='Rojas', telefono='999',
+            direccion='Lima', fecha_nacimiento=date(1985, 1, 1), curso=curso)
+
+    def crear_aula(self, numero, seccion='A', docentes=()):
+        grado = Grado.objects.get(numero=numero, nivel=self.primaria)
+        aula = Aula.objects.create(
+            nombre=f'Aula {numero}{seccion}', grado=grado,
+            seccion=Seccion.objects.get(nombre=seccion))
+        for docente in docentes:
+            AulaCurso.objects.create(aula=aula, docente=docente)
+        return aula
+
+    def crear_estudiante(self, aula, apoderados=1):
+        self._dni = getattr(self, '_dni', 10000000) + 1
+        estudiante = Estudiante.objects.create(
+            nombres='Luis', apellidos='Quispe', fecha_nacimiento=date(2015, 5, 5),
+            dni=str(self._dni), genero=Genero.objects.first(), aula=aula)
+        for _ in range(apoderados):
+            self.crear_apoderado(estudiante)
+        return estudiante
+
+    def crear_apoderado(self, *estudiantes):
+        self._apoderados = getattr(self, '_apoderados', 0) + 1
+        usuario = Usuario.objects.create_apoderado(
+            email=f'apoderado{self._apoderados}@colegio.pe')
+        apoderado = Apoderado.objects.create(
+            usuario=usuario, nombres='Rosa', apellidos='Mamani',
+            telefono=str(self._apoderados), direccion='Lima')
+        apoderado.estudiantes.add(*estudiantes)
+        return apoderado
+
+
+class RosterDocenteTests(ColegioTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.docente = self.crear_docente()
+
+    def test_consultas_constantes_al_crecer_el_roster(self):
+        aula = self.crear_aula(1, docentes=[self.docente])
+        self.crear_estudiante(aula)
+        with self.assertNumQueries(3):
+            construir_roster_docente(self.docente.id)
+
+        for numero in range(2, 5):
+            aula = self.crear_aula(numero, docentes=[self.docente])
+            for _ in range(5):
+                self.crear_estudiante(aula, apoderados=2)
+        with self.assertNumQueries(3):
+            resultado = construir_roster_docente(self.docente.id)
+
+        self.assertEqual(len(resultado), 4)
+        self.assertEqual(resultado[-1]['apoderados'], 10)
+        self.assertEqual(len(resultado[-1]['estudiantes'][0]['apoderados']), 2)
+
+    def test_apoderado_compartido_se_cuenta_una_vez(self):
+        aula = self.crear_aula(1, docentes=[self.docente])
+        hermanos = [self.crear_estudiante(aula, apoderados=0) for _ in range(2)]
+        self.crear_apoderado(*hermanos)
+
+        resultado = construir_roster_docente(self.docente.id)
+
+        self.assertEqual(resultado[0]['apoderados'], 1)
+        self.assertEqual(resultado[0]['grado'], '1° Primaria')
+        self.assertEqual(resultado[0]['seccion'], 'A')
+
+    def test_docente_sin_aulas_devuelve_404(self):
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=self.docente.usuario)
+        view = AulasPorDocenteView.as_view({'get': 'retrieve'})
+
+        response = view(request, pk=self.docente.id)
+
+        self.assertEqual(response.status_code, 404)
+
+
+class FamiliaApoderadoTests(ColegioTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.docentes = [
+            self.crear_docente(email=f'docente{i}@colegio.pe', curso=curso)
+            for i, curso in enumerate(Curso.objects.filter(nivel=self.primaria)[:3])]
+
+    def test_consultas_constantes_con_hermanos_en_varias_aulas(self):
+        aula_1 = self.crear_aula(1, docentes=self.docentes)
+        aula_2 = self.crear_aula(2, docentes=self.docentes[:2])
+        apoderado = self.crear_apoderado(self.crear_estudiante(aula_1, apoderados=0))
+        with self.assertNumQueries(2):
+            construir_familia_apoderado(apoderado.id)
+
+        apoderado.estudiantes.add(
+            self.crear_estudiante(aula_1, apoderados=0),
+            self.crear_estudiante(aula_2, apoderados=0),
+            self.crear_estudiante(aula_2, apoderados=0))
+        with self.assertNumQueries(2):
+            resultado = construir_familia_apoderado(apoderado.id)
+
+        self.assertEqual(len(resultado), 4)
+        self.assertEqual([len(e['docentes']) for e in resultado], [3, 3, 2, 2])
+        self.assertEqual(resultado[0]['aula']['grado'], '1° Primaria')
+        self.assertEqual(resultado[0]['docentes'][0]['curso'], self.docentes[0].curso_id)
+
+    def test_apoderado_sin_estudiantes_devuelve_lista_vacia(self):
+        self.assertEqual(construir_familia_apoderado(0), [])
+
+
+class HojaAsistenciaTests(ColegioTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.docente = self.crear_docente()
+        self.aula = self.crear_aula(1, docentes=[self.docente])
+        for _ in range(40):
+            self.crear_estudiante(self.aula, apoderados=0)
+
+    def abrir_hoja(self):
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=self.docente.usuario)
+        view = AsistenciaViewSet.as_view({'get': 'aula'})
+        return view(request, aula_id=self.aula.id)
+
+    def test_abrir_hoja_usa_pocas_consultas(self):
+        # Lectura (2) + transacción con el INSERT de la hoja y dos por cada resumen (6) + relectura
+        with self.assertNumQueries(10):
+            response = self.abrir_hoja()
+        self.assertEqual(len(response.data), 40)
+        estado_falta = EstadoAsistencia.objects.get(nombre='Falto')
+        self.assertTrue(all(fila['estado'] == estado_falta.id for fila in response.data))
+
+        # Una vez creada, la hoja se lee con dos consultas
+        with self.assertNumQueries(2):
+            response = self.abrir_hoja()
+        self.assertEqual(Asistencia.objects.count(), 40)
+
+    def test_completa_solo_las_asistencias_faltantes(self):
+        fecha = timezone.now().date()
+        estudiante = Estudiante.objects.filter(aula=self.aula).first()
+        existente = Asistencia.objects.create(estudiante=estudiante, fecha=fecha)
+
+        hoja = Asistencia.obtener_hoja_del_dia(self.aula.id, fecha)
+
+        self.assertEqual(len(hoja), 40)
+        self.assertEqual(hoja[0][1].id, existente.id)
+        self.assertEqual(Asistencia.objects.count(), 40)
+
+    def actualizar_hoja(self, filas):
+        request = APIRequestFactory().patch('/', filas, format='json')
+        force_authenticate(request, user=self.docente.usuario)
+        view = AsistenciaViewSet.as_view({'patch': 'aula'})
+        return view(request, aula_id=self.aula.id)
+
+    def test_actualizar_hoja_en_bloque(self):
+        filas = self.abrir_hoja().data
+        asistio = EstadoAsistencia.objects.get(nombre='Asistio')
+        cambios = [{'id': fila['id'], 'estado': asistio.id} for fila in filas[:30]]
+
+        # Transacción con la lectura bloqueante, un único bulk_update y tres
+        # consultas por cada resumen, sin importar la cantidad de filas
+        with self.assertNumQueries(10):
+            response = self.actualizar_hoja(cambios)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['resultados']), 30)
+        self.assertEqual(Asistencia.objects.filter(estado=asistio).count(), 30)
+
+    def test_fila_invalida_no_guarda_ninguna(self):
+        filas = self.abrir_hoja().data
+        asistio = EstadoAsistencia.objects.get(nombre='Asistio')
+        cambios = [{'id': filas[0]['id'], 'estado': asistio.id},
+                   {'id': filas[1]['id'], 'estado': 9999},
+                   {'id': 9999, 'estado': asistio.id}]
+
+        response = self.actualizar_hoja(cambios)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r['status'] for r in response.data['resultados']],
+                         ['no aplicado', 'error', 'error'])
+        self.assertFalse(Asistencia.objects.filter(estado=asistio).exists())
+
+    def test_no_permite_asistencias_duplicadas(self):
+        estudiante = Estudiante.objects.filter(aula=self.aula).first()
+        Asistencia.objects.create(estudiante=estudiante, fecha=date(2024, 3, 1))
+        with self.assertRaises(IntegrityError):
+            Asistencia.objects.create(estudiante=estudiante, fecha=date(2024, 3, 1))
+
+
+class LibretaCalificacionesTests(ColegioTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.docente = self.crear_docente()
+        self.curso = self.docente.curso
+        self.aula = self.crear_aula(1, docentes=[self.docente])
+        for _ in range(35):
+            self.crear_estudiante(self.aula, apoderados=0)
+
+    def llamar(self, metodo, filas=None, curso_id=None):
+        factory = APIRequestFactory()
+        request = (factory.get('/') if metodo == 'get'
+                   else factory.patch('/', filas, format='json'))
+        force_authenticate(request, user=self.docente.usuario)
+        view = CalificacionView.as_view({metodo: 'libreta'})
+        return view(request, aula_id=self.aula.id, curso_id=curso_id or self.curso.id)
+
+    def test_abrir_libreta_usa_pocas_consultas(self):
+        with self.assertNumQueries(5):
+            response = self.llamar('get')
+        self.assertEqual(len(response.data), 35)
+        self.assertEqual(response.data[0]['promedio'], '0.0')
+
+        # Una vez creada, la libreta se lee con tres consultas
+        with self.assertNumQueries(3):
+            self.llamar('get')
+        self.assertEqual(Calificacion.objects.count(), 35)
+
+    def test_actualizar_libreta_en_bloque(self):
+        filas = self.llamar('get').data
+        estudiante = Estudiante.objects.create(
+            nombres='Nuevo', apellidos='Alumno', fecha_nacimiento=date(2015, 1, 1),
+            dni='20000000', aula=self.aula)
+        cambios = [{'estudiante': fila['estudiante_id'], 'calificacion_1': 12, 'calificacion_2': '16'}
+                   for fila in filas]
+        cambios.append({'estudiante': estudiante.id, 'calificacion_4': 20})
+
+        # Validación (3) + transacción con un upsert para las existentes y otro para las nuevas
+        with self.assertNumQueries(7):
+            response = self.llamar('patch', cambios)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['resultados'][-1]['status'], 'creado')
+        self.assertEqual(set(Calificacion.objects.exclude(estudiante=estudiante)
+                             .values_list('promedio', flat=True)), {7.0})
+        nueva = Calificacion.objects.get(estudiante=estudiante)
+        self.assertEqual(nueva.promedio, 5.0)
+        self.assertEqual(response.data['resultados'][-1]['id'], nueva.id)
+
+        # Reenviar las mismas notas no modifica nada
+        response = self.llamar('patch', cambios[:2])
+        self.assertEqual([r['status'] for r in response.data['resultados']],
+                         ['sin cambios', 'sin cambios'])
+
+    def test_fila_invalida_no_guarda_ninguna(self):
+        filas = self.llamar('get').data
+        cambios = [{'estudiante': filas[0]['estudiante_id'], 'calificacion_1': 15},
+                   {'estudiante': filas[1]['estudiante_id'], 'calificacion_1': 25},
+                   {'estudiante': 9999, 'calificacion_1': 10}]
+
+        response = self.llamar('patch', cambios)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r['status'] for r in response.data['resultados']],
+                         ['actualizado', 'error', 'error'])
+        self.assertFalse(Calificacion.objects.exclude(calificacion_1=0).exists())
+
+    def test_curso_de_otro_nivel(self):
+        secundaria = NivelEducativo.objects.get(nombre='Secundaria')
+        curso = Curso.objects.filter(nivel=secundaria).first()
+
+        response = self.llamar('get', curso_id=curso.id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Calificacion.objects.exists())
+
+
+    def obtener_calificacion(self, **parametros):
+        request = APIRequestFactory().get('/', parametros)
+        force_authenticate(request, user=self.docente.usuario)
+        return CalificacionView.as_view({'get': 'list'})(request)
+
+    def test_obtener_calificacion_la_crea_si_no_existe(self):
+        estudiante = Estudiante.objects.filter(aula=self.aula).first()
+
+        response = self.obtener_calificacion(curso=str(self.curso.id), estudiante=str(estudiante.id))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['promedio'], '0.0')
+        self.assertTrue(Calificacion.objects.filter(estudiante=estudiante, curso=self.curso).exists())
+        self.assertEqual(self.obtener_calificacion(curso='x', estudiante=estudiante.id).status_code, 400)
+        self.assertEqual(self.obtener_calificacion(curso=self.curso.id, estudiante=9999).status_code, 404)
+
+        secundaria = NivelEducativo.objects.get(nombre='Secundaria')
+        curso = Curso.objects.filter(nivel=secundaria).first()
+        self.assertEqual(self.obtener_calificacion(curso=curso.id, estudiante=estudiante.id).status_code, 400)
+
+
+class AnaliticaCalificacionesTests(ColegioTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.docente = self.crear_docente()
+        self.curso = self.docente.curso
+        self.aula = self.crear_aula(1, docentes=[self.docente])
+        self.estudiantes = [self.crear_estudiante(self.aula, apoderados=0) for _ in range(5)]
+        for estudiante, nota in zip(self.estudiantes, (8, 12, 12, 16, 20)):
+            Calificacion.objects.create(
+                estudiante=estudiante, curso=self.curso, calificacion_1=nota,
+                calificacion_2=nota, calificacion_3=nota, calificacion_4=nota)
+
+    def estadisticas(self, **parametros):
+        request = APIRequestFactory().get('/', parametros)
+        force_authenticate(request, user=self.docente.usuario)
+        return CalificacionView.as_view({'get': 'estadisticas'})(request)
+
+    def test_estadisticas_del_aula_y_curso(self):
+        with self.assertNumQueries(1):
+            response = self.estadisticas(aula=self.aula.id, curso=self.curso.id)
+
+        datos = response.data
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((datos['cantidad'], datos['media'], datos['mediana']), (5, 13.6, 12))
+        self.assertEqual(datos['desviacion'], 4.08)
+        self.assertEqual(datos['tasa_aprobacion'], 0.8)
+        self.assertEqual([h['cantidad'] for h in datos['histograma']], [0, 0, 1, 2, 2])
+        self.assertEqual([(r['puesto'], r['promedio']) for r in datos['ranking']],
+                         [(1, 20), (2, 16), (3, 12), (3, 12), (5, 8)])
+
+    def test_cache_se_invalida_al_cambiar_calificaciones(self):
+        self.estadisticas(aula=self.aula.id)
+        with self.assertNumQueries(0):
+            self.estadisticas(aula=self.aula.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Calificacion.actualizar_notas(self.aula.id, self.curso.id, [
+                {'estudiante': self.estudiantes[0].id, 'calificacion_1': 20}])
+        response = self.estadisticas(aula=self.aula.id)
+        self.assertEqual(response.data['ranking'][-1]['promedio'], 11)
+        self.assertEqual(response.data['tasa_aprobacion'], 1)
+
+    def test_excluye_las_notas_que_la_libreta_crea_sin_ingresar(self):
+        nuevo = self.crear_estudiante(self.aula, apoderados=0)
+        Calificacion.obtener_libreta(self.aula.id, self.curso.id)
+
+        response = self.estadisticas(aula=self.aula.id, curso=self.curso.id)
+        self.assertEqual((response.data['cantidad'], response.data['media']), (5, 13.6))
+
+        # Confirmar un 0 desde la libreta sí lo cuenta como ingresado
+        with self.captureOnCommitCallbacks(execute=True):
+            Calificacion.actualizar_notas(self.aula.id, self.curso.id, [
+                {'estudiante': nuevo.id, 'calificacion_1': 0}])
+        response = self.estadisticas(aula=self.aula.id, curso=self.curso.id)
+        self.assertEqual(response.data['cantidad'], 6)
+        self.assertEqual(response.data['ranking'][-1]['estudiante_id'], nuevo.id)
+
+    def test_obtener_una_calificacion_nueva_no_cambia_las_estadisticas(self):
+        nuevo = self.crear_estudiante(self.aula, apoderados=0)
+        request = APIRequestFactory().get('/', {'curso': self.curso.id, 'estudiante': nuevo.id})
+        force_authenticate(request, user=self.docente.usuario)
+
+        response = CalificacionView.as_view({'get': 'list'})(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Calificacion.objects.get(estudiante=nuevo).ingresada)
+        response = self.estadisticas(aula=self.aula.id, curso=self.curso.id)
+        self.assertEqual((response.data['cantidad'], response.data['media']), (5, 13.6))
+
+    def test_requiere_un_filtro(self):
+        self.assertEqual(self.estadisticas().status_code, 400)
+        self.assertEqual(self.estadisticas(aula='x').status_code, 400)
+        self.assertEqual(self.estadisticas(grado=9999).data['cantidad'], 0)
+
+
+class ValidacionNivelesTests(ColegioTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.docente = self.crear_docente()
+        secundaria = NivelEducativo.objects.get(nombre='Secundaria')
+        self.curso_secundaria = Curso.objects.filter(nivel=secundaria).first()
+        self.docente_secundaria = self.crear_docente(
+            email='secundaria@colegio.pe', curso=self.curso_secundaria)
+        self.aulas = [self.crear_aula(numero) for numero in range(1, 6)]
+
+    def test_aula_curso_valida_en_lote_con_consultas_constantes(self):
+        pares = [(aula.id, docente.id) for aula in self.aulas
+                 for docente in (self.docente, self.docente_secundaria)]
+
+        with self.assertNumQueries(2):
+            errores = AulaCurso.validar_niveles(pares)
+
+        self.assertEqual(set(errores), {(aula.id, self.docente_secundaria.id) for aula in self.aulas})
+        with self.assertRaises(ValidationError):
+            AulaCurso(aula=self.aulas[0], docente=self.docente_secundaria).clean()
+
+    def test_calificacion_valida_en_lote_con_una_consulta(self):
+        estudiantes = [self.crear_estudiante(aula, apoderados=0) for aula in self.aulas]
+        pares = [(estudiante.id, curso.id) for estudiante in estudiantes
+                 for curso in (self.docente.curso, self.curso_secundaria)]
+
+        with self.assertNumQueries(1):
+            errores = Calificacion.validar_niveles(pares)
+
+        self.assertEqual(set(errores), {(e.id, self.curso_secundaria.id) for e in estudiantes})
+
+    def test_guardar_calificacion_valida_con_una_consulta(self):
+        estudiante = self.crear_estudiante(self.aulas[0], apoderados=0)
+
+        # Validación + INSERT
+        with self.assertNumQueries(2):
+            Calificacion.objects.create(estudiante=estudiante, curso=self.docente.curso)
+        with self.assertRaises(ValidationError):
+            Calificacion.objects.create(estudiante=estudiante, curso=self.curso_secundaria)
+
+
+class ResumenAsistenciaTests(ColegioTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.docente = self.crear_docente()
+        self.aula = self.crear_aula(1, docentes=[self.docente])
+        self.estudiantes = [self.crear_estudiante(self.aula, apoderados=0) for _ in range(4)]
+        self.asistio = EstadoAsistencia.objects.get(nombre='Asistio')
+        self.falto = EstadoAsistencia.objects.get(nombre='Falto')
+        self.tarde = EstadoAsistencia.objects.get(nombre='Tarde')
+
+    def resumenes(self):
+        return (
+            sorted(ResumenAsistenciaAula.objects.filter(cantidad__gt=0).values_list(
+                'aula_id', 'fecha', 'estado_id', 'cantidad')),
+            sorted(ResumenAsistenciaEstudiante.objects.filter(cantidad__gt=0).values_list(
+                'estudiante_id', 'mes', 'estado_id', 'cantidad')),
+        )
+
+    def resumen(self, **parametros):
+        request = APIRequestFactory().get('/', parametros)
+        force_authenticate(request, user=self.docente.usuario)
+        return AsistenciaViewSet.as_view({'get': 'resumen'})(request)
+
+    def test_se_mantiene_al_registrar_asistencias(self):
+        hoy = timezone.now().date()
+        hoja = Asistencia.obtener_hoja_del_dia(self.aula.id, hoy)
+        Asistencia.actualizar_estados(self.aula.id, [
+            {'id': hoja[0][1].id, 'estado': self.asistio.id},
+            {'id': hoja[1][1].id, 'estado': self.tarde.id}])
+        # Días anteriores registrados uno por uno
+        anterior = Asistencia.objects.create(
+            estudiante=self.estudiantes[0], fecha=date(2024, 3, 4), estado=self.falto)
+        anterior.estado = self.asistio
+        anterior.save()
+        Asistencia.objects.create(estudiante=self.estudiantes[1], fecha=date(2024, 3, 5))
+        Asistencia.objects.filter(estudiante=self.estudiantes[1], fecha=date(2024, 3, 5)).delete()
+
+        por_aula, por_estudiante = self.resumenes()
+        self.assertIn((self.aula.id, hoy, self.falto.id, 2), por_aula)
+        self.assertIn((self.aula.id, date(2024, 3, 4), self.asistio.id, 1), por_aula)
+        self.assertNotIn(date(2024, 3, 5), [fila[1] for fila in por_aula])
+        self.assertIn((self.estudiantes[1].id, hoy.replace(day=1), self.tarde.id, 1), por_estudiante)
+
+        # Lo mantenido incrementalmente coincide con la reconstrucción
+        ResumenAsistencia.reconstruir()
+        self.assertEqual(self.resumenes(), (por_aula, por_estudiante))
+
+    def test_eliminar_estudiante_descuenta_su_aula(self):
+        Asistencia.obtener_hoja_del_dia(self.aula.id, date(2024, 3, 4))
+        self.estudiantes[0].delete()
+
+        por_aula, _ = self.resumenes()
+        self.assertEqual(por_aula, [(self.aula.id, date(2024, 3, 4), self.falto.id, 3)])
+
+    def test_cambiar_de_aula_mueve_sus_asistencias(self):
+        otra_aula = self.crear_aula(1, seccion='B')
+        Asistencia.obtener_hoja_del_dia(self.aula.id, date(2024, 3, 4))
+        estudiante = self.estudiantes[0]
+
+        estudiante.aula = otra_aula
+        estudiante.save()
+
+        por_aula, por_estudiante = self.resumenes()
+        self.assertEqual(por_aula, sorted([(self.aula.id, date(2024, 3, 4), self.falto.id, 3),
+                                           (otra_aula.id, date(2024, 3, 4), self.falto.id, 1)]))
+        ResumenAsistencia.reconstruir()
+        self.assertEqual(self.resumenes(), (por_aula, por_estudiante))
+
+    def test_hoja_que_no_se_puede_completar_responde_409(self):
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=self.docente.usuario)
+
+        with mock.patch.object(Asistencia.objects, 'bulk_create', side_effect=IntegrityError):
+            response = AsistenciaViewSet.as_view({'get': 'aula'})(request, aula_id=self.aula.id)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Asistencia.objects.exists())
+
+    def test_resumen_mensual_del_estudiante(self):
+        estudiante = self.estudiantes[0]
+        for dia, estado in ((4, self.asistio), (5, self.tarde), (6, self.falto), (7, self.asistio)):
+            Asistencia.objects.create(estudiante=estudiante, fecha=date(2024, 3, dia), estado=estado)
+        Asistencia.objects.create(estudiante=estudiante, fecha=date(2024, 4, 1), estado=self.falto)
+
+        with self.assertNumQueries(1):
+            response = self.resumen(estudiante=estudiante.id, desde='2024-03-15', hasta='2024-03-31')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{
+            'mes': date(2024, 3, 1), 'total': 4, 'tasa_asistencia': 0.75,
+            'estados': {self.asistio.id: 2, self.tarde.id: 1, self.falto.id: 1}}])
+        self.assertEqual(self.resumen(aula=self.aula.id, desde='marzo').status_code, 400)
+        self.assertEqual(len(self.resumen(aula=self.aula.id).data), 5)
+
+
+class ConversacionTestMixin(ColegioTestMixin):
+    def setUp(self):
+        super().setUp()
+        self.docente = self.crear_docente().usuario
+
+    def crear_conversacion(self, mensajes=1):
+        apoderado = self.crear_apoderado().usuario
+        conversacion = Conversacion.objects.create(
+            participante_1=self.docente, participante_2=apoderado)
+        for i in range(mensajes):
+            Mensaje.objects.create(emisor=self.docente, receptor=apoderado,
+                                   conversacion=conversacion, contenido=f'Mensaje {i}')
+        return conversacion
+
+
+class BandejaConversacionesTests(ConversacionTestMixin, TestCase):
+    def listar(self, **params):
+        request = APIRequestFactory().get('/', params)
+        force_authenticate(request, user=self.docente)
+        return ConversacionView.as_view({'get': 'list'})(request)
+
+    def test_consultas_constantes_al_crecer_la_bandeja(self):
+        self.crear_conversacion(mensajes=2)
+        with self.assertNumQueries(2):
+            self.listar()
+
+        for _ in range(5):
+            self.crear_conversacion(mensajes=3)
+        with self.assertNumQueries(2):
+            response = self.listar()
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual(response.data[0]['mensaje_reciente']['contenido'], 'Mensaje 2')
+
+    def test_ordena_por_actividad_reciente_y_pagina(self):
+        antigua = self.crear_conversacion()
+        self.crear_conversacion(mensajes=0)
+        self.crear_conversacion()
+        Mensaje.objects.create(emisor=self.docente, receptor=antigua.participante_2,
+                               conversacion=antigua, contenido='Nuevo')
+
+        response = self.listar(limit=2, offset=0)
+
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+        primera = response.data['results'][0]
+        self.assertEqual(primera['conversacion']['id'], antigua.id)
+        self.assertEqual(primera['mensaje_reciente']['contenido'], 'Nuevo')
+
+    def test_eliminar_el_ultimo_mensaje_recalcula_la_referencia(self):
+        conversacion = self.crear_conversacion(mensajes=2)
+        conversacion.refresh_from_db()
+        conversacion.ultimo_mensaje.delete()
+
+        conversacion.refresh_from_db()
+        self.assertEqual(conversacion.ultimo_mensaje.contenido, 'Mensaje 0')
+
+
+class HistorialMensajesTests(ConversacionTestMixin, TestCase):
+    def historial(self, conversacion, **params):
+        request = APIRequestFactory().get('/', params)
+        force_authenticate(request, user=self.docente)
+        return ConversacionView.as_view({'get': 'mensajes'})(request, pk=conversacion.id)
+
+    def test_recorre_el_historial_hacia_atras(self):
+        conversacion = self.crear_conversacion(mensajes=7)
+
+        with self.assertNumQueries(3):
+            pagina = self.historial(conversacion, limit=3).data
+        contenidos = [m['contenido'] for m in pagina['results']]
+        self.assertEqual(contenidos, ['Mensaje 4', 'Mensaje 5', 'Mensaje 6'])
+        self.assertFalse(pagina['has_newer'])
+
+        while pagina['before']:
+            with self.assertNumQueries(3):
+                pagina = self.historial(conversacion, limit=3, before=pagina['before']).data
+            contenidos = [m['contenido'] for m in pagina['results']] + contenidos
+
+        self.assertEqual(contenidos, [f'Mensaje {i}' for i in range(7)])
+
+    def test_after_devuelve_los_mensajes_nuevos(self):
+        conversacion = self.crear_conversacion(mensajes=2)
+        cursor = self.historial(conversacion, limit=10).data['after']
+        Mensaje.objects.create(emisor=self.docente, receptor=conversacion.participante_2,
+                               conversacion=conversacion, contenido='Nuevo')
+
+        pagina = self.historial(conversacion, after=cursor).data
+
+        self.assertEqual([m['contenido'] for m in pagina['results']], ['Nuevo'])
+        self.assertEqual(self.historial(conversacion, after=pagina['after']).data['results'], [])
+
+    def test_sin_parametros_devuelve_el_historial_completo(self):
+        conversacion = self.crear_conversacion(mensajes=3)
+        self.assertEqual(len(self.historial(conversacion).data), 3)
+
+    def test_cursor_invalido(self):
+        conversacion = self.crear_conversacion()
+        response = self.historial(conversacion, before='xyz')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'details': 'Cursor inválido.'})
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class EnvioMasivoMensajesTests(ConversacionTestMixin, TestCase):
+    def enviar(self, receptores, imagen=None):
+        data = {'emisor': self.docente.id, 'contenido': 'Reunión el lunes',
+                'receptores': '.'.join(str(r.id) for r in receptores)}
+        if imagen:
+            data['imagen'] = imagen
+        request = APIRequestFactory().post('/', data, format='multipart')
+        force_authenticate(request, user=self.docente)
+        return MensajeView.as_view({'post': 'create'})(request)
+
+    def crear_imagen(self):
+        contenido = io.BytesIO()
+        Image.new('RGB', (2, 2)).save(contenido, format='PNG')
+        return SimpleUploadedFile('aviso.png', contenido.getvalue(), content_type='image/png')
+
+    def test_consultas_constantes_al_aumentar_receptores(self):
+        receptores = [self.crear_apoderado().usuario for _ in range(2)]
+        with self.assertNumQueries(10):
+            self.enviar(receptores, imagen=self.crear_imagen())
+
+        receptores = [self.crear_apoderado().usuario for _ in range(10)]
+        with self.assertNumQueries(10):
+            response = self.enviar(receptores, imagen=self.crear_imagen())
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(Conversacion.objects.count(), 12)
+
+    def test_imagen_compartida_se_guarda_una_vez(self):
+        receptores = [self.crear_apoderado().usuario for _ in range(3)]
+
+        response = self.enviar(receptores, imagen=self.crear_imagen())
+
+        nombres = set(Imagen.objects.values_list('imagen', flat=True))
+        self.assertEqual(len(nombres), 1)
+        self.assertEqual(len(response.data[0]['imagenes']), 1)
+
+    def test_actualiza_el_ultimo_mensaje_de_conversaciones_existentes(self):
+        conversacion = self.crear_conversacion(mensajes=2)
+
+        response = self.enviar([conversacion.participante_2])
+
+        conversacion.refresh_from_db()
+        self.assertEqual(conversacion.ultimo_mensaje_id, response.data[0]['id'])
+        self.assertEqual(Conversacion.objects.count(), 1)
+
+    def test_receptor_con_rol_invalido_no_envia_nada(self):
+        otro_docente = self.crear_docente(email='otro@colegio.pe').usuario
+
+        response = self.enviar([self.crear_apoderado().usuario, otro_docente])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Mensaje.objects.exists())
+
+    def test_imagen_se_borra_si_la_transaccion_falla(self):
+        receptores = [self.crear_apoderado().usuario for _ in range(2)]
+        carpeta = 'imagenes/mensajes/compartidas'
+        antes = default_storage.listdir(carpeta)[1] if default_storage.exists(carpeta) else []
+
+        with mock.patch.object(Conversacion.objects, 'bulk_update', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                Mensaje.enviar_a_varios(self.docente, receptores, 'Aviso', self.crear_imagen())
+
+        self.assertFalse(Imagen.objects.exists())
+        self.assertCountEqual(default_storage.listdir(carpeta)[1], antes)
+
+
+class BufferVistasTests(TestCase):
+    def setUp(self):
+        usuario = Usuario.objects.create_superuser(email='admin@colegio.pe')
+        administrador = Administrador.objects.create(
+            user=usuario, nombres='Carlos', apellidos='Paz')
+        self.noticias = [
+            Noticia.objects.create(titulo=f'Noticia {i}', descripcion='...',
+                                   administrador=administrador)
+            for i in range(3)]
+
+    def test_no_se_pierden_incrementos_concurrentes(self):
+        buffer = BufferVistas()
+        hilos_por_noticia, vistas_por_hilo = 4, 500
+
+        def visitar(noticia):
+            for _ in range(vistas_por_hilo):
+                buffer.incrementar(noticia.id)
+
+        hilos = [threading.Thread(target=visitar, args=(noticia,))
+                 for noticia in self.noticias for _ in range(hilos_por_noticia)]
+        for hilo in hilos:
+            hilo.start()
+        # Guardar mientras los hilos siguen incrementando
+        while any(hilo.is_alive() for hilo in hilos):
+            buffer.guardar()
+        for hilo in hilos:
+            hilo.join()
+        buffer.guardar()
+
+        for noticia in self.noticias:
+            noticia.refresh_from_db()
+            self.assertEqual(noticia.vistas, hilos_por_noticia * vistas_por_hilo)
+        self.assertEqual(buffer.pendientes(self.noticias[0].id), 0)
+
+    def test_guardar_agrupa_por_cantidad(self):
+        buffer = BufferVistas()
+        for noticia in self.noticias:
+            buffer.incrementar(noticia.id, cantidad=2)
+        buffer.incrementar(self.noticias[0].id)
+
+        with self.assertNumQueries(2):
+            buffer.guardar()
+        self.assertEqual(
+            sorted(Noticia.objects.values_list('vistas', flat=True)), [2, 2, 3])
+
+    def test_fallo_al_guardar_devuelve_todo_lo_pendiente(self):
+        buffer = BufferVistas()
+        buffer.incrementar(1)
+        buffer.incrementar(2, cantidad=2)
+
+        with mock.patch('django.db.models.query.QuerySet.update', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                buffer.guardar()
+
+        self.assertEqual({1: buffer.pendientes(1), 2: buffer.pendientes(2)}, {1: 1, 2: 2})
+
+
+class RegistroPresenciaTests(ColegioTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.docente = self.crear_docente().usuario
+        self.apoderado = Usuario.objects.create_apoderado(email='apoderado@colegio.pe')
+
+    def test_varios_sockets_cuentan_como_una_conexion(self):
+        presencia = RegistroPresencia()
+
+        self.assertTrue(presencia.conectar(self.docente.id, 'canal-1', 'online_aula_1'))
+        self.assertFalse(presencia.conectar(self.docente.id, 'canal-2', 'online_aula_1'))
+        self.assertTrue(presencia.conectar(self.docente.id, 'canal-3', 'online_aula_2'))
+        self.assertEqual(presencia.pendientes(), ({self.docente.id}, set()))
+        self.assertEqual(presencia.desconectar(self.docente.id, 'canal-1'), set())
+        self.assertEqual(presencia.desconectar(self.docente.id, 'canal-3'), set())
+        self.assertTrue(presencia.en_linea(self.docente.id))
+        self.assertEqual(presencia.desconectar(self.docente.id, 'canal-2'),
+                         {'online_aula_1', 'online_aula_2'})
+        self.assertFalse(presencia.en_linea(self.docente.id))
+
+    def test_salir_de_un_aula_notifica_solo_esa_aula(self):
+        presencia = RegistroPresencia()
+        presencia.conectar(self.docente.id, 'canal-1', 'online_aula_1')
+        presencia.conectar(self.docente.id, 'canal-1', 'online_aula_2')
+        presencia.conectar(self.docente.id, 'canal-2', 'online_aula_2')
+
+        self.assertEqual(presencia.salir(self.docente.id, 'canal-1', 'online_aula_2'), set())
+        self.assertEqual(presencia.salir(self.docente.id, 'canal-1', 'online_aula_1'), {'online_aula_1'})
+        self.assertTrue(presencia.en_linea(self.docente.id))
+        # Volver a entrar al aula avisa de nuevo
+        self.assertTrue(presencia.conectar(self.docente.id, 'canal-2', 'online_aula_1'))
+        self.assertEqual(presencia.salir(self.docente.id, 'canal-2', 'online_aula_2'), {'online_aula_2'})
+        # Su último grupo: queda desconectado
+        self.assertEqual(presencia.salir(self.docente.id, 'canal-2', 'online_aula_1'), {'online_aula_1'})
+        self.assertFalse(presencia.en_linea(self.docente.id))
+
+    def test_guardar_escribe_los_cambios_por_lote(self):
+        presencia = RegistroPresencia()
+        presencia.conectar(self.docente.id, 'canal-1', 'online_aula_1')
+        presencia.conectar(self.docente.id, 'canal-2', 'online_aula_1')
+        presencia.conectar(self.apoderado.id, 'canal-3', 'online_aula_1')
+        presencia.desconectar(self.apoderado.id, 'canal-3')
+
+        self.assertEqual(presencia.pendientes(), ({self.docente.id}, {self.apoderado.id}))
+        # Latido, sesiones, last_connection y sesiones cerradas
+        with self.assertNumQueries(4):
+            presencia.guardar_sync()
+        with self.assertNumQueries(0):
+            presencia.guardar_sync()
+
+        self.docente.refresh_from_db()
+        self.assertTrue(self.docente.is_online)
+        self.assertIsNotNone(self.docente.last_connection)
+        self.assertFalse(self.apoderado.is_online)
+
+        presencia.desconectar(self.docente.id, 'canal-1')
+        presencia.desconectar(self.docente.id, 'canal-2')
+        presencia.guardar_sync()
+        self.assertFalse(self.docente.is_online)
+        self.assertFalse(WorkerPresencia.objects.exists())
+
+    def test_cada_usuario_guarda_su_hora_de_conexion(self):
+        presencia = RegistroPresencia()
+        horas = [timezone.now() - timedelta(minutes=5), timezone.now()]
+        with mock.patch('django.utils.timezone.now', side_effect=horas):
+            presencia.conectar(self.docente.id, 'canal-1', 'online_aula_1')
+            presencia.conectar(self.apoderado.id, 'canal-2', 'online_aula_1')
+
+        presencia.guardar_sync()
+
+        self.docente.refresh_from_db()
+        self.apoderado.refresh_from_db()
+        self.assertEqual([self.docente.last_connection, self.apoderado.last_connection], horas)
+
+    def test_con_presencia_calcula_is_online_en_una_consulta(self):
+        presencia = RegistroPresencia()
+        presencia.conectar(self.docente.id, 'canal-1', 'online_aula_1')
+        presencia.guardar_sync()
+
+        with self.assertNumQueries(1):
+            estados = {usuario.id: usuario.is_online
+                       for usuario in Usuario.objects.con_presencia()}
+        self.assertEqual(estados, {self.docente.id: True, self.apoderado.id: False})
+        presencia.cerrar_sync()
+
+    def test_iniciar_un_worker_no_consulta_la_base_de_datos(self):
+        worker_1 = RegistroPresencia()
+        worker_1.conectar(self.docente.id, 'canal-1', 'online_aula_1')
+        worker_1.guardar_sync()
+
+        with self.assertNumQueries(0):
+            RegistroPresencia()
+        # Un worker nuevo no borra la presencia de los que siguen vivos
+        self.assertTrue(self.docente.is_online)
+
+    def test_conectados_considera_otros_procesos(self):
+        # Dos registros con la misma base de datos simulan dos workers
+        worker_1, worker_2 = RegistroPresencia(), RegistroPresencia()
+        worker_1.conectar(self.docente.id, 'canal-1', 'online_aula_1')
+        worker_2.conectar(self.docente.id, 'canal-2', 'online_aula_1')
+        worker_2.conectar(self.apoderado.id, 'canal-3', 'online_aula_1')
+        worker_2.guardar_sync()
+
+        ids = [self.docente.id, self.apoderado.id]
+        with self.assertNumQueries(1):
+            self.assertEqual(worker_1.conectados(ids), set(ids))
+        worker_2.desconectar(self.docente.id, 'canal-2')
+        worker_2.desconectar(self.apoderado.id, 'canal-3')
+        worker_2.guardar_sync()
+        self.assertEqual(worker_1.conectados(ids), {self.docente.id})
+
+    def test_sesiones_de_un_worker_caido_vencen(self):
+        caido, vivo = RegistroPresencia(), RegistroPresencia()
+        caido.conectar(self.apoderado.id, 'canal-1', 'online_aula_1')
+        caido.guardar_sync()
+        vivo.conectar(self.docente.id, 'canal-2', 'online_aula_1')
+        vivo.guardar_sync()
+        self.assertTrue(self.apoderado.is_online)
+
+        # El worker deja de latir sin cerrar sus sockets
+        WorkerPresencia.objects.filter(id=caido.worker_id).update(
+            ultimo_latido=timezone.now() - timedelta(minutes=5))
+        self.assertFalse(self.apoderado.is_online)
+
+        vivo.guardar_sync(latido=True)
+        self.assertFalse(SesionPresencia.objects.filter(worker_id=caido.worker_id).exists())
+        self.assertTrue(self.docente.is_online)
+
+
+class MiembrosAulaTests(ColegioTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.docente = self.crear_docente()
+        self.aula = self.crear_aula(1, docentes=[self.docente])
+        self.estudiante = self.crear_estudiante(self.aula, apoderados=2)
+
+    def test_miembros_se_cachean(self):
+        apoderados = {a.usuario_id for a in self.estudiante.apoderados.all()}
+        with self.assertNumQueries(2):
+            miembros = Aula.obtener_miembros(self.aula.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(Aula.obtener_miembros(self.aula.id), miembros)
+        self.assertEqual(miembros, {'docentes': {self.docente.usuario_id},
+                                    'apoderados': apoderados})
+
+    def test_cambios_invalidan_los_miembros(self):
+        Aula.obtener_miembros(self.aula.id)
+        otro_estudiante = self.crear_estudiante(self.crear_aula(2))
+        apoderado = otro_estudiante.apoderados.get()
+        self.assertNotIn(apoderado.usuario_id, Aula.obtener_miembros(self.aula.id)['apoderados'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            apoderado.estudiantes.add(self.estudiante)
+            # Antes del commit se siguen usando los miembros anteriores
+            self.assertNotIn(apoderado.usuario_id, Aula.obtener_miembros(self.aula.id)['apoderados'])
+        self.assertIn(apoderado.usuario_id, Aula.obtener_miembros(self.aula.id)['apoderados'])
+
+        otro_docente = self.crear_docente('otro@colegio.pe')
+        with self.captureOnCommitCallbacks(execute=True):
+            AulaCurso.objects.create(aula=self.aula, docente=otro_docente)
+        self.assertIn(otro_docente.usuario_id, Aula.obtener_miembros(self.aula.id)['docentes'])
+
+        self.estudiante.aula = otro_estudiante.aula
+        with self.captureOnCommitCallbacks(execute=True):
+            self.estudiante.save()
+        self.assertEqual(Aula.obtener_miembros(self.aula.id)['apoderados'], set())
+
+
+class DifusorPresenciaTests(TestCase):
+    def setUp(self):
+        self.difusor = DifusorPresencia(intervalo=60)
+
+    def test_agrupa_cambios_y_omite_reconexiones(self):
+        async def registrar():
+            self.difusor.registrar('online_aula_1', 1, True)
+            self.difusor.registrar('online_aula_1', 2, True)
+            # 3 estaba en línea, se desconecta y vuelve antes del envío
+            self.difusor.registrar('online_aula_1', 3, False)
+            self.difusor.registrar('online_aula_1', 3, True)
+            self.difusor.registrar('online_aula_1', 4, False)
+            self.difusor.registrar('online_aula_2', 1, True)
+            self.assertEqual(len(self.difusor._tareas), 2)
+            for tarea in self.difusor._tareas.values():
+                tarea.cancel()
+
+        async_to_sync(registrar)()
+
+        self.assertEqual(self.difusor.cambios_a_enviar('online_aula_1'), ([1, 2], [4]))
+        self.assertEqual(self.difusor.cambios_a_enviar('online_aula_1'), ([], []))
+
+    def test_lista_en_linea_se_consulta_una_vez_por_intervalo(self):
+        consultas = []
+
+        async def consultar():
+            consultas.append(1)
+            return [5]
+
+        async def pedir_listas():
+            self.difusor.registrar('online_aula_1', 5, True)
+            listas = [await self.difusor.usuarios_en_linea('online_aula_1', 'docente', consultar)
+                      for _ in range(10)]
+            # 5 se desconecta antes del envío, pero ya se mostró en línea
+            self.difusor.registrar('online_aula_1', 5, False)
+            for tarea in self.difusor._tareas.values():
+                tarea.cancel()
+            return listas
+
+        self.assertEqual(async_to_sync(pedir_listas)(), [[5]] * 10)
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(self.difusor.cambios_a_enviar('online_aula_1'), ([], [5]))
+
+
+class AutenticacionWebSocketTests(TestCase):
+    def setUp(self):
+        usuarios_ws.invalidar()
+        self.usuario = Usuario.objects.create_docente(email='docente@colegio.pe')
+        self.token = str(AccessToken.for_user(self.usuario))
+
+    def autenticar(self, token):
+        return async_to_sync(BHelperFunctions.authenticate_user)(token)
+
+    def test_token_desde_query_string(self):
+        self.assertEqual(token_desde_scope({'query_string': b'v=2&token=abc%3D'}), 'abc=')
+        self.assertIsNone(token_desde_scope({'query_string': b''}))
+
+    def test_reconexion_no_consulta_la_base_de_datos(self):
+        usuario = self.autenticar(self.token)
+        self.assertEqual((usuario.id, usuario.is_docente), (self.usuario.id, True))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.autenticar(self.token), usuario)
+
+    def test_cambios_del_usuario_invalidan_el_cache(self):
+        self.autenticar(self.token)
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertIsNone(self.autenticar(self.token))
+        self.assertIsNone(self.autenticar('token-invalido'))
+
+    def test_cache_descarta_el_token_usado_hace_mas_tiempo(self):
+        tokens = CacheUsuariosWS(ttl=60, limite=2)
+        usuarios = [UsuarioWS(i, True, False, False, True) for i in range(3)]
+        vencimiento = time.time() + 60
+        tokens.guardar('a', usuarios[0], vencimiento)
+        tokens.guardar('b', usuarios[1], vencimiento)
+        tokens.obtener('a')
+
+        tokens.guardar('c', usuarios[2], vencimiento)
+
+        self.assertEqual(len(tokens), 2)
+        self.assertIsNone(tokens.obtener('b'))
+        self.assertEqual(tokens.obtener('a'), usuarios[0])
+        tokens.invalidar(usuarios[0].id)
+        self.assertIsNone(tokens.obtener('a'))
+        self.assertEqual(len(tokens), 1)
+
+
+class SocketUsuarioTests(ConversacionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        usuarios_ws.invalidar()
+        # Guardar los cambios de presencia mientras exista la base de datos de prueba
+        self.addCleanup(presencia.guardar_sync)
+        docente = Docente.objects.get(usuario=self.docente)
+        self.aula = self.crear_aula(1, docentes=[docente])
+        self.conversacion = self.crear_conversacion(mensajes=0)
+        self.apoderado = self.conversacion.participante_2
+        self.apoderado.apoderado.estudiantes.add(self.crear_estudiante(self.aula, apoderados=0))
+        self.chat = f'chat_{self.docente.id}_{self.apoderado.id}'
+        self.online = f'online_aula_{self.aula.id}'
+
+    def ruta(self, usuario):
+        return f'/ws/usuario/?token={AccessToken.for_user(usuario)}'
+
+    @staticmethod
+    def conectar(ruta):
+        return WebsocketCommunicator(URLRouter(websocket_urlpatterns), ruta)
+
+    def test_un_socket_recibe_chats_y_aulas_etiquetados(self):
+        rutas = self.ruta(self.docente), self.ruta(self.apoderado)
+
+        async def probar():
+            docente, apoderado = map(self.conectar, rutas)
+            await docente.connect()
+            frames = [await docente.receive_json_from() for _ in range(3)]
+            await apoderado.connect()
+            for _ in range(3):
+                await apoderado.receive_json_from()
+            await apoderado.send_json_to({'action': 'send', 'canal': self.chat,
+                                          'type': 'chat_message', 'message': 'Hola'})
+            recibido = await docente.receive_json_from()
+            await docente.send_json_to({'action': 'unsubscribe', 'canal': self.chat})
+            desuscrito = await docente.receive_json_from()
+            # Al dejar su única aula deja de figurar en línea aunque el socket siga abierto
+            self.assertTrue(presencia.en_linea(self.docente.id))
+            await docente.send_json_to({'action': 'unsubscribe', 'canal': self.online})
+            await docente.receive_json_from()
+            self.assertFalse(presencia.en_linea(self.docente.id))
+            await docente.disconnect()
+            await apoderado.disconnect()
+            return frames, recibido, desuscrito
+
+        frames, recibido, desuscrito = async_to_sync(probar)()
+
+        self.assertEqual(
+            sorted((frame['canal'], frame['type']) for frame in frames),
+            sorted([(self.chat, 'subscribed'), (self.online, 'subscribed'), (self.online, self.online)]))
+        self.assertEqual(recibido, {'canal': self.chat, 'type': 'chat_message', 'message': 'Hola'})
+        self.assertEqual(desuscrito, {'canal': self.chat, 'type': 'unsubscribed'})
+
+    def test_no_permite_canales_ajenos(self):
+        ruta = self.ruta(self.docente)
+
+        async def probar():
+            comunicador = self.conectar(ruta)
+            await comunicador.connect()
+            for _ in range(3):
+                await comunicador.receive_json_from()
+            await comunicador.send_json_to({'action': 'subscribe', 'canal': 'chat_98_99'})
+            respuesta = await comunicador.receive_json_from()
+            await comunicador.disconnect()
+            return respuesta
+
+        self.assertEqual(async_to_sync(probar)(),
+                         {'canal': 'chat_98_99', 'type': 'error', 'detail': 'Canal no permitido.'})
+
+
+class MensajesPorWebSocketTests(ConversacionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        usuarios_ws.invalidar()
+        self.conversacion = self.crear_conversacion(mensajes=0)
+        self.apoderado = self.conversacion.participante_2
+
+    def test_cola_guarda_varios_mensajes_en_un_lote(self):
+        otro = self.crear_apoderado().usuario
+        cola = ColaMensajes(intervalo=0.01)
+
+        async def enviar():
+            return await asyncio.gather(
+                cola.guardar(self.docente.id, self.apoderado.id, 'Hola', True),
+                cola.guardar(self.apoderado.id, self.docente.id, 'Buenos días', False),
+                cola.guardar(self.docente.id, otro.id, 'Aviso', True))
+
+        # Savepoint, conversaciones (3 por la que falta), inserción y actualización
+        with self.assertNumQueries(7):
+            mensajes = async_to_sync(enviar)()
+
+        self.assertEqual([m.contenido for m in mensajes], ['Hola', 'Buenos días', 'Aviso'])
+        self.assertEqual(mensajes[0].conversacion_id, self.conversacion.id)
+        self.assertEqual(mensajes[1].conversacion_id, self.conversacion.id)
+        self.conversacion.refresh_from_db()
+        self.assertEqual(self.conversacion.ultimo_mensaje_id, mensajes[1].id)
+        self.assertEqual(Conversacion.objects.get(participante_2=otro).ultimo_mensaje_id,
+                         mensajes[2].id)
+
+    def test_chat_publica_provisional_y_confirma_con_el_id(self):
+        ruta = f'/ws/chat/{self.docente.id}-{self.apoderado.id}/?token={AccessToken.for_user(self.docente)}'
+
+        async def probar():
+            comunicador = WebsocketCommunicator(URLRouter(websocket_urlpatterns), ruta)
+            await comunicador.connect()
+            await comunicador.send_json_to({'type': 'no_existe', 'message': 'x'})
+            error = await comunicador.receive_json_from()
+            await comunicador.send_json_to({'type': 'chat_message', 'contenido': 'Hola',
+                                            'client_id': 'a1'})
+            provisional = await comunicador.receive_json_from()
+            confirmado = await comunicador.receive_json_from(2)
+            await comunicador.disconnect()
+            return error, provisional, confirmado
+
+        error, provisional, confirmado = async_to_sync(probar)()
+
+        self.assertEqual(error['type'], 'error')
+        self.assertEqual(provisional['type'], 'chat_message')
+        self.assertTrue(provisional['message']['provisional'])
+        self.assertEqual(provisional['message']['client_id'], 'a1')
+        mensaje = Mensaje.objects.get()
+        self.assertEqual(confirmado['type'], 'chat_persisted')
+        self.assertEqual(confirmado['provisional_id'], provisional['message']['id'])
+        self.assertEqual((confirmado['id'], mensaje.contenido), (mensaje.id, 'Hola'))
+        self.assertEqual(mensaje.receptor_id, self.apoderado.id)
+
+    def test_msgpack_se_negocia_con_subprotocolo(self):
+        ruta = f'/ws/chat/{self.docente.id}-{self.apoderado.id}/?token={AccessToken.for_user(self.docente)}'
+
+        async def probar():
+            comunicador = WebsocketCommunicator(URLRouter(websocket_urlpatterns), ruta,
+                                                subprotocols=['colegio.msgpack'])
+            _, subprotocolo = await comunicador.connect()
+            await comunicador.send_to(bytes_data=msgpack.packb(
+                {'type': 'chat_message', 'contenido': 'Hola'}))
+            provisional = await comunicador.receive_from()
+            confirmado = await comunicador.receive_from(2)
+            await comunicador.disconnect()
+            return subprotocolo, provisional, confirmado
+
+        subprotocolo, provisional, confirmado = async_to_sync(probar)()
+
+        self.assertEqual(subprotocolo, 'colegio.msgpack')
+        self.assertEqual(msgpack.unpackb(provisional)['message']['contenido'], 'Hola')
+        self.assertEqual(msgpack.unpackb(confirmado)['id'], Mensaje.objects.get().id)
+
+    def test_conectar_con_last_id_repite_los_mensajes_siguientes(self):
+        mensajes = [Mensaje.objects.create(emisor=self.docente, receptor=self.apoderado,
+                                           conversacion=self.conversacion, contenido=f'Mensaje {i}')
+                    for i in range(3)]
+        ruta = (f'/ws/chat/{self.apoderado.id}-{self.docente.id}/'
+                f'?token={AccessToken.for_user(self.apoderado)}&last_id={mensajes[0].id}')
+
+        async def probar():
+            comunicador = WebsocketCommunicator(URLRouter(websocket_urlpatterns), ruta)
+            await comunicador.connect()
+            historial = await comunicador.receive_json_from()
+            await comunicador.disconnect()
+            return historial
+
+        historial = async_to_sync(probar)()
+
+        self.assertEqual(historial['type'], 'history')
+        self.assertTrue(historial['completo'])
+        self.assertEqual([m['id'] for m in historial['messages']], [m.id for m in mensajes[1:]])
+
+    def test_chat_rechaza_a_quien_no_participa(self):
+        Mensaje.objects.create(emisor=self.docente, receptor=self.apoderado,
+                               conversacion=self.conversacion, contenido='Privado')
+        otro = self.crear_apoderado().usuario
+        ruta = (f'/ws/chat/{self.docente.id}-{self.apoderado.id}/'
+                f'?token={AccessToken.for_user(otro)}&last_id=0')
+
+        async def probar():
+            comunicador = WebsocketCommunicator(URLRouter(websocket_urlpatterns), ruta)
+            conectado, codigo = await comunicador.connect()
+            await comunicador.disconnect()
+            return conectado, codigo
+
+        self.assertEqual(async_to_sync(probar)(), (False, 4003))
+
+
+class HistorialChatTests(ConversacionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.conversacion = self.crear_conversacion(mensajes=5)
+        self.par = par_de_usuarios(self.docente.id, self.conversacion.participante_2_id)
+        self.ids = list(self.conversacion.mensajes.order_by('id').values_list('id', flat=True))
+        self.historial = HistorialChat(capacidad=3, max_conversaciones=1)
+
+    def enviar(self, contenido):
+        mensaje = Mensaje.objects.create(
+            emisor=self.docente, receptor=self.conversacion.participante_2,
+            conversacion=self.conversacion, contenido=contenido)
+        self.historial.registrar([mensaje])
+        return mensaje
+
+    def test_reconexion_reciente_no_consulta_la_base_de_datos(self):
+        self.historial.mensajes_despues(self.par, self.ids[-1])
+        nuevo = self.enviar('Nuevo')
+
+        with self.assertNumQueries(0):
+            mensajes, completo = self.historial.mensajes_despues(self.par, self.ids[-2])
+        self.assertEqual([m['id'] for m in mensajes], [self.ids[-1], nuevo.id])
+        self.assertTrue(completo)
+
+    def test_brecha_mayor_al_buffer_consulta_la_base_de_datos(self):
+        self.historial.mensajes_despues(self.par, self.ids[-1])
+
+        with self.assertNumQueries(2):
+            mensajes, completo = self.historial.mensajes_despues(self.par, self.ids[0])
+        self.assertEqual([m['id'] for m in mensajes], self.ids[1:])
+        self.assertTrue(completo)
+
+    def test_mensajes_de_otro_proceso_recargan_la_conversacion(self):
+        self.historial.mensajes_despues(self.par, self.ids[-1])
+        # Otro worker guarda un mensaje: solo cambia la versión compartida
+        otro = Mensaje.objects.create(
+            emisor=self.docente, receptor=self.conversacion.participante_2,
+            conversacion=self.conversacion, contenido='Desde otro worker')
+        HistorialChat().registrar([otro])
+
+        mensajes, _ = self.historial.mensajes_despues(self.par, self.ids[-1])
+        self.assertEqual([m['id'] for m in mensajes], [otro.id])
+
+    def test_limita_la_cantidad_de_conversaciones(self):
+        self.historial.mensajes_despues(self.par, 0)
+        otra = self.crear_conversacion(mensajes=1)
+        self.historial.mensajes_despues(par_de_usuarios(self.docente.id, otra.participante_2_id), 0)
+        self.assertEqual(list(self.historial._conversaciones), [
+            par_de_usuarios(self.docente.id, otra.participante_2_id)])
+
+
+class PruebaCargaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        usuarios_ws.invalidar()
+        self.addCleanup(presencia.guardar_sync)
+
+    def test_conecta_entrega_y_guarda_todos_los_mensajes(self):
+        docentes, apoderados = preparar_datos(usuarios=6, aulas=2)
+        reporte = async_to_sync(PruebaCarga(docentes, apoderados, mensajes=2, espera=5).ejecutar)()
+
+        self.assertEqual(reporte['sockets'], {'usuario': 2, 'online': 6, 'chat': 6})
+        self.assertEqual(reporte['mensajes_esperados'], 12)
+        self.assertEqual(len(reporte['latencias_entrega']), 12)
+        self.assertEqual(len(reporte['latencias_guardado']), 12)
+        self.assertEqual(Mensaje.objects.filter(emisor_id=apoderados[0]['usuario_id']).count(), 2)
+
+    def test_percentil(self):
+        self.assertEqual(percentil([], 50), 0.0)
+        self.assertEqual(percentil([3, 1, 2, 5, 4], 50), 3)
+        self.assertEqual(percentil(range(1, 101), 99), 99)
+
+
+class CatalogoCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vista = GeneroView.as_view({'get': 'list'})
+
+    def listar(self, etag=None, ruta='/generos/', **headers):
+        if etag:
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        return self.vista(APIRequestFactory().get(ruta, **headers))
+
+    def test_responde_304_sin_consultar_la_base_de_datos(self):
+        etag = self.listar()['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.listar(etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.assertNumQueries(0):
+            response = self.listar('"otro"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), Genero.objects.count())
+
+    def test_guardar_invalida_el_etag(self):
+        etag = self.listar()['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Genero.objects.create(nombre='Otro')
+            # Antes del commit se sigue respondiendo con la versión anterior
+            self.assertEqual(self.listar(etag).status_code, 304)
+        self.assertEqual(len(callbacks), 1)
+
+        response = self.listar(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Otro', [genero['nombre'] for genero in response.data])
+
+    def test_parametros_irrelevantes_comparten_la_entrada(self):
+        etag = self.listar()['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.listar(etag, ruta='/generos/?_=123')
+        self.assertEqual(response.status_code, 304)
+
+    def test_con_jwt_solo_consulta_el_usuario(self):
+        usuario = Usuario.objects.create_apoderado(email='apoderado@colegio.pe')
+        autorizacion = f'Bearer {AccessToken.for_user(usuario)}'
+        etag = self.listar()['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.listar(etag, HTTP_AUTHORIZATION=autorizacion)
+        self.assertEqual(response.status_code, 304)
+
+
+class RegistroReferenciaTests(TestCase):
+    def setUp(self):
+        registro.precargar(*MODELOS_CATALOGO)
+
+    def test_consultas_por_nombre_e_id_sin_base_de_datos(self):
+        falto = EstadoAsistencia.objects.get(nombre='Falto')
+        curso = Curso.objects.select_related('nivel').first()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(registro.id_por_nombre(EstadoAsistencia, 'Falto'), falto.id)
+            self.assertEqual(registro.id_por_nombre(Curso, curso.nombre, curso.nivel_id), curso.id)
+            self.assertEqual(str(registro.obtener(Curso, curso.id)), str(curso))
+            self.assertIsNone(registro.id_por_nombre(Genero, 'No existe'))
+
+    def test_guardar_invalida_el_registro(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            genero = Genero.objects.create(nombre='No binario')
+        self.assertEqual(registro.id_por_nombre(Genero, 'No binario'), genero.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            genero.delete()
+        self.assertIsNone(registro.id_por_nombre(Genero, 'No binario'))
+
+    def test_verifica_la_version_una_vez_por_intervalo(self):
+        local = RegistroReferencia(intervalo=60)
+        local.precargar(Genero)
+        # Un cambio hecho en otro proceso solo incrementa la versión compartida
+        cache_utils.invalidar(Genero)
+
+        with mock.patch.object(cache_utils, 'obtener_version') as obtener_version:
+            local.todos(Genero)
+        obtener_version.assert_not_called()
+
+        local.intervalo = 0
+        with self.assertNumQueries(1):
+            local.todos(Genero)
+
+    def test_id_inexistente_recarga_una_vez_por_version(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(registro.obtener(Genero, 0))
+            self.assertIsNone(registro.obtener(Genero, 0))
+            self.assertIsNone(registro.obtener(Genero, -1))
+
+
+class CapaCanalesMultiprocesoTests(TestCase):
+    def setUp(self):
+        self.url, detener = iniciar_en_hilo()
+        self.addCleanup(detener)
+
+    def test_group_send_llega_a_todas_las_instancias(self):
+        async def probar():
+            # Dos capas independientes simulan dos workers de daphne
+            capas = [RedisPubSubChannelLayer(hosts=[self.url]) for _ in range(2)]
+            canales = [await capa.new_channel() for capa in capas]
+            for capa, canal in zip(capas, canales):
+                await capa.group_add('online_aula_1', canal)
+            await asyncio.sleep(0.1)
+
+            await capas[0].group_send('online_aula_1', {'type': 'user_connected', 'user_id': 7})
+            recibidos = [await asyncio.wait_for(capa.receive(canal), 2)
+                         for capa, canal in zip(capas, canales)]
+            for capa in capas:
+                await capa.flush()
+            return recibidos
+
+        recibidos = async_to_sync(probar)()
+
+        self.assertEqual([m['user_id'] for m in recibidos], [7, 7])
@@ -2,14 +2,18 @@ from django.shortcuts import render
 from django.contrib.auth import authenticate
 from django.contrib.auth.hashers import make_password
 # from django.core.exceptions import ValidationError
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets, generics, status, serializers
 from rest_framework.permissions import AllowAny
 from rest_framework.views import APIView
 from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.decorators import action
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser, AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -18,44 +22,50 @@ from .permissions import ReadOnlyForAll, ReadOnlyForDocente, ReadOnlyForApoderad
 from .serializer import (ApoderadoSerializer, ApoderadoRegisterSerializer, DocenteSerializer, DocenteRegisterSerializer, EstudianteSerializer, AulaSerializer, TareaSerializer, CalificacionSerializer, MensajeSerializer, MensajeCrearSerializer, ConversacionSerializer, ImagenSerializer, NoticiaSerializer,
                          CategoriaNoticiaSerializer, NivelEducativoSerializer, GeneroSerializer, CursoSerializer, EstadoAsistenciaSerializer, EstadoTareaSerializer)
 from .models import (Noticia, Apoderado, Estudiante, Docente, Administrador, Mensaje,
-                     Aula, Tarea, AulaCurso, Asistencia, Calificacion, Usuario, Conversacion, Imagen)
+                     Aula, Tarea, AulaCurso, Asistencia, Calificacion, Usuario, Conversacion, Imagen,
+                     ResumenAsistenciaAula, ResumenAsistenciaEstudiante)
 from .models_extra import (NivelEducativo, Curso,
                            EstadoAsistencia, EstadoTarea, CategoriaNoticia, Genero)
+from .analitica import calcular_estadisticas
+from .cache import CatalogoCacheMixin
 from .helper_functions import BHelperFunctions as helper
-from .constants import TOTAL_APODERADOS_POR_ESTUDIANTE as total_apoderados
+from .pagination import KeysetPagination
+from .registro import registro
+from .roster import construir_roster_docente, construir_familia_apoderado
+from .constants import ESTADOS_PRESENTE, TOTAL_APODERADOS_POR_ESTUDIANTE as total_apoderados
 
 
-class CategoriaView(viewsets.ModelViewSet):
+class CategoriaView(CatalogoCacheMixin, viewsets.ModelViewSet):
     permission_classes = (ReadOnlyForAll,)
     serializer_class = CategoriaNoticiaSerializer
     queryset = CategoriaNoticia.objects.all()
 
 
-class GeneroView(viewsets.ModelViewSet):
+class GeneroView(CatalogoCacheMixin, viewsets.ModelViewSet):
     permission_classes = (ReadOnlyForAll,)
     serializer_class = GeneroSerializer
     queryset = Genero.objects.all()
 
 
-class NivelView(viewsets.ModelViewSet):
+class NivelView(CatalogoCacheMixin, viewsets.ModelViewSet):
     permission_classes = (ReadOnlyForAll,)
     serializer_class = NivelEducativoSerializer
     queryset = NivelEducativo.objects.all()
 
 
-class CursoView(viewsets.ModelViewSet):
+class CursoView(CatalogoCacheMixin, viewsets.ModelViewSet):
     permission_classes = (ReadOnlyForAll,)
     serializer_class = CursoSerializer
     queryset = Curso.objects.all()
 
 
-class EstadoAsistenciaView(viewsets.ModelViewSet):
+class EstadoAsistenciaView(CatalogoCacheMixin, viewsets.ModelViewSet):
     permission_classes = (ReadOnlyForAll,)
     serializer_class = EstadoAsistenciaSerializer
     queryset = EstadoAsistencia.objects.all()
 
 
-class EstadoTareaView(viewsets.ModelViewSet):
+class EstadoTareaView(CatalogoCacheMixin, viewsets.ModelViewSet):
     permission_classes = (ReadOnlyForAll,)
     serializer_class = EstadoTareaSerializer
     queryset = EstadoTarea.objects.all()
@@ -74,9 +84,10 @@ class NoticiaView(viewsets.ModelViewSet):
         # if usuario.is_authenticated and (usuario.is_apoderado or usuario.is_docente):
         noticia.incrementar_vistas(usuario)
 
-        # Serializar y devolver la noticia
-        serializer = self.get_serializer(noticia)
-        return Response(serializer.data)
+        # Serializar y devolver la noticia, incluyendo las vistas aún no guardadas
+        data = self.get_serializer(noticia).data
+        data['vistas'] = noticia.obtener_vistas()
+        return Response(data)
 
 
 class ApoderadoView(viewsets.ModelViewSet):
@@ -200,6 +211,17 @@ class TareaView(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+def _leer_fecha(valor):
+    """Convierte un parámetro 'AAAA-MM-DD' en fecha, o None si no se envió.
+    Lanza ValueError si no es una fecha válida."""
+    if not valor:
+        return None
+    fecha = parse_date(valor)
+    if fecha is None:
+        raise ValueError(valor)
+    return fecha
+
+
 class AsistenciaViewSet(viewsets.ViewSet):
     permission_classes = (DocenteAdminPermission,)
 
@@ -209,56 +231,78 @@ class AsistenciaViewSet(viewsets.ViewSet):
         # Obtener la fecha actual
         fecha_actual = timezone.now().date()
 
-        # Obtener los estudiantes del aula
-        estudiantes = Estudiante.objects.filter(aula_id=aula_id)
-
-        # Obtener el estado 'Falta' de la asistencia
-        # estado_falta, _ = EstadoAsistencia.objects.get_or_create(nombre='Falta')
-
         if request.method == 'GET':
-            # Crear las asistencias si no existen
+            # Crear en bloque las asistencias que no existan
+            try:
+                hoja = Asistencia.obtener_hoja_del_dia(aula_id, fecha_actual)
+            except IntegrityError as error:
+                return Response({"details": str(error)}, status=status.HTTP_409_CONFLICT)
             asistencias = []
-            for estudiante in estudiantes:
-                asistencia, created = Asistencia.objects.get_or_create(
-                    estudiante=estudiante,
-                    fecha=fecha_actual
-                )
+            for estudiante, asistencia in hoja:
                 asistencias.append({
                     'id': asistencia.id,
                     'estudiante_id': estudiante.id,
                     'fecha': asistencia.fecha,
                     'nombres': estudiante.nombres,
                     'apellidos': estudiante.apellidos,
-                    'genero': estudiante.genero.id,
-                    'estado': asistencia.estado.id,
+                    'genero': estudiante.genero_id,
+                    'estado': asistencia.estado_id,
                 })
             return Response(asistencias, status=status.HTTP_200_OK)
 
         elif request.method == 'PATCH':
-            # Actualizar las asistencias
-            data = request.data  # Lista de asistencias a actualizar
-            for asistencia_data in data:
-                try:
-                    asistencia = Asistencia.objects.get(
-                        id=asistencia_data['id'])
-                    # Obtener el nuevo estado desde los datos proporcionados
-                    estado_id = asistencia_data.get('estado', None)
-                    if estado_id:
-                        try:
-                            # Buscar el estado por nombre en la base de datos
-                            nuevo_estado = EstadoAsistencia.objects.get(
-                                id=estado_id)
-                            asistencia.estado = nuevo_estado  # Asignar el nuevo estado
-                        except EstadoAsistencia.DoesNotExist:
-                            return Response(
-                                {"details": f"No existe el estado con id '{
-                                    estado_id}'."},
-                                status=status.HTTP_400_BAD_REQUEST
-                            )
-                    asistencia.save()
-                except Asistencia.DoesNotExist:
-                    return Response({"details": "Asistencia no encontrada."}, status=status.HTTP_404_NOT_FOUND)
-            return Response({"message": "Asistencias actualizadas correctamente."}, status=status.HTTP_200_OK)
+            # Lista de asistencias a actualizar
+            data = request.data
+            if not isinstance(data, list) or not all(isinstance(fila, dict) for fila in data):
+                return Response({"details": "Se esperaba una lista de asistencias."}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Todas las filas se validan antes de guardar; si alguna falla no se guarda ninguna
+            resultados, valido = Asistencia.actualizar_estados(int(aula_id), data)
+            if not valido:
+                return Response({"details": "No se actualizó ninguna asistencia.", "resultados": resultados}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"message": "Asistencias actualizadas correctamente.", "resultados": resultados}, status=status.HTTP_200_OK)
+
+
+    @action(detail=False, methods=['get'])
+    def resumen(self, request):
+        """Cantidad de asistencias por estado, por día de un aula o por mes de un
+        estudiante, leída de los resúmenes (ver ResumenAsistencia)."""
+        aula_id = request.query_params.get('aula')
+        estudiante_id = request.query_params.get('estudiante')
+        if not (aula_id or estudiante_id) or (aula_id and estudiante_id):
+            return Response({"details": "Se necesita el id del aula o del estudiante."}, status=status.HTTP_400_BAD_REQUEST)
+        if not (aula_id or estudiante_id).isdigit():
+            return Response({"details": "El id debe ser un número."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            desde = _leer_fecha(request.query_params.get('desde'))
+            hasta = _leer_fecha(request.query_params.get('hasta'))
+        except ValueError:
+            return Response({"details": "Las fechas deben tener el formato AAAA-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if aula_id:
+            modelo, filtros, campo = ResumenAsistenciaAula, {'aula_id': int(aula_id)}, 'fecha'
+        else:
+            modelo, filtros, campo = ResumenAsistenciaEstudiante, {'estudiante_id': int(estudiante_id)}, 'mes'
+            # Los meses se guardan con su primer día
+            desde = desde.replace(day=1) if desde else None
+        if desde:
+            filtros[f'{campo}__gte'] = desde
+        if hasta:
+            filtros[f'{campo}__lte'] = hasta
+
+        presentes = {registro.id_por_nombre(EstadoAsistencia, nombre) for nombre in ESTADOS_PRESENTE}
+        filas = []
+        for dia, estados in modelo.totales(**filtros).items():
+            total = sum(estados.values())
+            filas.append({
+                campo: dia,
+                'estados': estados,
+                'total': total,
+                'tasa_asistencia': round(sum(cantidad for estado_id, cantidad in estados.items()
+                                             if estado_id in presentes) / total, 4),
+            })
+        return Response(filas, status=status.HTTP_200_OK)
 
 
 class CalificacionView(viewsets.ModelViewSet):
@@ -272,6 +316,9 @@ class CalificacionView(viewsets.ModelViewSet):
 
         if not curso_id or not estudiante_id:
             return Response({"details": "El id del curso y del estudiante son necesarios."}, status=400)
+        if not curso_id.isdigit() or not estudiante_id.isdigit():
+            return Response({"details": "El id del curso y del estudiante deben ser números."}, status=status.HTTP_400_BAD_REQUEST)
+        curso_id, estudiante_id = int(curso_id), int(estudiante_id)
 
         try:
             # Intentar obtener la calificación existente
@@ -279,23 +326,76 @@ class CalificacionView(viewsets.ModelViewSet):
                 curso_id=curso_id, estudiante_id=estudiante_id)
         except Calificacion.DoesNotExist:
             # Si no existe la calificación, crear una nueva
-            estudiante = Estudiante.objects.get(id=estudiante_id)
-            curso = Curso.objects.get(id=curso_id)
+            estudiante = get_object_or_404(Estudiante, id=estudiante_id)
+            if registro.obtener(Curso, curso_id) is None:
+                raise NotFound("Curso no encontrado.")
 
-            calificacion = Calificacion.objects.create(
-                curso=curso,
-                estudiante=estudiante,
-            )
+            try:
+                calificacion = Calificacion.crear_sin_ingresar(estudiante, curso_id)
+            except DjangoValidationError as error:
+                return Response({"details": error.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
 
         # Serializar y devolver la calificación existente o la recién creada
         serializer = CalificacionSerializer(calificacion)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def estadisticas(self, request):
+        """Media, mediana, desviación, histograma, aprobados y ranking de los
+        promedios filtrados por aula, curso y/o grado."""
+        filtros = {}
+        for parametro in ('aula', 'curso', 'grado'):
+            valor = request.query_params.get(parametro)
+            if valor is None:
+                continue
+            if not valor.isdigit():
+                return Response({"details": f"El parámetro '{parametro}' debe ser un id."}, status=status.HTTP_400_BAD_REQUEST)
+            filtros[f'{parametro}_id'] = int(valor)
+        if not filtros:
+            return Response({"details": "Se necesita el id del aula, del curso o del grado."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(calcular_estadisticas(**filtros), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get', 'patch'],
+            url_path=r'aula/(?P<aula_id>\d+)/curso/(?P<curso_id>\d+)')
+    def libreta(self, request, aula_id=None, curso_id=None):
+        """Calificaciones de un curso para todos los estudiantes de un aula."""
+        aula_id, curso_id = int(aula_id), int(curso_id)
+        try:
+            Calificacion.validar_curso_de_aula(aula_id, curso_id)
+        except DjangoValidationError as error:
+            return Response({"details": error.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.method == 'GET':
+            # Crear en bloque las calificaciones que no existan
+            libreta = Calificacion.obtener_libreta(aula_id, curso_id)
+            calificaciones = CalificacionSerializer(
+                [calificacion for _, calificacion in libreta], many=True).data
+            filas = [{
+                **calificacion,
+                'estudiante_id': estudiante.id,
+                'nombres': estudiante.nombres,
+                'apellidos': estudiante.apellidos,
+            } for (estudiante, _), calificacion in zip(libreta, calificaciones)]
+            return Response(filas, status=status.HTTP_200_OK)
+
+        elif request.method == 'PATCH':
+            # Lista de celdas modificadas por estudiante
+            data = request.data
+            if not isinstance(data, list) or not all(isinstance(fila, dict) for fila in data):
+                return Response({"details": "Se esperaba una lista de calificaciones."}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Todas las filas se validan antes de guardar; si alguna falla no se guarda ninguna
+            resultados, valido = Calificacion.actualizar_notas(aula_id, curso_id, data)
+            if not valido:
+                return Response({"details": "No se actualizó ninguna calificación.", "resultados": resultados}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"message": "Calificaciones actualizadas correctamente.", "resultados": resultados}, status=status.HTTP_200_OK)
+
 
 class ConversacionView(viewsets.ModelViewSet):
     permission_classes = (DocenteApoderadoPermission,)
     serializer_class = ConversacionSerializer
     queryset = Conversacion.objects.all()
+    pagination_class = LimitOffsetPagination
 
     def retrieve(self, request, *args, **kwargs):
         """Obtiene o crea una conversación entre los participantes."""
@@ -341,15 +441,19 @@ class ConversacionView(viewsets.ModelViewSet):
         # Obtener el usuario autenticado
         usuario = request.user
 
-        # Filtrar las conversaciones donde el usuario sea participante
+        # Conversaciones del usuario ordenadas por la actividad más reciente,
+        # junto con su último mensaje y sus imágenes
         conversaciones = Conversacion.objects.filter(
             Q(participante_1=usuario) | Q(participante_2=usuario)
-        )
+        ).select_related('ultimo_mensaje').prefetch_related(
+            'ultimo_mensaje__imagenes').order_by('-ultima_actividad', '-id')
+
+        # Paginación opcional con ?limit=&offset=
+        pagina = self.paginate_queryset(conversaciones)
 
         resultado = []
-        for conversacion in conversaciones:
-            # Obtener el mensaje más reciente
-            mensaje_reciente = conversacion.obtener_mensaje_reciente()
+        for conversacion in (pagina if pagina is not None else conversaciones):
+            mensaje_reciente = conversacion.ultimo_mensaje
             if mensaje_reciente:
                 mensaje_serializado = MensajeSerializer(mensaje_reciente).data
             else:
@@ -360,11 +464,18 @@ class ConversacionView(viewsets.ModelViewSet):
                 'conversacion': ConversacionSerializer(conversacion).data,
                 'mensaje_reciente': mensaje_serializado
             })
+
+        if pagina is not None:
+            return self.get_paginated_response(resultado)
         return Response(resultado)
 
     @action(detail=True, methods=['get'])
     def mensajes(self, request, pk=None):
-        """Obtener los mensajes de una conversación, si el usuario pertenece a ella"""
+        """Obtener los mensajes de una conversación, si el usuario pertenece a ella.
+
+        Con los parámetros `limit`, `before` y `after` la respuesta se pagina por
+        llave; sin ellos se devuelve el historial completo.
+        """
         # Obtener la conversación
         conversacion = get_object_or_404(Conversacion, pk=pk)
 
@@ -372,11 +483,16 @@ class ConversacionView(viewsets.ModelViewSet):
         usuario = request.user
 
         # Comprobar si el usuario es parte de la conversación
-        if usuario != conversacion.participante_1 and usuario != conversacion.participante_2:
+        if usuario.id not in (conversacion.participante_1_id, conversacion.participante_2_id):
             return Response({"details": "No tienes permiso para ver los mensajes de esta conversación."}, status=status.HTTP_403_FORBIDDEN)
 
-        # Obtener los mensajes de la conversación
-        mensajes = conversacion.obtener_mensajes()
+        # Obtener los mensajes de la conversación con sus imágenes
+        mensajes = conversacion.obtener_mensajes().prefetch_related('imagenes')
+
+        paginador = KeysetPagination()
+        pagina = paginador.paginate_queryset(mensajes, request, view=self)
+        if pagina is not None:
+            return paginador.get_paginated_response(MensajeSerializer(pagina, many=True).data)
 
         # Serializar los mensajes
         mensajes_serializer = MensajeSerializer(mensajes, many=True)
@@ -391,56 +507,40 @@ class MensajeView(viewsets.ModelViewSet):
 
     def create(self, request, *args, **kwargs):
         emisor_id = request.data.get('emisor')
-        receptores_ids = [int(i)
-                          for i in request.data.get('receptores').split(".")]
+        receptores = request.data.get('receptores')
         contenido = request.data.get('contenido')
 
-        if not emisor_id or not receptores_ids or not contenido:
+        if not emisor_id or not receptores or not contenido:
             return Response({"details": "Emisor, receptores y contenido necesarios."}, status=400)
 
         try:
-            emisor = Usuario.objects.get(id=emisor_id)
-        except Usuario.DoesNotExist:
+            emisor_id = int(emisor_id)
+            # Sin duplicados y conservando el orden recibido
+            receptores_ids = list(dict.fromkeys(
+                int(i) for i in str(receptores).split(".")))
+        except ValueError:
+            return Response({"details": "IDs de emisor o receptores inválidos."}, status=400)
+
+        # Emisor y receptores en una sola consulta
+        usuarios = Usuario.objects.in_bulk([emisor_id, *receptores_ids])
+        emisor = usuarios.get(emisor_id)
+        if emisor is None:
             return Response({"details": "Usuario no encontrado."}, status=404)
 
-        mensajes_enviados = []
-
+        receptores = []
         for receptor_id in receptores_ids:
-            try:
-                receptor = Usuario.objects.get(id=receptor_id)
-            except Usuario.DoesNotExist:
+            receptor = usuarios.get(receptor_id)
+            if receptor is None:
                 return Response({"details": f"Receptor {receptor_id} no encontrado."}, status=404)
 
             if not ((emisor.is_apoderado and receptor.is_docente) or
                     (emisor.is_docente and receptor.is_apoderado)):
                 return Response({"details": "El mensaje debe ser entre un apoderado y un docente."}, status=400)
+            receptores.append(receptor)
 
-            # Verificar si existe una conversación, crearla si no
-            conversacion, creada = Conversacion.objects.get_or_create(
-                participante_1=emisor if emisor.is_docente else receptor,
-                participante_2=receptor if receptor.is_apoderado else emisor,
-                # defaults={'ultima_actualizacion': timezone.now()}
-            )
-
-            # Crea el mensaje
-            mensaje = Mensaje.objects.create(
-                emisor=emisor,
-                receptor=receptor,
-                conversacion=conversacion,
-                contenido=request.data.get('contenido')
-            )
-
-            # Verifica si hay una imagen en la solicitud
-            if 'imagen' in request.FILES:
-                imagen_file = request.FILES['imagen']
-                # Crea una instancia de Imagen asociada al mensaje
-                Imagen.objects.create(mensaje=mensaje, imagen=imagen_file)
-
-            # Recarga el mensaje desde la base de datos para incluir las imágenes recién asociadas
-            mensaje.refresh_from_db()
-
-            # Agregar el mensaje a la lista de mensajes enviados
-            mensajes_enviados.append(mensaje)
+        # Conversaciones, mensajes e imagen compartida se crean en bloque
+        mensajes_enviados = Mensaje.enviar_a_varios(
+            emisor, receptores, contenido, imagen=request.FILES.get('imagen'))
 
         # Serializar todos los mensajes enviados y devolverlos
         serializer = MensajeSerializer(mensajes_enviados, many=True)
@@ -457,103 +557,23 @@ class AulasPorDocenteView(viewsets.ViewSet):
     permission_classes = (ReadOnlyForDocente,)
 
     def retrieve(self, request, pk=None):
-        docente_id = pk
-        aulas = AulaCurso.obtener_aulas_por_docente(docente_id=docente_id)
-        if not aulas:
+        # Aulas, estudiantes y apoderados se cargan en un número fijo de consultas
+        resultado = construir_roster_docente(docente_id=pk)
+        if not resultado:
             return Response({'details': 'Docente no encontrado'}, status=status.HTTP_404_NOT_FOUND)
 
-        resultado = []
-
-        for aula in aulas:
-            # Obtener los estudiantes del aula
-            estudiantes = Estudiante.objects.filter(aula=aula)
-            estudiantes_data = []
-
-            apoderados_id = set()
-
-            for estudiante in estudiantes:
-                # Obtener los apoderados del estudiante
-                apoderados = Apoderado.obtener_apoderados_por_estudiante(
-                    estudiante.id)
-                apoderados_data = []
-
-                for apoderado in apoderados:
-                    if apoderado.usuario.id not in apoderados_id:
-                        apoderados_id.add(apoderado.usuario.id)
-                    apoderado_data = {
-                        'usuario_id': apoderado.usuario.id,
-                        'nombres': apoderado.nombres,
-                        'apellidos': apoderado.apellidos,
-                        'email': apoderado.usuario.email,
-                    }
-                    apoderados_data.append(apoderado_data)
-
-                # Añadir la información del estudiante junto con sus apoderados
-                estudiantes_data.append({
-                    'id': estudiante.id,
-                    'nombres': estudiante.nombres,
-                    'apellidos': estudiante.apellidos,
-                    'genero': estudiante.genero.id,
-                    'apoderados': apoderados_data,
-                })
-            # Contar el número de apoderados por estudiante
-            total_apoderados = len(apoderados_id)
-
-            # Agregar la información del aula con estudiantes y la cantidad de apoderados
-            resultado.append({
-                'id': aula.id,
-                'nombre': aula.nombre,
-                'grado': str(aula.grado),
-                'seccion': aula.seccion.nombre,
-                'estudiantes': estudiantes_data,
-                'apoderados': total_apoderados,
-            })
-
-        return Response(resultado)  # Response({'resultado': resultado})
+        return Response(resultado)
 
 
 class EstudiantesPorApoderadoView(viewsets.ViewSet):
     permission_classes = (ReadOnlyForApoderado,)
 
     def retrieve(self, request, pk=None):
-        apoderado_id = pk
-        estudiantes = Estudiante.obtener_estudiantes_por_apoderado(
-            apoderado_id=apoderado_id)
-        if not estudiantes:
+        # Las aulas y sus docentes se comparten entre hermanos de la misma aula
+        resultado = construir_familia_apoderado(apoderado_id=pk)
+        if not resultado:
             return Response({'details': 'Apoderado no encontrado'}, status=status.HTTP_404_NOT_FOUND)
 
-        resultado = []
-        for estudiante in estudiantes:
-            # Obtener la información del aula
-            aula = estudiante.aula
-            # Serializar la información del aula
-            aula_info = AulaSerializer(aula).data
-
-            # Obtener los docentes asociados al aula del estudiante
-            aula_cursos = AulaCurso.objects.filter(aula=estudiante.aula)
-            docentes_info = []
-            for aula_curso in aula_cursos:
-                docente = aula_curso.docente
-                docentes_info.append({
-                    'usuario_id': docente.usuario.id,
-                    'nombres': docente.nombres,
-                    'apellidos': docente.apellidos,
-                    'email': docente.usuario.email,
-                    'curso': docente.curso.id if docente.curso else None,
-                })
-
-            # Construir la respuesta para cada estudiante
-            estudiante_info = {
-                'id': estudiante.id,
-                'nombres': estudiante.nombres,
-                'apellidos': estudiante.apellidos,
-                'genero': estudiante.genero.id,
-                'aula': aula_info,
-                'docentes': docentes_info,  # Lista de docentes
-            }
-
-            resultado.append(estudiante_info)
-
         return Response(resultado, status=status.HTTP_200_OK)
 
 
@@ -670,9 +690,9 @@ class LoginView(generics.GenericAPIView):
                         'apellidos': docente.apellidos,
                         'telefono': docente.telefono,
                         'direccion': docente.direccion,
-                        'genero': docente.genero.nombre if docente.genero else None,
+                        'genero': registro.obtener(Genero, docente.genero_id).nombre if docente.genero_id else None,
                         'fecha_nacimiento': docente.fecha_nacimiento,
-                        'curso': CursoSerializer(docente.curso).data
+                        'curso': CursoSerializer(registro.obtener(Curso, docente.curso_id)).data
                     })
                 except Docente.DoesNotExist:
                     pass  # Si no existe el Docente, no hacer nada
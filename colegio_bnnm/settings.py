@@ -44,7 +44,6 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
-    'api.middlewares.SetUsersOfflineMiddleware',
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True  # Cambiar en producción
@@ -154,12 +153,72 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# Segundos que se reutiliza un token ya validado al reconectar un WebSocket
+WS_USUARIO_CACHE_TTL = 60
+
+# Los mensajes de chat recibidos por WebSocket se guardan por lotes: segundos
+# que se espera para juntar un lote y cantidad máxima de mensajes por lote
+CHAT_ESCRITURA_INTERVALO = 0.02
+CHAT_ESCRITURA_LOTE = 200
+
+# Mensajes recientes por conversación (y conversaciones) que se guardan en
+# memoria para repetirlos al reconectar un chat con ?last_id=
+CHAT_HISTORIAL_MENSAJES = 50
+CHAT_HISTORIAL_CONVERSACIONES = 1000
+
 # Configuración de canal de WebSocket
+# CHANNEL_LAYER=memory solo funciona con un proceso de daphne. Para varios
+# workers usar CHANNEL_LAYER=redis (pub/sub) o redis-core con REDIS_URL
+CHANNEL_LAYER = os.environ.get('CHANNEL_LAYER', 'memory')
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0')
+
+CHANNEL_LAYER_BACKENDS = {
+    'memory': 'channels.layers.InMemoryChannelLayer',
+    'redis': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+    'redis-core': 'channels_redis.core.RedisChannelLayer',
+}
+
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        'BACKEND': CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER],
     },
 }
+if CHANNEL_LAYER != 'memory':
+    CHANNEL_LAYERS['default']['CONFIG'] = {'hosts': [REDIS_URL]}
+
+# Cache de catálogos (ETag) y versiones de datos de referencia. Con varios
+# procesos debe ser un cache compartido (por ejemplo Redis) para que las
+# invalidaciones lleguen a todos los procesos
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Segundos que se guarda cada respuesta de catálogo (y su ETag) en el cache
+CATALOGO_CACHE_TTL = 3600
+
+# Segundos durante los que el registro de referencia en memoria (registro.py)
+# no vuelve a consultar la versión de un catálogo en el cache compartido
+REGISTRO_VERIFICACION_INTERVALO = 1.0
+
+# Segundos máximos que se guardan los miembros (docentes y apoderados) de un aula
+MIEMBROS_AULA_CACHE_TTL = 300
+
+# Segundos máximos que se guardan las estadísticas de calificaciones
+ANALITICA_CACHE_TTL = 300
+
+# Segundos entre cada guardado de las vistas acumuladas de las noticias
+NOTICIA_VISTAS_INTERVALO = 10
+
+# Segundos que se acumulan los cambios de conexión antes de guardarlos
+PRESENCIA_INTERVALO = 1.0
+# Segundos entre cada latido de un worker con sockets abiertos, y segundos sin
+# latido tras los cuales sus usuarios dejan de figurar en línea (worker caído)
+PRESENCIA_LATIDO = 15.0
+PRESENCIA_VIGENCIA = 45
+# Segundos que se agrupan los avisos de conexión de cada aula en un solo mensaje
+PRESENCIA_DIFUSION_INTERVALO = 0.5
 
 WHITENOISE_USE_FINDERS = True
 # WHITENOISE_AUTOREFRESH = True  # Solo en desarrollo